@@ -0,0 +1,214 @@
+"""
+Local stand-in for the IRIS Atelier REST API, for exercising
+generate-xml-export.py --push without an IRIS instance.
+
+Usage:
+    python atelier-stub.py [--port 52773] [--latency MS] [--compile-latency MS]
+                           [--fail CLASS ...]
+
+Serves the endpoints the push uses, over HTTP/1.1 keep-alive:
+
+    GET  /api/atelier/                          server info
+    GET  /api/atelier/v1/{ns}/doc/{name}        a stored document
+    PUT  /api/atelier/v1/{ns}/doc/{name}        store a document
+    POST /api/atelier/v1/{ns}/action/compile    "compile" a list of documents
+
+Documents are kept in memory per namespace. A compile fails for a document
+that was never stored, whose content is empty or does not start with a
+Class declaration, and for every class named with --fail. --latency and
+--compile-latency add a fixed delay per request, roughly like a remote
+server, so the effect of --push-jobs shows up in the timings.
+
+Requests without an Authorization header get 401. The first reply on each
+connection sets a CSPSESSIONID cookie, the way IRIS does. Ctrl+C prints
+how many connections and requests were served.
+"""
+
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+DOC_PATH = re.compile(r"^/api/atelier/v1/([^/]+)/doc/(.+)$")
+COMPILE_PATH = re.compile(r"^/api/atelier/v1/([^/]+)/action/compile$")
+CLASS_DECL = re.compile(r"^\s*Class\s+([%\w.]+)", re.MULTILINE)
+
+# Pending connections the listener queues; the default of 5 is less than
+# the default --push-jobs, so connects beyond it wait for a SYN retransmit
+LISTEN_BACKLOG = 128
+
+
+class StubState:
+    def __init__(self, latency: float, compile_latency: float, fail: set):
+        self.latency = latency
+        self.compile_latency = compile_latency
+        self.fail = fail
+        self.docs = {}
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = 0
+        self.compiles = 0
+
+
+class AtelierStubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = LISTEN_BACKLOG
+
+
+class AtelierStubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "AtelierStub/1.0"
+    # Headers and body are separate writes; with Nagle on, the body waits
+    # for the client's delayed ACK on a keep-alive connection (~40 ms)
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.session = None
+        with self.state.lock:
+            self.state.connections += 1
+
+    @property
+    def state(self) -> StubState:
+        return self.server.state
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, status: int, result=None, errors=(), console=()):
+        body = json.dumps({
+            "status": {"errors": [{"error": error} for error in errors],
+                       "summary": "; ".join(errors)},
+            "console": list(console),
+            "result": result if result is not None else {},
+        }).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        if self.session is None:
+            self.session = f"stub{id(self):x}"
+            self.send_header("Set-Cookie", f"CSPSESSIONID={self.session}; path=/; httponly")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        data = self.rfile.read(length) if length else b""
+        return json.loads(data) if data else None
+
+    def handle_request(self, method: str):
+        url = urlsplit(self.path)
+        with self.state.lock:
+            self.state.requests += 1
+        body = self.read_json() if method in ("PUT", "POST") else None
+        if not self.headers.get("Authorization"):
+            self.reply(401, errors=["authentication required"])
+            return
+        if self.state.latency:
+            time.sleep(self.state.latency)
+
+        if method == "GET" and url.path.rstrip("/") == "/api/atelier":
+            self.reply(200, {"content": {"version": "AtelierStub", "api": 1,
+                                         "namespaces": sorted(self.state.docs) or ["USER"]}})
+            return
+        match = DOC_PATH.match(url.path)
+        if match:
+            namespace, name = unquote(match.group(1)).upper(), unquote(match.group(2))
+            if method == "PUT":
+                content = (body or {}).get("content")
+                if not isinstance(content, list):
+                    self.reply(400, errors=[f"{name}: content must be a list of lines"])
+                    return
+                with self.state.lock:
+                    docs = self.state.docs.setdefault(namespace, {})
+                    created = name not in docs
+                    docs[name] = content
+                self.reply(201 if created else 200,
+                           {"name": name, "db": namespace, "ts": time.strftime("%Y-%m-%d %H:%M:%S"),
+                            "cat": "CLS", "status": "", "enc": False, "flags": 0, "content": []})
+                return
+            if method == "GET":
+                content = self.state.docs.get(namespace, {}).get(name)
+                if content is None:
+                    self.reply(404, errors=[f"{name}: document does not exist"])
+                else:
+                    self.reply(200, {"name": name, "db": namespace, "cat": "CLS",
+                                     "enc": False, "content": content})
+                return
+        match = COMPILE_PATH.match(url.path)
+        if match and method == "POST":
+            self.compile(unquote(match.group(1)).upper(), body or [],
+                         parse_qs(url.query).get("flags", ["cuk"])[0])
+            return
+        self.reply(404, errors=[f"{method} {url.path}: not found"])
+
+    def compile(self, namespace: str, names: list, flags: str):
+        if self.state.compile_latency:
+            time.sleep(self.state.compile_latency)
+        with self.state.lock:
+            self.state.compiles += 1
+        docs = self.state.docs.get(namespace, {})
+        errors = []
+        console = ["", f"Compilation started with qualifiers '{flags}'"]
+        for name in names:
+            class_name = name[:-len(".cls")] if name.endswith(".cls") else name
+            content = docs.get(name)
+            if content is None:
+                errors.append(f"ERROR #5351: Class '{class_name}' does not exist")
+            elif class_name in self.state.fail:
+                errors.append(f"ERROR #5475: Error compiling routine: {class_name}.1. "
+                              f"Errors: {class_name}.cls(stub) : forced failure")
+            elif CLASS_DECL.search("\n".join(content)) is None:
+                errors.append(f"ERROR #5559: The class definition for class '{class_name}' "
+                              f"could not be parsed correctly")
+            else:
+                console.append(f"Compiling class {class_name}")
+        console.append("Detected %d errors during compilation" % len(errors) if errors
+                       else "Compilation finished successfully")
+        self.reply(200, {"content": []}, errors=errors, console=console)
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_PUT(self):
+        self.handle_request("PUT")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a local stub of the IRIS Atelier REST API.")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=52773, help="port to listen on (default 52773)")
+    parser.add_argument("--latency", type=float, default=0.0, metavar="MS",
+                        help="delay every request by MS milliseconds")
+    parser.add_argument("--compile-latency", type=float, default=0.0, metavar="MS",
+                        help="extra delay for each compile request")
+    parser.add_argument("--fail", action="append", default=[], metavar="CLASS",
+                        help="report a compile error for CLASS (repeatable)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    server = AtelierStubServer((args.host, args.port), AtelierStubHandler)
+    server.state = StubState(args.latency / 1000, args.compile_latency / 1000, set(args.fail))
+    host, port = server.server_address[:2]
+    print(f"Atelier stub on http://{host}:{port} (Ctrl+C to stop)", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    state = server.state
+    print(f"\nServed {state.requests} request(s) on {state.connections} connection(s), "
+          f"{state.compiles} compile(s)")
+
+
+if __name__ == "__main__":
+    main()
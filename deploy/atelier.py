@@ -0,0 +1,189 @@
+"""
+Minimal client for the IRIS Atelier REST API (/api/atelier/v1).
+
+Used by generate-xml-export.py --push to upload changed classes straight
+into a namespace and compile them, instead of copying an export to the
+server and loading it by hand:
+
+    client = AtelierClient("http://localhost:52773", "USER", "_SYSTEM", "SYS", jobs=8)
+    try:
+        results = push_classes(client, [("AIAgent.Util.JSON", source), ...])
+    finally:
+        client.close()
+
+Uploads run on a small thread pool. Each thread keeps one keep-alive
+connection (and the CSP session cookie IRIS hands out) for the whole
+push, so a deploy costs one TCP and login handshake per thread rather
+than per class. Only the standard library is used.
+
+atelier-stub.py serves the same endpoints locally for trying this out
+without an IRIS instance.
+"""
+
+import base64
+import http.client
+import json
+import re
+import threading
+import time
+from urllib.parse import quote, urlsplit
+
+API_PREFIX = "/api/atelier/v1"
+
+# Raised by a keep-alive connection the server has already closed; the
+# request is retried once on a fresh connection.
+STALE_CONNECTION = (http.client.RemoteDisconnected, http.client.CannotSendRequest,
+                    BrokenPipeError, ConnectionResetError)
+
+
+class AtelierError(Exception):
+    """A request failed at the HTTP level or the server reported errors."""
+
+
+class AtelierClient:
+    """Atelier API calls for one namespace over pooled keep-alive connections."""
+
+    def __init__(self, url: str, namespace: str, user: str, password: str,
+                 jobs: int = 8, timeout: float = 60.0):
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise ValueError(f"expected an http(s)://host[:port] URL, got {url!r}")
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.base = parts.path.rstrip("/")
+        self.namespace = namespace
+        self.jobs = max(1, jobs)
+        self.timeout = timeout
+        token = base64.b64encode(f"{user}:{password}".encode("utf-8")).decode("ascii")
+        self.auth = f"Basic {token}"
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+
+    def connection(self) -> http.client.HTTPConnection:
+        """This thread's connection, opened on first use."""
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            factory = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+            conn = factory(self.host, self.port, timeout=self.timeout)
+            self.local.conn = conn
+            self.local.cookie = None
+            with self.lock:
+                self.connections.append(conn)
+        return conn
+
+    def request(self, method: str, path: str, body=None) -> tuple:
+        """Send one API request; returns (HTTP status, decoded JSON reply)."""
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        for attempt in (1, 2):
+            conn = self.connection()
+            headers = {"Authorization": self.auth, "Accept": "application/json"}
+            if data is not None:
+                headers["Content-Type"] = "application/json; charset=utf-8"
+            if self.local.cookie:
+                headers["Cookie"] = self.local.cookie
+            try:
+                conn.request(method, self.base + path, body=data, headers=headers)
+                response = conn.getresponse()
+                payload = response.read()
+            except STALE_CONNECTION:
+                conn.close()
+                self.local.conn = None
+                if attempt == 2:
+                    raise
+                continue
+            cookie = response.getheader("Set-Cookie")
+            if cookie:
+                self.local.cookie = cookie.split(";", 1)[0]
+            try:
+                reply = json.loads(payload) if payload else {}
+            except ValueError:
+                reply = {}
+            if response.status in (401, 403):
+                raise AtelierError(f"{method} {path}: HTTP {response.status} (check user and password)")
+            return response.status, reply
+
+    def doc_path(self, doc_name: str) -> str:
+        return f"{API_PREFIX}/{quote(self.namespace)}/doc/{quote(doc_name)}"
+
+    def put_doc(self, doc_name: str, source: str) -> None:
+        """Save a document (e.g. Pkg.Name.cls) as UDL, overwriting the server copy."""
+        status, reply = self.request("PUT", self.doc_path(doc_name) + "?ignoreConflict=1",
+                                     {"enc": False, "content": source.splitlines()})
+        errors = reply_errors(reply)
+        if status >= 400 or errors:
+            raise AtelierError("; ".join(errors) or f"HTTP {status}")
+
+    def compile(self, doc_names: list, flags: str = "cuk") -> tuple:
+        """Compile documents in one request; returns (errors, console lines)."""
+        path = f"{API_PREFIX}/{quote(self.namespace)}/action/compile?flags={quote(flags)}"
+        status, reply = self.request("POST", path, doc_names)
+        errors = reply_errors(reply)
+        if status >= 400 and not errors:
+            errors = [f"HTTP {status}"]
+        return errors, reply.get("console", [])
+
+    def close(self) -> None:
+        with self.lock:
+            for conn in self.connections:
+                conn.close()
+            self.connections.clear()
+
+
+def reply_errors(reply: dict) -> list:
+    """Error texts from an Atelier reply's status block."""
+    errors = (reply.get("status") or {}).get("errors") or []
+    return [e.get("error", str(e)) if isinstance(e, dict) else str(e) for e in errors]
+
+
+def mentions(text: str, class_name: str) -> bool:
+    """Whether a compiler message names class_name (as Pkg.Name, Pkg.Name.cls
+    or one of its Pkg.Name.N routines) rather than a longer class name."""
+    pattern = rf"(?<![\w.%]){re.escape(class_name)}(?:\.cls|\.\d+)?(?!\.?\w)"
+    return re.search(pattern, text) is not None
+
+
+def push_classes(client: AtelierClient, classes: list, compile_flags: str = "cuk") -> list:
+    """Upload classes concurrently, then compile all uploaded ones at once.
+
+    classes is a list of (class name, UDL source), ideally in compile
+    order. Returns one result per class, in the same order:
+    {"name", "uploaded", "compiled", "error", "seconds"}. A compile error
+    is charged to every class it names; one that names none of them is
+    charged to all.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    results = [{"name": name, "uploaded": False, "compiled": False, "error": None,
+                "seconds": 0.0} for name, _ in classes]
+
+    def upload(result, source):
+        start = time.perf_counter()
+        try:
+            client.put_doc(result["name"] + ".cls", source)
+            result["uploaded"] = True
+        except (AtelierError, OSError, http.client.HTTPException) as e:
+            result["error"] = f"upload: {e}"
+        result["seconds"] = time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=client.jobs) as pool:
+        list(pool.map(upload, results, [source for _, source in classes]))
+
+    uploaded = [result for result in results if result["uploaded"]]
+    if not uploaded:
+        return results
+    try:
+        errors, _ = client.compile([result["name"] + ".cls" for result in uploaded], compile_flags)
+    except (AtelierError, OSError, http.client.HTTPException) as e:
+        errors = [str(e)]
+    named = {result["name"]: [error for error in errors if mentions(error, result["name"])]
+             for result in uploaded}
+    unattributed = [error for error in errors if not any(error in own for own in named.values())]
+    for result in uploaded:
+        own = named[result["name"]] + unattributed
+        if own:
+            result["error"] = "compile: " + "; ".join(own)
+        else:
+            result["compiled"] = True
+    return results
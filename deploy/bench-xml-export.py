@@ -0,0 +1,326 @@
+"""
+Benchmark the UDL parser in iris_export.py (the engine of generate-xml-export.py).
+
+Reports parse throughput (MB/s of UDL source) for the largest classes under
+cls/, best of several timed rounds per class.
+
+--suite instead generates synthetic namespaces at several scales (100 to
+20,000 classes by default, with methods up to 10,000 lines and large
+JavaScript XData blocks like Chat.cls) and times parse_udl_class,
+class_to_xml, udl_formalspec_to_xml and a full generator run (cold and
+with a warm cache) on each. Results, including the generator's peak RSS,
+are written to a JSON file; pass an earlier results file to --compare to
+see the change between commits.
+
+Usage:
+    python bench-xml-export.py [--top N] [--seconds S] [files ...]
+    python bench-xml-export.py --suite [--scales 100,1000] [--results FILE] [--compare OLD]
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+CLS_DIR = SCRIPT_DIR.parent / "cls"
+GENERATOR = SCRIPT_DIR / "generate-xml-export.py"
+LIBRARY = SCRIPT_DIR / "iris_export.py"
+DEFAULT_SCALES = "100,1000,5000,20000"
+
+
+def best_time(func, arg, seconds: float) -> float:
+    """Best single-call time of func(arg) over roughly `seconds` of rounds."""
+    best = float("inf")
+    deadline = time.perf_counter() + seconds
+    while True:
+        start = time.perf_counter()
+        func(arg)
+        elapsed = time.perf_counter() - start
+        best = min(best, elapsed)
+        if start + elapsed >= deadline:
+            return best
+
+
+# Synthetic corpus
+
+JS_LINES = [
+    "    function render(items) {",
+    "        const out = items.map(i => `<li>${i.name}</li>`).join('');",
+    "        if (/[{}]/.test(out)) { console.warn('brace in output'); }",
+    "        return { html: out, count: items.length };",
+    "    }",
+]
+
+
+def synthetic_method(rng: random.Random, index: int, lines: int) -> list:
+    spec = ", ".join(
+        [f"pArg{i} As %String = \"\"" for i in range(rng.randint(0, 3))]
+        + (["Output pResult As %DynamicObject"] if rng.random() < 0.3 else [])
+        + (["ByRef pCount As %Integer = 0"] if rng.random() < 0.2 else []))
+    keyword = "ClassMethod" if rng.random() < 0.7 else "Method"
+    out = ["/// Synthetic method.", f"{keyword} Run{index}({spec}) As %Status", "{",
+           "    set tSC = $$$OK"]
+    for i in range(max(lines - 3, 0)):
+        pick = i % 6
+        if pick == 0:
+            out.append(f"    set obj = {{\"key\": \"v{i}\", \"n\": {i}}}")
+        elif pick == 1:
+            out.append(f"    if (x > {i}) {{ set y = \"{{not a brace}}\" }}")
+        elif pick == 2:
+            out.append(f"    // comment with {{ unbalanced brace {i}")
+        elif pick == 3:
+            out.append(f"    do ##class(%SYSTEM.OBJ).Load(\"file{i}.xml\", \"ck\")")
+        elif pick == 4:
+            out.append(f"    for k=1:1:{i} {{ set total = total + k }}")
+        else:
+            out.append(f"    set msg = \"line {i} with \"\"quotes\"\" and {{braces}}\"")
+    out += ["    quit tSC", "}"]
+    return out
+
+
+def synthetic_class(rng: random.Random, number: int, count: int) -> tuple:
+    """(class name, UDL source) for class `number` of a `count`-class corpus."""
+    package = f"Bench.P{number // 100}"
+    name = f"{package}.C{number}"
+    lines = ["/// Synthetic benchmark class.", "/// ", f"/// Number {number} of {count}."]
+    if number and rng.random() < 0.3:
+        lines.append(f"Class {name} Extends Bench.P{(number - 1) // 100}.C{number - 1}")
+    else:
+        lines.append(f"Class {name} Extends %Persistent")
+    lines += ["{", "", f'Parameter VERSION = "{number}";', ""]
+    for i in range(rng.randint(1, 8)):
+        lines += [f"/// Property {i}.",
+                  f"Property Field{i} As %String(MAXLEN = {rng.choice([64, 256, 4000])})"
+                  + (" [ Required ];" if i == 0 else ";"), ""]
+    lines += ["Index Field0Idx On Field0;", ""]
+
+    # Mostly small methods, an occasional very long one
+    for i in range(rng.randint(2, 12)):
+        if rng.random() < 0.001:
+            size = 10000
+        else:
+            size = int(rng.expovariate(1 / 30)) + 3
+        lines += synthetic_method(rng, i, size)
+        lines.append("")
+    if number:
+        lines += ["ClassMethod Peer() As %String", "{",
+                  f"    quit ##class(Bench.P{(number // 2) // 100}.C{number // 2}).%ClassName(1)",
+                  "}", ""]
+
+    if rng.random() < 0.005:
+        lines += ['XData Script [ MimeType = "application/javascript" ]', "{"]
+        for _ in range(800):
+            lines += JS_LINES
+        lines += ["}", ""]
+    lines.append("}")
+    return name, "\n".join(lines) + "\n"
+
+
+def make_corpus(cls_dir: Path, count: int, seed: int = 1) -> int:
+    """Write a synthetic count-class namespace under cls_dir; returns total bytes."""
+    rng = random.Random(seed)
+    total = 0
+    for number in range(count):
+        name, source = synthetic_class(rng, number, count)
+        path = cls_dir / (name.replace(".", "/") + ".cls")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = source.encode("utf-8")
+        path.write_bytes(data)
+        total += len(data)
+    return total
+
+
+# Measurements
+
+def measure_stages(gen, cls_dir: Path) -> dict:
+    """Time parse, render and FormalSpec conversion over every class in cls_dir."""
+    parse_time = render_time = 0.0
+    total_bytes = 0
+    specs = []
+    for path in sorted(cls_dir.rglob("*.cls")):
+        source = path.read_text(encoding="utf-8")
+        total_bytes += len(source.encode("utf-8"))
+        start = time.perf_counter()
+        cls_data = gen.parse_udl_class(source)
+        parse_time += time.perf_counter() - start
+        start = time.perf_counter()
+        gen.class_to_xml(cls_data)
+        render_time += time.perf_counter() - start
+        specs.extend(m["formal_spec"] for m in cls_data["methods"] if m["formal_spec"])
+
+    start = time.perf_counter()
+    for spec in specs:
+        gen.udl_formalspec_to_xml(spec)
+    spec_time = time.perf_counter() - start
+
+    return {
+        "bytes": total_bytes,
+        "parse": {"seconds": parse_time, "mb_per_s": total_bytes / parse_time / 1e6},
+        "render": {"seconds": render_time, "mb_per_s": total_bytes / render_time / 1e6},
+        "formalspec": {"calls": len(specs), "seconds": spec_time,
+                       "us_per_call": spec_time / len(specs) * 1e6 if specs else 0.0},
+    }
+
+
+def run_generator(deploy_dir: Path, args: list) -> dict:
+    """Run the generator copy in deploy_dir; wall time and peak RSS (MB, POSIX only)."""
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, str(deploy_dir / GENERATOR.name)] + args,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if hasattr(os, "wait4"):
+        _, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        # ru_maxrss is KiB on Linux, bytes on macOS
+        peak = usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    else:
+        proc.wait()
+        peak = None
+    elapsed = time.perf_counter() - start
+    if proc.returncode:
+        raise RuntimeError(f"generator failed: {proc.stderr.read().decode(errors='replace')}")
+    proc.stderr.close()
+    return {"seconds": elapsed, "peak_rss_mb": peak}
+
+
+def bench_scale(gen, count: int, seed: int) -> dict:
+    with tempfile.TemporaryDirectory(prefix="bench-xml-export-") as tmp:
+        root = Path(tmp)
+        deploy_dir = root / "deploy"
+        deploy_dir.mkdir()
+        shutil.copy2(GENERATOR, deploy_dir / GENERATOR.name)
+        shutil.copy2(LIBRARY, deploy_dir / LIBRARY.name)
+        make_corpus(root / "cls", count, seed)
+
+        result = {"classes": count}
+        result.update(measure_stages(gen, root / "cls"))
+        cold = run_generator(deploy_dir, ["--no-cache"])
+        run_generator(deploy_dir, [])  # fill the cache
+        warm = run_generator(deploy_dir, [])
+        result["end_to_end"] = {
+            "cold_seconds": cold["seconds"],
+            "warm_seconds": warm["seconds"],
+            "mb_per_s": result["bytes"] / cold["seconds"] / 1e6,
+            "peak_rss_mb": cold["peak_rss_mb"],
+        }
+        return result
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=SCRIPT_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def print_result(result: dict) -> None:
+    e2e = result["end_to_end"]
+    rss = f"{e2e['peak_rss_mb']:.0f}" if e2e["peak_rss_mb"] is not None else "-"
+    print(f"{result['classes']:>7} {result['bytes'] / 1e6:>8.1f} "
+          f"{result['parse']['mb_per_s']:>8.1f} {result['render']['mb_per_s']:>8.1f} "
+          f"{result['formalspec']['us_per_call']:>8.2f} "
+          f"{e2e['cold_seconds']:>8.2f} {e2e['warm_seconds']:>8.2f} {rss:>8}")
+
+
+def compare(old: dict, new: dict) -> None:
+    """Print the change in the headline numbers per scale between two result files."""
+    old_by_scale = {r["classes"]: r for r in old["results"]}
+    print()
+    print(f"Compared with {old.get('commit') or 'previous run'} (positive = faster / smaller):")
+    print(f"{'Classes':>7} {'Parse':>8} {'Render':>8} {'Spec':>8} {'Cold':>8} {'Warm':>8} {'RSS':>8}")
+    for result in new["results"]:
+        before = old_by_scale.get(result["classes"])
+        if before is None:
+            continue
+
+        def change(path, higher_is_better):
+            a, b = before, result
+            for key in path:
+                a, b = a[key], b[key]
+            if not a or not b:
+                return f"{'-':>8}"
+            ratio = b / a if higher_is_better else a / b
+            return f"{(ratio - 1) * 100:>+7.1f}%"
+
+        print(f"{result['classes']:>7} {change(('parse', 'mb_per_s'), True)} "
+              f"{change(('render', 'mb_per_s'), True)} "
+              f"{change(('formalspec', 'us_per_call'), False)} "
+              f"{change(('end_to_end', 'cold_seconds'), False)} "
+              f"{change(('end_to_end', 'warm_seconds'), False)} "
+              f"{change(('end_to_end', 'peak_rss_mb'), False)}")
+
+
+def run_suite(gen, scales: list, seed: int, results_file: Path, compare_file) -> None:
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": seed,
+        "results": [],
+    }
+    print(f"{'Classes':>7} {'MB':>8} {'Parse':>8} {'Render':>8} {'Spec us':>8} "
+          f"{'Cold s':>8} {'Warm s':>8} {'RSS MB':>8}")
+    for count in scales:
+        result = bench_scale(gen, count, seed)
+        report["results"].append(result)
+        print_result(result)
+
+    results_file.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+    print(f"\nResults: {results_file}")
+    if compare_file is not None:
+        compare(json.loads(compare_file.read_text(encoding="utf-8")), report)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark UDL parse throughput.")
+    parser.add_argument("files", nargs="*", type=Path,
+                        help="UDL .cls files to parse (default: largest under cls/)")
+    parser.add_argument("--top", type=int, default=5,
+                        help="number of largest classes to benchmark (default 5)")
+    parser.add_argument("--seconds", type=float, default=1.0,
+                        help="timing budget per class (default 1.0)")
+    parser.add_argument("--suite", action="store_true",
+                        help="run the synthetic-corpus suite instead of timing cls/ files")
+    parser.add_argument("--scales", default=DEFAULT_SCALES,
+                        help=f"comma-separated corpus sizes for --suite (default {DEFAULT_SCALES})")
+    parser.add_argument("--seed", type=int, default=1,
+                        help="random seed for the synthetic corpora (default 1)")
+    parser.add_argument("--results", type=Path, default=SCRIPT_DIR / "bench-results.json",
+                        help="JSON file to write --suite results to (default deploy/bench-results.json)")
+    parser.add_argument("--compare", type=Path, metavar="OLD",
+                        help="earlier --suite results file to compare against")
+    args = parser.parse_args(argv)
+
+    import iris_export as gen
+    if args.suite:
+        scales = [int(s) for s in args.scales.split(",") if s.strip()]
+        run_suite(gen, scales, args.seed, args.results, args.compare)
+        return
+
+    files = args.files or sorted(CLS_DIR.rglob("*.cls"), key=lambda p: -p.stat().st_size)[:args.top]
+
+    print(f"{'Class file':<32} {'Bytes':>9} {'Parse ms':>9} {'MB/s':>8}")
+    total_bytes = 0
+    total_time = 0.0
+    for path in files:
+        source = path.read_text(encoding="utf-8")
+        size = len(source.encode("utf-8"))
+        elapsed = best_time(gen.parse_udl_class, source, args.seconds)
+        total_bytes += size
+        total_time += elapsed
+        print(f"{path.name:<32} {size:>9} {elapsed * 1000:>9.2f} {size / elapsed / 1e6:>8.1f}")
+    if total_time:
+        print(f"{'Total':<32} {total_bytes:>9} {total_time * 1000:>9.2f} {total_bytes / total_time / 1e6:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""
+Local stand-in for the Node.js bridge chat API, for exercising
+e2e-load.py without AI runners or an IRIS instance.
+
+Usage:
+    python bridge-stub.py [--port 3100] [--latency MS] [--jitter SIGMA] [--slots N]
+                          [--error-rate P] [--cases FILE] [--seed N]
+
+Serves the endpoints the load driver uses, over HTTP/1.1 keep-alive:
+
+    POST /api/chat      answer one chat message like Orchestrator.processMessage
+    GET  /api/health    liveness and the counters below
+
+A message that is the query of a case in tests/realworld-e2e-cases.json
+(or --cases FILE) is answered the way that case expects: its first action
+target, approval flag and one of the phrases the response must include.
+Anything else gets a generic answer with no actions.
+
+Each reply is delayed like a runner call: a log-normal draw around
+--latency MS with spread --jitter (0 = always exactly MS). --slots N lets
+only N messages "run" at once, the way a runner's concurrency limit
+does, so queueing shows up in the driver's percentiles when it sends
+more than that. --error-rate P fails that fraction of messages with 500.
+Ctrl+C prints how many requests were served and the peak concurrency.
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+CASES_FILE = SCRIPT_DIR.parent / "tests" / "realworld-e2e-cases.json"
+
+# Pending connections the listener queues; the default of 5 drops SYNs as
+# soon as the driver opens more connections at once, and the retransmit
+# shows up as a one-second outlier
+LISTEN_BACKLOG = 128
+
+
+class StubState:
+    def __init__(self, latency: float, jitter: float, slots: int, error_rate: float,
+                 answers: dict, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.slots = threading.BoundedSemaphore(slots) if slots > 0 else None
+        self.error_rate = error_rate
+        self.answers = answers
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = 0
+        self.failures = 0
+        self.active = 0
+        self.peak = 0
+
+    def delay(self) -> float:
+        with self.lock:
+            if not self.jitter:
+                return self.latency
+            return self.latency * self.random.lognormvariate(0.0, self.jitter)
+
+    def fails(self) -> bool:
+        with self.lock:
+            return self.random.random() < self.error_rate
+
+
+def load_answers(cases_file: Path) -> dict:
+    """{query: chat reply} for every case in a realworld-e2e cases file."""
+    if not cases_file.exists():
+        return {}
+    cases = json.loads(cases_file.read_text(encoding="utf-8"))
+    answers = {}
+    for number, case in enumerate(cases.get("cases", []), 1):
+        expected = case.get("expected", {})
+        phrases = expected.get("responseIncludesAny") or [case.get("title", "")]
+        targets = expected.get("actionTargetAny") or []
+        actions = [{"id": f"stub-{number}", "type": "iris_api", "op": "query",
+                    "target": targets[0], "summary": case.get("title", ""),
+                    "requiresApproval": bool(expected.get("requiresApproval", False))}
+                   ] if targets else []
+        answers[case["query"]] = {
+            "response": f"{phrases[0]} (stub reply to {case['id']})",
+            "agent": "orchestrator", "runner": "stub", "actions": actions,
+            "actionExecution": {"mode": "approval-required" if actions and actions[0]["requiresApproval"]
+                                else "direct-read", "executedCount": len(actions)},
+        }
+    return answers
+
+
+class BridgeStubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = LISTEN_BACKLOG
+
+
+class BridgeStubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "BridgeStub/1.0"
+    # Headers and body are separate writes; with Nagle on, the body waits
+    # for the client's delayed ACK on a keep-alive connection (~40 ms)
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with self.state.lock:
+            self.state.connections += 1
+
+    @property
+    def state(self) -> StubState:
+        return self.server.state
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, status: int, payload: dict):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True    # the client gave up waiting
+
+    def do_GET(self):
+        with self.state.lock:
+            self.state.requests += 1
+        if self.path.split("?", 1)[0].rstrip("/") == "/api/health":
+            state = self.state
+            self.reply(200, {"status": "ok", "runners": ["stub"], "requests": state.requests,
+                             "active": state.active, "peak": state.peak})
+        else:
+            self.reply(404, {"error": f"GET {self.path}: not found"})
+
+    def do_POST(self):
+        state = self.state
+        with state.lock:
+            state.requests += 1
+        length = int(self.headers.get("Content-Length") or 0)
+        data = self.rfile.read(length) if length else b""
+        if self.path.split("?", 1)[0].rstrip("/") != "/api/chat":
+            self.reply(404, {"error": f"POST {self.path}: not found"})
+            return
+        try:
+            body = json.loads(data) if data else {}
+        except ValueError:
+            self.reply(400, {"error": "Invalid JSON"})
+            return
+        message = body.get("message") if isinstance(body, dict) else None
+        if not message:
+            self.reply(400, {"error": "Message is required"})
+            return
+
+        if state.slots is not None:
+            state.slots.acquire()
+        try:
+            with state.lock:
+                state.active += 1
+                state.peak = max(state.peak, state.active)
+            time.sleep(state.delay())
+            failed = state.fails()
+        finally:
+            with state.lock:
+                state.active -= 1
+            if state.slots is not None:
+                state.slots.release()
+
+        if failed:
+            with state.lock:
+                state.failures += 1
+            self.reply(500, {"error": "Chat processing failed", "message": "stub runner failure"})
+            return
+        answer = state.answers.get(message)
+        if answer is None:
+            answer = {"response": f"Stub answer to: {message[:200]}", "agent": "orchestrator",
+                      "runner": "stub", "actions": []}
+        self.reply(200, answer)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a local stub of the bridge chat API.")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=3100, help="port to listen on (default 3100)")
+    parser.add_argument("--latency", type=float, default=800.0, metavar="MS",
+                        help="median simulated runner time per message (default 800)")
+    parser.add_argument("--jitter", type=float, default=0.5, metavar="SIGMA",
+                        help="log-normal spread of the runner time (0 = fixed, default 0.5)")
+    parser.add_argument("--slots", type=int, default=0, metavar="N",
+                        help="messages the simulated runner handles at once (default unlimited)")
+    parser.add_argument("--error-rate", type=float, default=0.0, metavar="P",
+                        help="fraction of messages answered with HTTP 500 (default 0)")
+    parser.add_argument("--cases", type=Path, default=CASES_FILE, metavar="FILE",
+                        help="cases file whose queries get their expected answers")
+    parser.add_argument("--seed", type=int, metavar="N",
+                        help="seed for the latency and failure draws")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    answers = load_answers(args.cases)
+    server = BridgeStubServer((args.host, args.port), BridgeStubHandler)
+    server.state = StubState(args.latency / 1000, args.jitter, args.slots, args.error_rate,
+                             answers, args.seed)
+    host, port = server.server_address[:2]
+    print(f"Bridge stub on http://{host}:{port} with {len(answers)} scripted answer(s) "
+          f"(Ctrl+C to stop)", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    state = server.state
+    print(f"\nServed {state.requests} request(s) on {state.connections} connection(s), "
+          f"{state.failures} failed, at most {state.peak} at once")
+
+
+if __name__ == "__main__":
+    main()
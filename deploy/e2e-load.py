@@ -0,0 +1,408 @@
+"""
+Concurrent load driver for the bridge chat API.
+
+Replays the lifecycle queries in tests/realworld-e2e-cases.json against
+POST /api/chat, --concurrency at a time, checks every answer the way
+bridge/src/tools/e2e-realworld-regression.ts does, and adds latency
+percentiles, throughput and error rates to the report, for sizing the
+bridge before it is put in front of many analysts.
+
+Usage:
+    python e2e-load.py [--url URL] [--concurrency N] [--repeat R] [--timeout SECONDS]
+                       [--cases FILE] [--report FILE] [--namespace NS] [--runner ID]
+
+Each of the N workers keeps one keep-alive connection and sends its next
+message as soon as the previous answer arrived (a closed loop, like N
+analysts waiting on their replies), taking cases from a shared queue so
+the R rounds of all cases are spread over the workers. Latency is
+measured from sending a request to having read its whole reply.
+
+The report (tests/realworld-e2e-load-report.json by default) has the
+fields of realworld-e2e-last-report.json, where a case passes only if
+every one of its requests passed, plus a "load" block with request
+counts, throughput, error rate (transport errors, timeouts and non-2xx
+replies) and p50/p95/p99 latency overall; each outcome carries its own
+request count and percentiles. The exit status is 1 if a case failed or
+a request errored.
+
+The URL defaults to TrustDGE_URL or http://localhost:3100; --namespace
+and --runner to NAMESPACE and RUNNER, then to the cases file. To try it
+without AI runners, start python bridge-stub.py (optionally --latency,
+--slots, --error-rate) and run this against http://127.0.0.1:3100.
+Only the standard library is used.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from urllib.parse import urlsplit
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+TESTS_DIR = SCRIPT_DIR.parent / "tests"
+CASES_FILE = TESTS_DIR / "realworld-e2e-cases.json"
+REPORT_FILE = TESTS_DIR / "realworld-e2e-load-report.json"
+
+PERCENTILES = (50, 95, 99)
+
+
+class ChatError(Exception):
+    """A request failed before a usable reply arrived; kind names the cause."""
+
+    def __init__(self, kind: str, message: str):
+        super().__init__(message)
+        self.kind = kind
+
+
+class ChatConnection:
+    """One keep-alive HTTP/1.1 connection on asyncio streams."""
+
+    def __init__(self, url: str, timeout: float):
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise ValueError(f"expected an http(s)://host[:port] URL, got {url!r}")
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == "https" else 80)
+        self.ssl = parts.scheme == "https"
+        self.base = parts.path.rstrip("/")
+        self.timeout = timeout
+        self.reader = None
+        self.writer = None
+        self.opened = 0
+
+    async def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+        self.reader = self.writer = None
+
+    async def post_json(self, path: str, body: dict) -> tuple:
+        """Send one POST; returns (HTTP status, reply bytes). A keep-alive
+        connection the server already closed is reopened once."""
+        data = json.dumps(body).encode("utf-8")
+        head = (f"POST {self.base}{path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n"
+                f"Content-Type: application/json; charset=utf-8\r\nAccept: application/json\r\n"
+                f"Content-Length: {len(data)}\r\nConnection: keep-alive\r\n\r\n").encode("ascii")
+        for attempt in (1, 2):
+            reused = self.writer is not None
+            if not reused:
+                self.reader, self.writer = await asyncio.open_connection(
+                    self.host, self.port, ssl=self.ssl or None)
+                self.opened += 1
+            try:
+                self.writer.write(head + data)
+                await self.writer.drain()
+                return await self.read_reply()
+            except (asyncio.IncompleteReadError, ConnectionError) as e:
+                await self.close()
+                if not reused or attempt == 2:
+                    raise ChatError("connection", f"connection lost: {e!r}") from None
+
+    async def read_reply(self) -> tuple:
+        status_line = await self.reader.readuntil(b"\r\n")
+        try:
+            status = int(status_line.split(None, 2)[1])
+        except (IndexError, ValueError):
+            raise ChatError("protocol", f"bad status line {status_line[:80]!r}") from None
+        headers = {}
+        while True:
+            line = await self.reader.readuntil(b"\r\n")
+            if line == b"\r\n":
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await self.reader.readuntil(b"\r\n")).split(b";", 1)[0], 16)
+                if size == 0:
+                    while await self.reader.readuntil(b"\r\n") != b"\r\n":
+                        pass
+                    break
+                chunks.append(await self.reader.readexactly(size))
+                await self.reader.readexactly(2)
+            payload = b"".join(chunks)
+        elif "content-length" in headers:
+            payload = await self.reader.readexactly(int(headers["content-length"]))
+        else:
+            payload = await self.reader.read()
+            headers["connection"] = "close"
+        if headers.get("connection", "").lower() == "close":
+            await self.close()
+        return status, payload
+
+
+def read_cases(path: Path) -> dict:
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def includes_any(haystack: str, needles: list) -> bool:
+    lower = haystack.lower()
+    return not needles or any(needle.lower() in lower for needle in needles)
+
+
+def includes_none(haystack: str, needles: list) -> bool:
+    lower = haystack.lower()
+    return all(needle.lower() not in lower for needle in needles)
+
+
+def evaluate_case(case: dict, reply: dict) -> tuple:
+    """(pass, check lines) for one reply, the checks evaluateCase() in the
+    TypeScript regression runner makes, worded the same way."""
+    expected = case.get("expected", {})
+    checks = []
+    passed = True
+    text = str(reply.get("response") or "")
+    actions = reply.get("actions") if isinstance(reply.get("actions"), list) else []
+    first = actions[0] if actions and isinstance(actions[0], dict) else {}
+    target = str(first.get("target") or "")
+    requires_approval = bool(first.get("requiresApproval") or False)
+
+    def result(ok):
+        return "PASS" if ok else "FAIL"
+
+    targets = expected.get("actionTargetAny") or []
+    if targets:
+        ok = target in targets
+        checks.append(f"target in {json.dumps(targets)} => actual '{target}' : {result(ok)}")
+        passed &= ok
+    if isinstance(expected.get("requiresApproval"), bool):
+        ok = requires_approval == expected["requiresApproval"]
+        checks.append(f"requiresApproval={str(expected['requiresApproval']).lower()} => "
+                      f"actual {str(requires_approval).lower()} : {result(ok)}")
+        passed &= ok
+    must = expected.get("responseIncludesAny") or []
+    ok = includes_any(text, must)
+    checks.append(f"response includes any {json.dumps(must)} : {result(ok)}")
+    passed &= ok
+    must_not = expected.get("responseNotIncludes") or []
+    ok = includes_none(text, must_not)
+    checks.append(f"response excludes {json.dumps(must_not)} : {result(ok)}")
+    passed &= ok
+    return passed, checks
+
+
+def percentile(ordered: list, p: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def latency_summary(seconds: list) -> dict:
+    """min/mean/p50/p95/p99/max of latencies, in milliseconds."""
+    if not seconds:
+        return {}
+    ordered = sorted(seconds)
+    summary = {"min": ordered[0], "mean": sum(ordered) / len(ordered)}
+    summary.update((f"p{p}", percentile(ordered, p)) for p in PERCENTILES)
+    summary["max"] = ordered[-1]
+    return {name: round(value * 1000, 1) for name, value in summary.items()}
+
+
+async def run_load(cases: list, url: str, namespace: str, runner: str, concurrency: int,
+                   repeat: int, timeout: float) -> tuple:
+    """Send every case repeat times over concurrency connections; returns
+    (one result dict per request, wall seconds, connections opened)."""
+    queue = asyncio.Queue()
+    for round_number in range(repeat):
+        for case in cases:
+            queue.put_nowait((round_number, case))
+    results = []
+    opened = 0
+
+    async def worker(number):
+        nonlocal opened
+        conn = ChatConnection(url, timeout)
+        try:
+            while True:
+                try:
+                    round_number, case = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                body = {"conversationId": f"load-{number}-{round_number}-{case['id']}-"
+                                          f"{random.randrange(10000)}",
+                        "message": case["query"], "namespace": namespace,
+                        "preferredRunner": runner}
+                result = {"id": case["id"], "status": None, "error": None, "pass": False,
+                          "checks": [], "reply": None}
+                start = time.perf_counter()
+                try:
+                    status, payload = await asyncio.wait_for(
+                        conn.post_json("/api/chat", body), timeout)
+                    result["seconds"] = time.perf_counter() - start
+                    result["status"] = status
+                    text = payload.decode("utf-8", "replace")
+                    try:
+                        reply = json.loads(text)
+                    except ValueError:
+                        raise ChatError("json", f"Invalid JSON from /api/chat: {text[:220]}")
+                    if status >= 400:
+                        raise ChatError(f"http {status}", f"HTTP {status}: {text[:260]}")
+                    if not isinstance(reply, dict):
+                        raise ChatError("json", "Unexpected non-object chat response.")
+                    result["pass"], result["checks"] = evaluate_case(case, reply)
+                    result["reply"] = reply
+                except asyncio.TimeoutError:
+                    await conn.close()
+                    result["seconds"] = time.perf_counter() - start
+                    result["error"] = ("timeout", f"no reply within {timeout:g} s")
+                except (ChatError, OSError) as e:
+                    result.setdefault("seconds", time.perf_counter() - start)
+                    result["error"] = (getattr(e, "kind", "connection"), str(e) or repr(e))
+                if result["error"] is not None:
+                    result["checks"] = [result["error"][1]]
+                results.append(result)
+        finally:
+            opened += conn.opened
+            await conn.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(number) for number in range(concurrency)))
+    return results, time.perf_counter() - start, opened
+
+
+def build_report(cfg: dict, namespace: str, runner: str, url: str, concurrency: int,
+                 repeat: int, results: list, seconds: float, opened: int) -> dict:
+    by_case = {}
+    for result in results:
+        by_case.setdefault(result["id"], []).append(result)
+    outcomes = []
+    for case in cfg["cases"]:
+        runs = by_case.get(case["id"], [])
+        failing = next((run for run in runs if not run["pass"]), None)
+        shown = failing or runs[-1]
+        reply = shown["reply"] or {}
+        outcome = {"id": case["id"], "title": case.get("title", ""), "query": case["query"],
+                   "pass": bool(runs) and failing is None, "checks": shown["checks"]}
+        if shown["reply"] is not None:
+            actions = reply.get("actions") if isinstance(reply.get("actions"), list) else []
+            outcome["responsePreview"] = str(reply.get("response") or "")[:500]
+            outcome["action"] = actions[0] if actions else {}
+        outcome["requests"] = len(runs)
+        outcome["failedRequests"] = sum(not run["pass"] for run in runs)
+        outcome["latencyMs"] = latency_summary([run["seconds"] for run in runs])
+        outcomes.append(outcome)
+
+    errors = [result for result in results if result["error"] is not None]
+    failures = [result for result in results if result["error"] is None and not result["pass"]]
+    statuses, kinds = {}, {}
+    for result in results:
+        key = str(result["status"]) if result["status"] is not None else "none"
+        statuses[key] = statuses.get(key, 0) + 1
+    for result in errors:
+        kinds[result["error"][0]] = kinds.get(result["error"][0], 0) + 1
+    passed = sum(outcome["pass"] for outcome in outcomes)
+    return {
+        "generatedAt": datetime.now(timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z"),
+        "version": cfg.get("version"),
+        "namespace": namespace,
+        "runner": runner,
+        "total": len(outcomes),
+        "passed": passed,
+        "failed": len(outcomes) - passed,
+        "load": {
+            "url": url,
+            "concurrency": concurrency,
+            "repeat": repeat,
+            "connections": opened,
+            "requests": len(results),
+            "seconds": round(seconds, 3),
+            "throughput": round(len(results) / seconds, 2) if seconds else None,
+            "errors": len(errors),
+            "errorRate": round(len(errors) / len(results), 4) if results else 0.0,
+            "errorKinds": kinds,
+            "failedChecks": len(failures),
+            "failureRate": round(len(failures) / len(results), 4) if results else 0.0,
+            "statusCodes": statuses,
+            "latencyMs": latency_summary([result["seconds"] for result in results]),
+        },
+        "outcomes": outcomes,
+    }
+
+
+def print_report(report: dict, report_path: Path) -> None:
+    for outcome in report["outcomes"]:
+        latency = outcome["latencyMs"]
+        timing = (f"  p50 {latency['p50']:.0f} ms, p95 {latency['p95']:.0f} ms"
+                  if latency else "")
+        failed = (f"  ({outcome['failedRequests']}/{outcome['requests']} failed)"
+                  if outcome["failedRequests"] else "")
+        print(f"[{'PASS' if outcome['pass'] else 'FAIL'}] {outcome['id']} {outcome['title']}"
+              f"{timing}{failed}")
+        if not outcome["pass"]:
+            for check in outcome["checks"]:
+                print(f"       {check}")
+    load = report["load"]
+    latency = load["latencyMs"]
+    print("----------------------------------------")
+    print(f"Total: {report['total']}, Passed: {report['passed']}, Failed: {report['failed']}")
+    print(f"Requests:   {load['requests']} over {load['concurrency']} connection(s) "
+          f"in {load['seconds']:.2f} s ({load['connections']} opened)")
+    if load["throughput"] is not None:
+        print(f"Throughput: {load['throughput']:.2f} requests/s")
+    if latency:
+        print(f"Latency:    p50 {latency['p50']:.1f} ms, p95 {latency['p95']:.1f} ms, "
+              f"p99 {latency['p99']:.1f} ms (min {latency['min']:.1f}, max {latency['max']:.1f})")
+    kinds = ", ".join(f"{count} {kind}" for kind, count in sorted(load["errorKinds"].items()))
+    print(f"Errors:     {load['errors']} ({load['errorRate']:.1%})" + (f": {kinds}" if kinds else ""))
+    print(f"Checks:     {load['failedChecks']} request(s) failed a check ({load['failureRate']:.1%})")
+    print(f"Report: {report_path}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Replay the real-world E2E cases concurrently against the bridge chat API.")
+    parser.add_argument("--url", default=os.environ.get("TrustDGE_URL", "http://localhost:3100"),
+                        help="bridge base URL (default TrustDGE_URL or http://localhost:3100)")
+    parser.add_argument("--concurrency", "-c", type=int, default=8, metavar="N",
+                        help="requests in flight at once, one connection each (default 8)")
+    parser.add_argument("--repeat", "-r", type=int, default=1, metavar="R",
+                        help="send every case R times (default 1)")
+    parser.add_argument("--timeout", type=float, default=120.0, metavar="SECONDS",
+                        help="give up on a request after SECONDS (default 120)")
+    parser.add_argument("--cases", type=Path, default=CASES_FILE, metavar="FILE",
+                        help="cases file (default tests/realworld-e2e-cases.json)")
+    parser.add_argument("--report", type=Path, default=REPORT_FILE, metavar="FILE",
+                        help="report file (default tests/realworld-e2e-load-report.json)")
+    parser.add_argument("--namespace", metavar="NS",
+                        help="namespace sent with every message (default NAMESPACE or the cases file)")
+    parser.add_argument("--runner", metavar="ID",
+                        help="preferred runner (default RUNNER or the cases file)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.concurrency < 1 or args.repeat < 1:
+        raise SystemExit("ERROR: --concurrency and --repeat must be at least 1")
+    cfg = read_cases(args.cases)
+    if not cfg.get("cases"):
+        raise SystemExit(f"ERROR: {args.cases} has no cases")
+    namespace = args.namespace or os.environ.get("NAMESPACE") or cfg.get("namespace") or "DEMO2_AI2"
+    runner = args.runner or os.environ.get("RUNNER") or cfg.get("runner") or "openai-codex-sdk"
+    try:
+        ChatConnection(args.url, args.timeout)
+    except ValueError as e:
+        raise SystemExit(f"ERROR: {e}")
+
+    print(f"Replaying {len(cfg['cases'])} case(s) x {args.repeat} against {args.url} "
+          f"with {args.concurrency} concurrent request(s)", flush=True)
+    results, seconds, opened = asyncio.run(run_load(
+        cfg["cases"], args.url, namespace, runner, args.concurrency, args.repeat, args.timeout))
+    report = build_report(cfg, namespace, runner, args.url, args.concurrency, args.repeat,
+                          results, seconds, opened)
+    args.report.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+    print_report(report, args.report)
+    if report["failed"] or report["load"]["errors"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,759 +3,1337 @@ Generate a single IRIS XML export file from all AIAgent UDL .cls files.
 Produces a file importable via Studio (Tools > Import Local) or $system.OBJ.Load().
 
 Usage:
-    python generate-xml-export.py
+    python generate-xml-export.py [--jobs N] [--since N] [--shard class|phase] [--canonical] ...
+    python generate-xml-export.py --help
 
 Output:
     deploy/AIAgent-export.xml
+
+The other modes (--watch, --push, --ndjson, --batch, --verify, --reverse,
+--rebuild, --gc, --lookup, --search) are listed by --help and described in
+DEPLOY-README.md. The conversion itself lives in iris_export.py.
 """
 
+import argparse
+import hashlib
+import json
 import os
 import re
-import xml.etree.ElementTree as ET
-from xml.dom import minidom
+import time
+from contextlib import ExitStack, nullcontext
 from pathlib import Path
 
+from iris_export import (
+    COMPRESSION_SUFFIXES, EMITTERS, SHARD_MODES, NotAClass, cache_evict, cache_key, cache_load,
+    cache_store, canonical_source, class_chunks, class_name_from_path, collect_entries,
+    collect_garbage, export_header, export_package, file_digest, fragment_hash,
+    generator_fingerprint, indexed_classes, indexed_documents, iter_ndjson, iter_rendered,
+    iter_reverse, iter_version, load_manifest, lookup_symbol, markdown_chunks, open_compressed,
+    open_export, open_retrieval, open_symbols, order_classes, plan_entries, prune_documents,
+    prune_symbols, render_class_profiled, scan_dependencies, search, store_lock, store_object,
+    stored_versions, update_document, update_symbols, verify_export, write_manifest,
+    write_shards, zstd_module,
+)
+
 SCRIPT_DIR = Path(__file__).resolve().parent
 CLS_DIR = SCRIPT_DIR.parent / "cls"
 OUTPUT_FILE = SCRIPT_DIR / "AIAgent-export.xml"
 
-# Version counter — increment each time the script is run
+# Pre-store version counter; only read, so numbering continues from it
 VERSION_FILE = SCRIPT_DIR / ".export-version"
 
-# Class import order (dependencies first)
-CLASS_ORDER = [
-    "AIAgent/Util/JSON.cls",
-    "AIAgent/Util/Logger.cls",
-    "AIAgent/Model/Conversation.cls",
-    "AIAgent/Model/Message.cls",
-    "AIAgent/Model/Generation.cls",
-    "AIAgent/Model/GenerationClass.cls",
-    "AIAgent/Model/Version.cls",
-    "AIAgent/Model/AuditEntry.cls",
-    "AIAgent/Engine/CodeManager.cls",
-    "AIAgent/Engine/ProductionManager.cls",
-    "AIAgent/Engine/VersionManager.cls",
-    "AIAgent/Engine/TestRunner.cls",
-    "AIAgent/Engine/BridgeClient.cls",
-    "AIAgent/Engine/Orchestrator.cls",
-    "AIAgent/Templates/BusinessService.cls",
-    "AIAgent/Templates/BusinessProcess.cls",
-    "AIAgent/Templates/BusinessOperation.cls",
-    "AIAgent/Templates/DataTransformation.cls",
-    "AIAgent/Templates/RoutingRule.cls",
-    "AIAgent/Templates/MessageClass.cls",
-    "AIAgent/Templates/Factory.cls",
-    "AIAgent/API/Dispatcher.cls",
-    "AIAgent/Test/E2E.cls",
-    "AIAgent/UI/Chat.cls",
-    "AIAgent/Install/Installer.cls",
-]
-
-
-def parse_udl_class(source: str) -> dict:
-    """Parse a UDL .cls file into structured components."""
-    result = {
-        "name": "",
-        "super": "",
-        "description": [],
-        "class_keywords": {},  # e.g. Abstract, DependsOn
-        "parameters": [],
-        "properties": [],
-        "methods": [],
-        "xdata": [],
-        "storage": [],
-        "projections": [],
-        "indices": [],
-    }
+# Content-addressed version store — fragments by hash, one manifest per version
+STORE_DIR = SCRIPT_DIR / ".export-store"
 
-    lines = source.split("\n")
-    i = 0
-
-    # Collect leading /// description lines
-    while i < len(lines):
-        line = lines[i]
-        if line.startswith("///"):
-            result["description"].append(line[3:].strip() if len(line) > 3 else "")
-            i += 1
-        elif line.strip() == "":
-            i += 1
-        else:
-            break
-
-    # Parse Class declaration
-    while i < len(lines):
-        line = lines[i].strip()
-        if line.startswith("Class "):
-            # Parse: Class Name Extends Super [ keywords ]
-            class_match = re.match(
-                r'Class\s+([\w.]+)\s+Extends\s+([\w.%,\s()]+?)(?:\s*\[(.+?)\])?\s*$',
-                line
-            )
-            if class_match:
-                result["name"] = class_match.group(1)
-                result["super"] = class_match.group(2).strip()
-                if class_match.group(3):
-                    result["class_keywords"] = parse_bracket_keywords(class_match.group(3))
-            else:
-                # Try without Extends
-                class_match2 = re.match(r'Class\s+([\w.]+)(?:\s+Extends\s+([\w.%,\s()]+?))?(?:\s*\[(.+?)\])?\s*$', line)
-                if class_match2:
-                    result["name"] = class_match2.group(1)
-                    result["super"] = (class_match2.group(2) or "").strip()
-                    if class_match2.group(3):
-                        result["class_keywords"] = parse_bracket_keywords(class_match2.group(3))
-            i += 1
-            break
-        i += 1
-
-    # Skip opening brace
-    while i < len(lines) and lines[i].strip() in ("{", ""):
-        i += 1
-
-    # Parse class body
-    while i < len(lines):
-        line = lines[i]
-        stripped = line.strip()
-
-        # Skip empty lines
-        if stripped == "":
-            i += 1
-            continue
+# Incremental build cache — one rendered XML fragment per class source hash
+CACHE_DIR = SCRIPT_DIR / ".export-cache"
 
-        # End of class
-        if stripped == "}":
-            break
-
-        # Collect description comments before a member
-        member_desc = []
-        while stripped.startswith("///"):
-            member_desc.append(stripped[3:].strip() if len(stripped) > 3 else "")
-            i += 1
-            if i >= len(lines):
-                break
-            line = lines[i]
-            stripped = line.strip()
-
-        # Skip blank lines after comments
-        while i < len(lines) and lines[i].strip() == "":
-            i += 1
-            if i >= len(lines):
-                break
-            line = lines[i]
-            stripped = line.strip()
-
-        # Parameter
-        if stripped.startswith("Parameter "):
-            param = parse_parameter(stripped, member_desc)
-            if param:
-                result["parameters"].append(param)
-            i += 1
-            continue
+# Compile phases of the latest export, one list of class names per phase
+PHASES_FILE = OUTPUT_FILE.with_suffix(".phases.json")
 
-        # Property
-        if stripped.startswith("Property "):
-            prop = parse_property(stripped, member_desc)
-            if prop:
-                result["properties"].append(prop)
-            i += 1
-            continue
+# Sidecar with the export's sha256/ETag and the version metadata that
+# --canonical keeps out of the export itself
+META_FILE = OUTPUT_FILE.with_suffix(".meta.json")
 
-        # Index
-        if stripped.startswith("Index "):
-            idx = parse_index(stripped, member_desc)
-            if idx:
-                result["indices"].append(idx)
-            i += 1
-            continue
+# Versioned copies of canonical exports are named by content
+CONTENT_COPY = re.compile(r"AIAgent-export-[0-9a-f]{16}\.xml")
 
-        # ClassMethod or Method
-        if stripped.startswith("ClassMethod ") or stripped.startswith("Method "):
-            method, i = parse_method(lines, i, member_desc)
-            if method:
-                result["methods"].append(method)
-            continue
+# Source hash of each class last pushed and compiled, per server/namespace
+PUSH_STATE_FILE = SCRIPT_DIR / ".export-pushed.json"
 
-        # XData
-        if stripped.startswith("XData "):
-            xdata, i = parse_xdata(lines, i, member_desc)
-            if xdata:
-                result["xdata"].append(xdata)
-            continue
+# --shard output: one export per class or phase, plus index.json
+SHARD_DIR = SCRIPT_DIR / "AIAgent-export-shards"
 
-        # Storage
-        if stripped.startswith("Storage "):
-            storage, i = parse_storage(lines, i)
-            if storage:
-                result["storage"].append(storage)
-            continue
+# SQLite symbol index kept up to date by --symbols and read by --lookup
+SYMBOLS_FILE = OUTPUT_FILE.with_suffix(".symbols.db")
 
-        # Skip anything else (comments, blank lines)
-        i += 1
+# BM25 chunk index kept up to date by --retrieval and read by --search
+RETRIEVAL_FILE = OUTPUT_FILE.with_suffix(".retrieval.db")
+KNOWLEDGE_DIR = SCRIPT_DIR.parent / "knowledge"
 
-    return result
+# The options each run mode reads (None: the default export run); any
+# other option given with a mode is rejected rather than ignored
+EXPORT_OPTIONS = {"jobs", "compress", "canonical", "strict", "diagnostics_json"}
+MODE_OPTIONS = {
+    None: EXPORT_OPTIONS | {"no_cache", "since", "shard", "emit", "symbols", "retrieval",
+                            "stats", "stats_json", "trace_memory"},
+    "watch": {"no_cache", "interval"},
+    "push": {"namespace", "push_jobs", "force"},
+    "batch": EXPORT_OPTIONS | {"no_cache", "out"},
+    "ndjson": EXPORT_OPTIONS | {"out"},
+    "lookup": set(),
+    "search": {"top", "search_json"},
+    "verify": set(),
+    "reverse": {"out"},
+    "rebuild": {"shard", "compress"},
+    "gc": {"keep"},
+}
 
 
-def udl_formalspec_to_xml(udl_spec: str) -> str:
-    """Convert UDL formal spec to IRIS XML FormalSpec format.
+def read_version() -> int:
+    """Latest allocated version (0 before the first export)."""
+    try:
+        legacy = int(VERSION_FILE.read_text().strip())
+    except (FileNotFoundError, ValueError):
+        legacy = 0
+    return max([legacy] + stored_versions(STORE_DIR))
 
-    UDL:  param As %String, param2 As %Integer = 0, Output pOut As %String
-    XML:  param:%String,param2:%Integer=0,*pOut:%String
 
-    UDL uses 'As' keyword; XML uses ':' separator.
-    Output params get '*' prefix, ByRef params get '&' prefix.
-    """
-    if not udl_spec.strip():
-        return ""
+def get_next_version() -> int:
+    """Next version number. Call with store_lock() held until its manifest
+    is written, so two runs cannot allocate the same number."""
+    return read_version() + 1
 
-    # Split on commas, but respect nested parens/quotes
-    params = split_params(udl_spec)
-    xml_params = []
 
-    for param in params:
-        param = param.strip()
-        if not param:
-            continue
+def load_version(version: int) -> dict:
+    """Load a stored version's manifest, or exit with a readable error."""
+    try:
+        return load_manifest(STORE_DIR, version)
+    except FileNotFoundError:
+        raise SystemExit(f"ERROR: no manifest for v{version} in {STORE_DIR.name}; "
+                         f"only versions written by this generator are stored")
 
-        prefix = ""
-        # Check for Output/ByRef modifiers
-        if param.startswith("Output "):
-            prefix = "*"
-            param = param[7:].strip()
-        elif param.startswith("ByRef "):
-            prefix = "&"
-            param = param[6:].strip()
-
-        # Parse: name As Type = default
-        m = re.match(r'(\w+)\s+As\s+([\w.%]+(?:\([^)]*\))?)\s*(?:=\s*(.+))?$', param)
-        if m:
-            name = m.group(1)
-            ptype = m.group(2)
-            default = m.group(3)
-            # Strip type parameters like (MAXLEN=256) for FormalSpec
-            ptype_base = re.sub(r'\([^)]*\)', '', ptype)
-            result = f"{prefix}{name}:{ptype_base}"
-            if default is not None:
-                result += f"={default.strip()}"
-            xml_params.append(result)
-        else:
-            # No type specified, or already in colon format
-            xml_params.append(f"{prefix}{param}")
-
-    return ",".join(xml_params)
-
-
-def split_params(spec: str) -> list:
-    """Split formal spec by commas, respecting nested parens and quotes."""
-    params = []
-    depth = 0
-    in_quote = False
-    current = ""
-    for ch in spec:
-        if ch == '"' and not in_quote:
-            in_quote = True
-            current += ch
-        elif ch == '"' and in_quote:
-            in_quote = False
-            current += ch
-        elif ch == '(' and not in_quote:
-            depth += 1
-            current += ch
-        elif ch == ')' and not in_quote:
-            depth -= 1
-            current += ch
-        elif ch == ',' and depth == 0 and not in_quote:
-            params.append(current)
-            current = ""
-        else:
-            current += ch
-    if current.strip():
-        params.append(current)
-    return params
+
+def versioned_path(version: int, compress=None) -> Path:
+    suffix = COMPRESSION_SUFFIXES[compress] if compress else ""
+    return SCRIPT_DIR / f"AIAgent-export-v{version}.xml{suffix}"
 
 
-def parse_bracket_keywords(text: str) -> dict:
-    """Parse [ Key = Value, Key2 = Value2 ] content.
+def content_path(digest: str, compress=None) -> Path:
+    """The versioned copy of a canonical export: named by its sha256."""
+    suffix = COMPRESSION_SUFFIXES[compress] if compress else ""
+    return SCRIPT_DIR / f"AIAgent-export-{digest[:16]}.xml{suffix}"
 
-    Respects nested braces {} and parentheses () so that expressions like
-    InitialExpression = {$zdatetime($ztimestamp, 3, 1)} are not split at
-    the commas inside the braces.
+
+def rebuild_version(version: int, compress=None) -> Path:
+    """Write AIAgent-export-vN.xml[.gz|.zst] (for a canonical version, the
+    content-named copy) from the store and return its path."""
+    manifest = load_version(version)
+    if manifest.get("canonical"):
+        target = content_path(manifest["sha256"], compress)
+        write_export(target, None, iter_version(STORE_DIR, version), compress)
+    else:
+        target = versioned_path(version, compress)
+        write_export(target, version, iter_version(STORE_DIR, version), compress)
+    return target
+
+
+def print_shards(index: dict) -> None:
+    print(f"Shards:    {len(index['shards'])} {index['mode']} shard(s) in {SHARD_DIR}")
+    print(f"           index: {SHARD_DIR / 'index.json'}")
+
+
+def remove_garbage(keep=None) -> dict:
+    """collect_garbage() plus the AIAgent-export-vN.xml copies of every
+    stored version but the newest (--rebuild N brings one back)."""
+    result = collect_garbage(STORE_DIR, keep)
+    copies = 0
+    for version in result["dropped"] + result["kept"][:-1]:
+        for compress in (None, *COMPRESSION_SUFFIXES):
+            copy = versioned_path(version, compress)
+            if copy.exists():
+                copy.unlink()
+                copies += 1
+    latest = load_manifest(STORE_DIR, result["kept"][-1]) if result["kept"] else {}
+    current = content_path(latest.get("sha256", ""), None).name
+    for copy in SCRIPT_DIR.glob("AIAgent-export-*.xml*"):
+        if CONTENT_COPY.fullmatch(plain_name(copy.name)) and plain_name(copy.name) != current:
+            copy.unlink()
+            copies += 1
+    return {"manifests": len(result["dropped"]), "objects": result["objects"], "copies": copies}
+
+
+# Per-class stages, in pipeline order. escape and validate are part of render;
+# symbols and index are only spent with --symbols, emit with --emit and
+# retrieval with --retrieval. A cached class is only parsed for those.
+STAT_STAGES = ("read", "cache", "parse", "render", "escape", "validate", "symbols", "emit",
+               "store", "index", "retrieval", "write")
+
+
+def class_stats_row(entry: dict, store_time: float, write_time: float) -> dict:
+    """One class's --stats row; member counts come from the fragment so
+    cached classes are counted without parsing them."""
+    row = {"name": entry["name"], "cached": entry["cached"]}
+    row.update({stage: entry["stats"].get(stage, 0.0) for stage in STAT_STAGES})
+    row["store"] = store_time
+    row["write"] = write_time
+    row["total"] = sum(row[stage] for stage in STAT_STAGES if stage not in ("escape", "validate"))
+    row["bytes_in"] = entry["stats"]["bytes_in"]
+    row["bytes_out"] = len(entry["xml"].encode("utf-8"))
+    row["methods"] = entry["xml"].count('\n<Method name="')
+    row["xdata"] = entry["xml"].count('\n<XData name="')
+    if "peak_bytes" in entry["stats"]:
+        row["peak_bytes"] = entry["stats"]["peak_bytes"]
+    return row
+
+
+def stats_report(class_stats: list, plan_time: float, publish_time: float,
+                 wall_time: float, jobs: int) -> dict:
+    """Stage totals plus per-class rows, slowest class first.
+
+    With jobs > 1, parse/render/escape are summed across workers, so the
+    stage totals can exceed the wall time.
+    """
+    stages = {"plan": plan_time}
+    for stage in STAT_STAGES:
+        stages[stage] = sum(row[stage] for row in class_stats)
+    stages["publish"] = publish_time
+    return {
+        "wall": wall_time,
+        "jobs": jobs,
+        "stages": stages,
+        "bytes_in": sum(row["bytes_in"] for row in class_stats),
+        "bytes_out": sum(row["bytes_out"] for row in class_stats),
+        "classes": sorted(class_stats, key=lambda row: -row["total"]),
+    }
+
+
+def print_stats(stats: dict, top: int) -> None:
+    print()
+    print(f"Stage timings (wall {stats['wall'] * 1000:.0f} ms, jobs {stats['jobs']}):")
+    for stage, seconds in stats["stages"].items():
+        print(f"  {stage:<8} {seconds * 1000:>9.1f} ms")
+    print(f"  {'bytes':<8} {stats['bytes_in']:>9} in, {stats['bytes_out']} out")
+
+    rows = stats["classes"][:top]
+    if not rows:
+        return
+    memory = "peak_bytes" in rows[0]
+    print()
+    print(f"Slowest {len(rows)} of {len(stats['classes'])} classes (ms):")
+    print(f"  {'Class':<40} {'Total':>7} {'Read':>6} {'Parse':>7} {'Render':>7} {'Escape':>6} "
+          f"{'Write':>6} {'Meth':>5} {'XData':>5} {'KB out':>7}" + (f" {'Peak KB':>8}" if memory else ""))
+    for row in rows:
+        name = row["name"] + (" *" if row["cached"] else "")
+        line = (f"  {name:<40} {row['total'] * 1000:>7.2f} {row['read'] * 1000:>6.2f} "
+                f"{row['parse'] * 1000:>7.2f} {row['render'] * 1000:>7.2f} {row['escape'] * 1000:>6.2f} "
+                f"{(row['store'] + row['write']) * 1000:>6.2f} {row['methods']:>5} {row['xdata']:>5} "
+                f"{row['bytes_out'] / 1024:>7.1f}")
+        if memory:
+            line += f" {row.get('peak_bytes', 0) / 1024:>8.0f}"
+        print(line)
+    print("  (* = cached; Write includes cache and version-store writes)")
+
+
+def diagnostic_status(diagnostics: list) -> str:
+    """"2 error(s), 1 warning(s)" for a list of Diagnostics."""
+    errors = sum(d.severity == "error" for d in diagnostics)
+    return f"{errors} error(s), {len(diagnostics) - errors} warning(s)"
+
+
+def write_diagnostics(path: Path, diagnostics: list) -> None:
+    path.write_text(json.dumps([d.to_dict() for d in diagnostics], indent=2) + "\n",
+                    encoding="utf-8")
+
+
+def publish_copy(source: Path, target: Path) -> None:
+    """Make target a copy of source: a hardlink where the filesystem allows,
+    otherwise an OS-level file copy (no re-encode or second render).
+
+    Safe to hardlink because exports are always replaced by rename, never
+    rewritten in place, so later runs cannot alter an older version.
     """
+    try:
+        target.unlink()
+    except FileNotFoundError:
+        pass
+    try:
+        os.link(source, target)
+    except OSError:
+        import shutil
+        shutil.copyfile(source, target)
+
+
+def write_phases(path: Path, phases: list, cycles: list) -> None:
+    """Record the compile phases next to the export for the importer."""
+    data = {"phases": phases, "cycles": cycles}
+    path.write_text(json.dumps(data, indent=2) + "\n", encoding="utf-8")
+
+
+def write_meta(version: int, digest: str, size: int, copy: Path, classes: int,
+               canonical: bool) -> dict:
+    """Write META_FILE for the export just published and return it.
+    first_version is the oldest consecutive version with the same bytes."""
+    try:
+        previous = json.loads(META_FILE.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        previous = {}
+    first = previous.get("first_version", version) if previous.get("sha256") == digest else version
+    meta = {"file": OUTPUT_FILE.name, "sha256": digest, "etag": f'"{digest}"', "bytes": size,
+            "canonical": canonical, "version": version, "first_version": first,
+            "copy": copy.name, "classes": classes, "generator": generator_fingerprint()}
+    META_FILE.write_text(json.dumps(meta, indent=2) + "\n", encoding="utf-8")
+    return meta
+
+
+def snapshot(cls_dir: Path) -> dict:
+    """Map each .cls path under cls_dir to its (mtime_ns, size)."""
     result = {}
-    # Split by commas, respecting nested {} and ()
-    parts = []
-    depth = 0
-    in_quote = False
-    current = ""
-    for ch in text:
-        if ch == '"' and not in_quote:
-            in_quote = True
-            current += ch
-        elif ch == '"' and in_quote:
-            in_quote = False
-            current += ch
-        elif not in_quote and ch in ('(', '{'):
-            depth += 1
-            current += ch
-        elif not in_quote and ch in (')', '}'):
-            depth -= 1
-            current += ch
-        elif ch == ',' and depth == 0 and not in_quote:
-            parts.append(current)
-            current = ""
-        else:
-            current += ch
-    if current.strip():
-        parts.append(current)
-
-    for part in parts:
-        if '=' in part:
-            k, v = part.split('=', 1)
-            result[k.strip()] = v.strip().strip('"')
-        else:
-            result[part.strip()] = "1"
+    for path in cls_dir.rglob("*.cls"):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        result[path.relative_to(cls_dir).as_posix()] = (stat.st_mtime_ns, stat.st_size)
     return result
 
 
-def parse_parameter(line: str, desc: list) -> dict:
-    """Parse: Parameter NAME = "value"; or Parameter NAME As Type;"""
-    m = re.match(r'Parameter\s+(\w+)\s*=\s*"?(.*?)"?\s*;', line)
-    if m:
-        return {"name": m.group(1), "default": m.group(2), "description": desc}
-    m = re.match(r'Parameter\s+(\w+)\s*;', line)
-    if m:
-        return {"name": m.group(1), "default": "", "description": desc}
-    m = re.match(r'Parameter\s+(\w+)\s+As\s+(\S+)\s*=\s*"?(.*?)"?\s*;', line)
-    if m:
-        return {"name": m.group(1), "type": m.group(2), "default": m.group(3), "description": desc}
-    return None
-
-
-def parse_property(line: str, desc: list) -> dict:
-    """Parse: Property Name As Type(PARAMS) [ keywords ];"""
-    # Match property with type, optional parameters, and optional keywords
-    m = re.match(
-        r'Property\s+(\w+)\s+As\s+([^\[;]+?)(?:\s*\[(.+?)\])?\s*;',
-        line
-    )
-    if m:
-        prop = {
-            "name": m.group(1),
-            "type_full": m.group(2).strip(),
-            "keywords": {},
-            "description": desc,
-        }
-        # Parse type and type parameters
-        type_m = re.match(r'([\w.%]+)(?:\((.+)\))?', prop["type_full"])
-        if type_m:
-            prop["type"] = type_m.group(1)
-            prop["type_params"] = type_m.group(2) or ""
-        else:
-            prop["type"] = prop["type_full"]
-            prop["type_params"] = ""
-
-        if m.group(3):
-            prop["keywords"] = parse_bracket_keywords(m.group(3))
-        return prop
-    return None
-
-
-def parse_index(line: str, desc: list) -> dict:
-    """Parse: Index IndexName On (Props) [ keywords ];"""
-    m = re.match(r'Index\s+(\w+)\s+On\s+(.+?)(?:\s*\[(.+?)\])?\s*;', line)
-    if m:
-        return {
-            "name": m.group(1),
-            "properties": m.group(2).strip(),
-            "keywords": parse_bracket_keywords(m.group(3)) if m.group(3) else {},
-            "description": desc,
-        }
-    return None
-
-
-def parse_method(lines: list, start: int, desc: list) -> tuple:
-    """Parse a Method or ClassMethod block including its body."""
-    line = lines[start].strip()
-
-    # Determine if ClassMethod
-    is_class_method = line.startswith("ClassMethod ")
-    keyword = "ClassMethod" if is_class_method else "Method"
-
-    # Parse declaration
-    # Handle multi-line declarations
-    decl = line
-    i = start
-    while not decl.rstrip().endswith("{") and i < len(lines) - 1:
-        i += 1
-        decl += " " + lines[i].strip()
-
-    # Remove trailing {
-    decl = decl.rstrip().rstrip("{").strip()
-
-    # Parse: (Class)Method Name(args) As ReturnType [ keywords ]
-    m = re.match(
-        rf'{keyword}\s+(\w+)\((.*?)\)(?:\s+As\s+([\w.%]+))?(?:\s*\[(.+?)\])?\s*$',
-        decl,
-        re.DOTALL
-    )
-
-    method = {
-        "name": "",
-        "is_class_method": is_class_method,
-        "formal_spec": "",
-        "return_type": "",
-        "keywords": {},
-        "description": desc,
-        "implementation": [],
-    }
+def write_export(path: Path, version, fragments, compress=None) -> None:
+    """Write an export from already rendered fragments, replacing path
+    atomically. version None writes a canonical export."""
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        with open_compressed(tmp, compress, "\n" if version is None else None) as out:
+            out.write(export_header(version))
+            for fragment in fragments:
+                out.write(fragment)
+                out.write("\n\n")
+            out.write("</Export>")
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    os.replace(tmp, path)
+
+
+def watch(interval: float, use_cache: bool) -> None:
+    """Rebuild OUTPUT_FILE whenever a class under CLS_DIR changes.
+
+    Rendered fragments and dependency info stay in memory between
+    rebuilds, so a save re-renders only the files whose size or mtime
+    moved. A class that fails to parse keeps its last good fragment, and
+    a class keeps coming from the file it was first found in when another
+    file declares the same name.
+
+    The export carries no version number, since watch mode allocates
+    none, and is written under the store lock so a concurrent export
+    run never interleaves with it.
+    """
+    fingerprint = generator_fingerprint() if use_cache else ""
+    models = {}
+    owners = {}     # class name -> the file that provides it, across rebuilds
+    seen = {}
 
-    if m:
-        method["name"] = m.group(1)
-        method["formal_spec"] = m.group(2).strip() if m.group(2) else ""
-        method["return_type"] = m.group(3) or ""
-        if m.group(4):
-            method["keywords"] = parse_bracket_keywords(m.group(4))
+    print(f"Watching {CLS_DIR} (every {interval:g}s, Ctrl+C to stop)")
+    print(f"Output:  {OUTPUT_FILE}")
+    try:
+        while True:
+            current = snapshot(CLS_DIR)
+            if current == seen:
+                time.sleep(interval)
+                continue
+
+            start = time.perf_counter()
+            touched = sorted(p for p, stat in current.items() if seen.get(p) != stat)
+            removed = seen.keys() - current.keys()
+            for cls_path in removed:
+                models.pop(cls_path, None)
+            for cls_path in touched:
+                try:
+                    source = (CLS_DIR / cls_path).read_text(encoding="utf-8")
+                    info = scan_dependencies(source, class_name_from_path(cls_path))
+                    xml_content = None
+                    if use_cache:
+                        key = cache_key(fingerprint, info["name"], source)
+                        xml_content = cache_load(CACHE_DIR, key)
+                    if xml_content is None:
+                        xml_content, _, diagnostics, _, _ = render_class_profiled(info["name"], source)
+                        for diagnostic in diagnostics:
+                            diagnostic.file = cls_path
+                            print(f"  {diagnostic}")
+                        if use_cache and not diagnostics:
+                            cache_store(CACHE_DIR, key, xml_content)
+                except Exception as e:
+                    print(f"  ERROR: {cls_path}: {e}")
+                    continue
+                models[cls_path] = {"info": info, "xml": xml_content}
+            seen = current
+
+            # A file that already provides a class keeps it; another file
+            # declaring the same name (a stray copy, say) is ignored
+            by_name = {}
+            for name, cls_path in owners.items():
+                model = models.get(cls_path)
+                if model is not None and model["info"]["name"] == name:
+                    by_name[name] = {**model, "path": cls_path}
+            for cls_path, model in sorted(models.items()):
+                name = model["info"]["name"]
+                if name not in by_name:
+                    by_name[name] = {**model, "path": cls_path}
+                elif by_name[name]["path"] != cls_path:
+                    print(f"  WARNING: {cls_path}: duplicate class {name} "
+                          f"(see {by_name[name]['path']}), skipping")
+            owners = {name: model["path"] for name, model in by_name.items()}
+            phases, cycles = order_classes({name: model["info"] for name, model in by_name.items()})
+            with store_lock(STORE_DIR):
+                write_export(OUTPUT_FILE, None,
+                             (by_name[name]["xml"] for phase in phases for name in phase))
+                write_phases(PHASES_FILE, phases, cycles)
+
+            elapsed = (time.perf_counter() - start) * 1000
+            print(f"  [{time.strftime('%H:%M:%S')}] {len(touched)} changed, {len(removed)} removed, "
+                  f"{len(by_name)} classes, rebuilt in {elapsed:.0f} ms")
+    except KeyboardInterrupt:
+        print()
+
+
+def reverse_export(export_file: Path, out_dir: Path) -> tuple:
+    """Write each <Class> of an IRIS XML export as out_dir/Pkg/Name.cls.
+
+    Returns (classes written, other items skipped).
+    """
+    written = 0
+    skipped = 0
+    with open_export(export_file) as stream:
+        for tag, name, udl in iter_reverse(stream):
+            if udl is None:
+                print(f"  Skipping <{tag} name=\"{name}\">")
+                skipped += 1
+                continue
+            target = out_dir / (name.replace(".", "/") + ".cls")
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_text(udl, encoding="utf-8")
+            print(f"  Wrote {target}")
+            written += 1
+    return written, skipped
+
+
+def plain_name(name: str) -> str:
+    """An export file name without its compression suffix."""
+    for suffix in COMPRESSION_SUFFIXES.values():
+        name = name.removesuffix(suffix)
+    return name
+
+
+def verify(export_file: Path) -> bool:
+    """Check an export is well-formed and holds the classes its version's
+    manifest (or, for a delta, the delta record) lists. Returns True if so."""
+    from xml.etree.ElementTree import ParseError
+
+    start = time.perf_counter()
+    try:
+        result = verify_export(export_file)
+    except ParseError as e:
+        print(f"Verify:    {export_file}: NOT well-formed: {e}")
+        return False
+    size = export_file.stat().st_size
+    elapsed = (time.perf_counter() - start) * 1000
+    print(f"Verify:    {export_file}")
+    print(f"Size:      {size} bytes on disk, {result['bytes']} bytes of XML "
+          f"({size / max(result['bytes'], 1):.1%})")
+    print(f"Classes:   {len(result['classes'])} (+{result['other']} other item(s)), "
+          f"well-formed, {elapsed:.0f} ms")
+    print(f"SHA-256:   {result['sha256']}")
+
+    version = result["version"]
+    if version is None:
+        # A canonical export: find the version that recorded these bytes
+        version = next((v for v in reversed(stored_versions(STORE_DIR))
+                        if load_manifest(STORE_DIR, v).get("sha256") == result["sha256"]), None)
+    try:
+        manifest = load_manifest(STORE_DIR, int(version))
+    except (TypeError, ValueError, FileNotFoundError):
+        print(f"Manifest:  none stored for exportversion {version or '(canonical, no match)'}, "
+              f"class count not checked")
+        return True
+    delta = manifest.get("delta")
+    if delta is not None and plain_name(delta["file"]) == plain_name(export_file.name):
+        expected = sorted(delta["added"] + delta["changed"])
+        label = f"v{version} delta since v{delta['since']}"
     else:
-        # Fallback: extract method name at minimum
-        m2 = re.match(rf'{keyword}\s+(\w+)', decl)
-        if m2:
-            method["name"] = m2.group(1)
-            # Get everything between parens
-            paren_m = re.search(r'\(([^)]*)\)', decl)
-            if paren_m:
-                method["formal_spec"] = paren_m.group(1).strip()
-            ret_m = re.search(r'As\s+([\w.%]+)', decl)
-            if ret_m:
-                method["return_type"] = ret_m.group(1)
-            kw_m = re.search(r'\[(.+?)\]\s*$', decl)
-            if kw_m:
-                method["keywords"] = parse_bracket_keywords(kw_m.group(1))
-
-    # Find opening brace
-    i = start
-    while i < len(lines) and "{" not in lines[i]:
-        i += 1
-    i += 1  # skip the line with {
-
-    # Collect method body until matching }
-    brace_depth = 1
-    body_lines = []
-    while i < len(lines) and brace_depth > 0:
-        body_line = lines[i]
-        brace_depth += body_line.count("{") - body_line.count("}")
-        if brace_depth > 0:
-            body_lines.append(body_line)
-        elif brace_depth == 0:
-            # Last line — check if there's content before the closing }
-            last = body_line.rstrip()
-            if last != "}":
-                # Content on same line as closing brace
-                idx = last.rfind("}")
-                if idx > 0:
-                    body_lines.append(last[:idx])
-        i += 1
-
-    method["implementation"] = body_lines
-
-    if not method["name"]:
-        return None, i
-    return method, i
-
-
-def parse_xdata(lines: list, start: int, desc: list) -> tuple:
-    """Parse an XData block."""
-    line = lines[start].strip()
-
-    # Parse: XData Name [ XMLNamespace = "..." ]
-    m = re.match(r'XData\s+(\w+)(?:\s*\[(.+?)\])?\s*$', line)
-    xdata = {
-        "name": m.group(1) if m else "Unknown",
-        "keywords": parse_bracket_keywords(m.group(2)) if m and m.group(2) else {},
-        "description": desc,
-        "data": [],
-    }
-
-    # Find opening brace
-    i = start
-    while i < len(lines) and "{" not in lines[i]:
-        i += 1
-    i += 1  # skip opening brace line
-
-    # Collect until matching closing brace of the XData block.
-    # Count all braces so XData can safely contain JavaScript/JSON blocks.
-    brace_depth = 1
-    while i < len(lines) and brace_depth > 0:
-        body_line = lines[i]
-        brace_depth += body_line.count("{") - body_line.count("}")
-        if brace_depth > 0:
-            xdata["data"].append(body_line)
-        elif brace_depth == 0:
-            # Content before the terminating brace on the same line
-            last = body_line.rstrip()
-            if last != "}":
-                idx = last.rfind("}")
-                if idx > 0:
-                    xdata["data"].append(last[:idx])
-        i += 1
-
-    return xdata, i
-
-
-def parse_storage(lines: list, start: int) -> tuple:
-    """Parse a Storage block (pass through as raw text)."""
-    line = lines[start].strip()
-    m = re.match(r'Storage\s+(\w+)\s*', line)
-    name = m.group(1) if m else "Default"
-
-    # Find opening brace
-    i = start
-    while i < len(lines) and "{" not in lines[i]:
-        i += 1
-    i += 1
-
-    # Collect raw storage XML until closing }
-    storage_lines = []
-    brace_depth = 1
-    while i < len(lines) and brace_depth > 0:
-        sline = lines[i]
-        stripped = sline.strip()
-        if stripped == "}":
-            brace_depth -= 1
-            if brace_depth == 0:
-                i += 1
-                break
-        storage_lines.append(sline)
-        i += 1
-
-    return {"name": name, "data": storage_lines}, i
-
-
-def class_to_xml(cls_data: dict) -> str:
-    """Convert parsed class data to IRIS XML export format."""
-    parts = []
-
-    # Open Class element
-    parts.append(f'<Class name="{cls_data["name"]}">')
-
-    # Description
-    if cls_data["description"]:
-        desc_text = "\n".join(cls_data["description"])
-        parts.append(f"<Description>{escape_xml(desc_text)}</Description>")
-
-    # Super
-    if cls_data["super"]:
-        parts.append(f'<Super>{escape_xml(cls_data["super"])}</Super>')
-
-    # Class keywords
-    for key, val in cls_data.get("class_keywords", {}).items():
-        if key == "DependsOn":
-            parts.append(f"<DependsOn>{escape_xml(val)}</DependsOn>")
-        elif key == "Abstract":
-            parts.append("<Abstract>1</Abstract>")
-        elif key == "CompileAfter":
-            parts.append(f"<CompileAfter>{escape_xml(val)}</CompileAfter>")
-
-    # Parameters
-    for param in cls_data["parameters"]:
-        parts.append(f'<Parameter name="{param["name"]}">')
-        if param.get("description"):
-            parts.append(f"<Description>{escape_xml(chr(10).join(param['description']))}</Description>")
-        if param.get("type"):
-            parts.append(f"<Type>{param['type']}</Type>")
-        if param.get("default", "") != "":
-            parts.append(f"<Default>{escape_xml(param['default'])}</Default>")
-        parts.append("</Parameter>")
-        parts.append("")
-
-    # Properties
-    for prop in cls_data["properties"]:
-        parts.append(f'<Property name="{prop["name"]}">')
-        if prop.get("description"):
-            parts.append(f"<Description>{escape_xml(chr(10).join(prop['description']))}</Description>")
-        if prop.get("type"):
-            parts.append(f"<Type>{prop['type']}</Type>")
-        # Type parameters (MAXLEN, etc.)
-        if prop.get("type_params"):
-            for tp in re.findall(r'(\w+)\s*=\s*(\S+)', prop["type_params"]):
-                parts.append(f'<Parameter name="{tp[0]}" value="{tp[1]}"/>')
-        # Keywords (InitialExpression, etc.)
-        for key, val in prop.get("keywords", {}).items():
-            if key == "InitialExpression":
-                # Strip UDL expression braces: {$zdatetime($h,3,1)} -> $zdatetime($h,3,1)
-                # In UDL, {..} means "ObjectScript expression". XML stores the raw expression.
-                expr = val
-                if expr.startswith("{") and expr.endswith("}"):
-                    expr = expr[1:-1]
-                parts.append(f"<InitialExpression>{escape_xml(expr)}</InitialExpression>")
-            elif key == "Required":
-                parts.append("<Required>1</Required>")
-            elif key == "Private":
-                parts.append("<Private>1</Private>")
-            elif key == "Calculated":
-                parts.append("<Calculated>1</Calculated>")
-        parts.append("</Property>")
-        parts.append("")
-
-    # Indices
-    for idx in cls_data.get("indices", []):
-        parts.append(f'<Index name="{idx["name"]}">')
-        if idx.get("description"):
-            parts.append(f"<Description>{escape_xml(chr(10).join(idx['description']))}</Description>")
-        parts.append(f"<Properties>{escape_xml(idx['properties'])}</Properties>")
-        for key, val in idx.get("keywords", {}).items():
-            if key == "Unique":
-                parts.append("<Unique>1</Unique>")
-            elif key == "Type":
-                parts.append(f"<Type>{escape_xml(val)}</Type>")
-        parts.append("</Index>")
-        parts.append("")
-
-    # Methods
-    for method in cls_data["methods"]:
-        parts.append(f'<Method name="{method["name"]}">')
-        if method.get("description"):
-            parts.append(f"<Description>{escape_xml(chr(10).join(method['description']))}</Description>")
-        if method["is_class_method"]:
-            parts.append("<ClassMethod>1</ClassMethod>")
-        if method.get("formal_spec"):
-            xml_spec = udl_formalspec_to_xml(method["formal_spec"])
-            parts.append(f"<FormalSpec>{escape_xml(xml_spec)}</FormalSpec>")
-        if method.get("return_type"):
-            parts.append(f"<ReturnType>{method['return_type']}</ReturnType>")
-        for key, val in method.get("keywords", {}).items():
-            if key == "Private":
-                parts.append("<Private>1</Private>")
-            elif key == "Abstract":
-                parts.append("<Abstract>1</Abstract>")
-
-        # Implementation
-        impl_text = "\n".join(method["implementation"])
-        parts.append(f"<Implementation><![CDATA[\n{impl_text}\n]]></Implementation>")
-        parts.append("</Method>")
-        parts.append("")
-
-    # XData blocks
-    for xdata in cls_data["xdata"]:
-        parts.append(f'<XData name="{xdata["name"]}">')
-        if xdata.get("description"):
-            parts.append(f"<Description>{escape_xml(chr(10).join(xdata['description']))}</Description>")
-        # XMLNamespace must be a child element, not an attribute
-        if "XMLNamespace" in xdata.get("keywords", {}):
-            parts.append(f'<XMLNamespace>{escape_xml(xdata["keywords"]["XMLNamespace"])}</XMLNamespace>')
-        # MimeType if present
-        if "MimeType" in xdata.get("keywords", {}):
-            parts.append(f'<MimeType>{escape_xml(xdata["keywords"]["MimeType"])}</MimeType>')
-        xdata_content = "\n".join(xdata["data"])
-        parts.append(f"<Data><![CDATA[\n{xdata_content}\n]]></Data>")
-        parts.append("</XData>")
-        parts.append("")
-
-    # Storage blocks
-    for storage in cls_data.get("storage", []):
-        parts.append(f'<Storage name="{storage["name"]}">')
-        storage_content = "\n".join(storage["data"])
-        # Storage usually contains XML elements directly
-        parts.append(storage_content)
-        parts.append("</Storage>")
-        parts.append("")
-
-    parts.append("</Class>")
-    return "\n".join(parts)
-
-
-def escape_xml(text: str) -> str:
-    """Escape XML special characters (but not in CDATA sections)."""
-    return (text
-            .replace("&", "&amp;")
-            .replace("<", "&lt;")
-            .replace(">", "&gt;")
-            .replace('"', "&quot;"))
+        expected = sorted(manifest["classes"])
+        label = f"v{version} manifest"
+    missing = sorted(set(expected) - set(result["classes"]))
+    extra = sorted(set(result["classes"]) - set(expected))
+    duplicates = len(result["classes"]) - len(set(result["classes"]))
+    if not missing and not extra and not duplicates:
+        print(f"Manifest:  matches {label} ({len(expected)} classes)")
+        return True
+    print(f"Manifest:  MISMATCH with {label}: expected {len(expected)} classes")
+    for name in missing:
+        print(f"  missing: {name}")
+    for name in extra:
+        print(f"  unexpected: {name}")
+    if duplicates:
+        print(f"  {duplicates} duplicate class(es)")
+    return False
+
+
+def load_push_state() -> dict:
+    try:
+        return json.loads(PUSH_STATE_FILE.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return {}
+
+
+def save_push_state(state: dict) -> None:
+    tmp = PUSH_STATE_FILE.with_name(f"{PUSH_STATE_FILE.name}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(state, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+    os.replace(tmp, PUSH_STATE_FILE)
+
+
+def push(args) -> bool:
+    """Upload changed classes over the Atelier API and compile them.
+
+    Returns True if every pushed class compiled.
+    """
+    from atelier import AtelierClient, push_classes
+
+    start = time.perf_counter()
+    target = f"{args.push.rstrip('/')}/{args.namespace.upper()}"
+    state = load_push_state()
+    pushed = state.get(target, {})
+
+    print(f"Push:      {CLS_DIR} -> {target}")
+    entries, _, _, plan_errors = plan_entries(collect_entries([CLS_DIR]))
+    for err in plan_errors:
+        print(f"  WARNING: {err}, skipping")
+    changed = []
+    current = {}
+    for entry in entries:
+        source = entry["file"].read_text(encoding="utf-8")
+        digest = hashlib.sha256(source.encode("utf-8")).hexdigest()
+        current[entry["name"]] = digest
+        if args.force or pushed.get(entry["name"]) != digest:
+            changed.append((entry["name"], source))
+    deleted = sorted(pushed.keys() - current.keys())
+
+    if not changed:
+        print(f"Classes:   all {len(entries)} up to date, nothing to push")
+    else:
+        client = AtelierClient(args.push, args.namespace,
+                               os.environ.get("IRIS_USER", "_SYSTEM"),
+                               os.environ.get("IRIS_PASSWORD", "SYS"), jobs=args.push_jobs)
+        try:
+            results = push_classes(client, changed)
+        finally:
+            client.close()
+        for result in results:
+            if result["compiled"]:
+                pushed[result["name"]] = current[result["name"]]
+                print(f"  OK    {result['name']} ({result['seconds'] * 1000:.0f} ms upload)")
+            else:
+                pushed.pop(result["name"], None)
+                print(f"  FAIL  {result['name']}: {result['error']}")
+        failed = sum(not result["compiled"] for result in results)
+        print(f"Classes:   {len(results) - failed} compiled, {failed} failed, "
+              f"{len(entries) - len(results)} unchanged")
+
+    for name in deleted:
+        pushed.pop(name)
+        print(f'  deleted locally: {name} — remove with do $system.OBJ.Delete("{name}")')
+    state[target] = pushed
+    save_push_state(state)
+    print(f"Time:      {(time.perf_counter() - start) * 1000:.0f} ms")
+    return all(pushed.get(name) == digest for name, digest in current.items())
+
+
+def member_summary(member: dict) -> str:
+    """A member row of the symbol index as a one-line UDL-style declaration."""
+    kind, name, signature = member["kind"], member["name"], member["signature"]
+    if kind in ("ClassMethod", "Method"):
+        text = f"{kind} {signature}"
+    elif kind == "Property":
+        text = f"Property {name} As {signature}"
+    elif kind == "Parameter":
+        text = f"Parameter {name}" + (f' = "{signature}"' if signature else "")
+    elif kind == "Index":
+        text = f"Index {name} On {signature}"
+    else:
+        text = f"{kind} {name}"
+    return text + (f" [ {member['keywords']} ]" if member["keywords"] else "")
+
+
+def lookup(symbol: str) -> bool:
+    """Print what the symbol index knows about symbol; False if nothing."""
+    if not SYMBOLS_FILE.exists():
+        raise SystemExit(f"ERROR: {SYMBOLS_FILE.name} does not exist; "
+                         f"run an export with --symbols first")
+    conn = open_symbols(SYMBOLS_FILE)
+    start = time.perf_counter()
+    try:
+        found = lookup_symbol(conn, symbol)
+    finally:
+        conn.close()
+    elapsed = time.perf_counter() - start
+
+    for cls in found["classes"]:
+        extends = f" Extends {cls['super']}" if cls["super"] else ""
+        print(f"Class {cls['name']}{extends}")
+        print(f"    {cls['path']} ({cls['lines']} lines, source sha256 {cls['sha256'][:12]})")
+    for member in found["members"]:
+        print(f"{member['class']}: {member_summary(member)}")
+        print(f"    {member['path']}:{member['start_line']}-{member['end_line']}")
+    if found["callers"]:
+        print(f"Referenced from {len(found['callers'])} call site(s):")
+        for call in found["callers"]:
+            target = f"{call['target_class']}.{call['target_member']}".rstrip(".")
+            print(f"  {call['path']}:{call['line']}  {call['class']}.{call['member']} -> {target}")
+    if not any(found.values()):
+        print(f"{symbol}: not found in {SYMBOLS_FILE.name}")
+    print(f"({elapsed * 1000:.2f} ms)")
+    return any(found.values())
+
+
+def index_knowledge(conn) -> tuple:
+    """Re-chunk the knowledge/*.md documents whose content changed;
+    returns (names of all of them, number re-chunked)."""
+    known = indexed_documents(conn, "markdown")
+    names = []
+    rechunked = 0
+    for path in sorted(KNOWLEDGE_DIR.glob("*.md")):
+        name = f"{KNOWLEDGE_DIR.name}/{path.name}"
+        text = path.read_text(encoding="utf-8")
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        names.append(name)
+        if known.get(name) != digest:
+            update_document(conn, name, "markdown", name, digest, markdown_chunks(text, path.name))
+            rechunked += 1
+    return names, rechunked
+
+
+def search_index(query: str, top: int, json_file=None) -> bool:
+    """Print (or write as JSON) the best chunks for query; False if none."""
+    if not RETRIEVAL_FILE.exists():
+        raise SystemExit(f"ERROR: {RETRIEVAL_FILE.name} does not exist; "
+                         f"run an export with --retrieval first")
+    conn = open_retrieval(RETRIEVAL_FILE)
+    start = time.perf_counter()
+    try:
+        results = search(conn, query, top)
+    finally:
+        conn.close()
+    elapsed = time.perf_counter() - start
+
+    if json_file is not None:
+        text = json.dumps({"query": query, "ms": round(elapsed * 1000, 3), "results": results},
+                          indent=2, ensure_ascii=False) + "\n"
+        if json_file == "-":
+            print(text, end="")
+            return bool(results)
+        Path(json_file).write_text(text, encoding="utf-8")
+    for rank, result in enumerate(results, 1):
+        first = next((line.strip() for line in result["text"].split("\n") if line.strip()), "")
+        print(f"{rank}. {result['title']}  (score {result['score']:.2f})")
+        print(f"    {result['path']}:{result['start_line']}-{result['end_line']}  {first[:72]}")
+    if not results:
+        print(f"{query}: nothing found in {RETRIEVAL_FILE.name}")
+    if json_file is not None:
+        print(f"Results:   {json_file}")
+    print(f"({elapsed * 1000:.2f} ms)")
+    return bool(results)
+
+
+def ndjson_export(args) -> bool:
+    """Stream GenerationClass NDJSON records into one export document.
+
+    Returns True if every record was exported without errors.
+    """
+    import sys
+
+    log = sys.stderr
+    start = time.perf_counter()
+    if args.out is None and args.compress:
+        raise SystemExit("ERROR: --compress with --ndjson needs --out FILE")
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    reader = sys.stdin if args.ndjson == "-" else open(args.ndjson, encoding="utf-8")
+    label = "<stdin>" if args.ndjson == "-" else args.ndjson
+    tmp = args.out.with_name(f"{args.out.name}.{os.getpid()}.tmp") if args.out else None
+    writer = open_compressed(tmp, args.compress, "\n" if args.canonical else None) if tmp else sys.stdout
+
+    classes = 0
+    errors = []
+    skipped = []
+    diagnostics = []
+    try:
+        writer.write(export_header(None if args.canonical else 1))
+        for entry in iter_rendered(iter_ndjson(reader, label), jobs, None, "",
+                                   canonical=args.canonical):
+            if isinstance(entry["error"], NotAClass):
+                print(f"  {entry['path']}: WARNING: {entry['error']}", file=log)
+                skipped.append(entry["path"])
+                continue
+            if entry["error"] is not None:
+                print(f"  {entry['path']}: ERROR: {entry['error']}", file=log)
+                errors.append(entry["path"])
+                continue
+            writer.write(entry["xml"])
+            writer.write("\n\n")
+            if tmp is None:
+                writer.flush()
+            classes += 1
+            status = diagnostic_status(entry["diagnostics"]) if entry["diagnostics"] else "OK"
+            print(f"  Processing {entry['name']} ... {status}", file=log)
+            for diagnostic in entry["diagnostics"]:
+                print(f"    {diagnostic}", file=log)
+            diagnostics.extend(entry["diagnostics"])
+        writer.write("</Export>")
+        if args.strict and any(d.severity == "error" for d in diagnostics) and tmp:
+            raise SystemExit(f"ERROR: {diagnostic_status(diagnostics)} found; "
+                             f"--strict, so {args.out} was not written")
+    except BaseException:
+        if tmp:
+            writer.close()
+            tmp.unlink(missing_ok=True)
+        raise
+    finally:
+        if reader is not sys.stdin:
+            reader.close()
+    if tmp:
+        writer.close()
+        os.replace(tmp, args.out)
+    else:
+        writer.flush()
+
+    print(f"Classes:   {classes} exported, {len(skipped)} non-class record(s) skipped, "
+          f"{len(errors)} record(s) failed"
+          + (f" -> {args.out}" if args.out else ""), file=log)
+    print(f"Checks:    {diagnostic_status(diagnostics)}", file=log)
+    print(f"Time:      {(time.perf_counter() - start) * 1000:.0f} ms", file=log)
+    if args.diagnostics_json is not None:
+        write_diagnostics(args.diagnostics_json, diagnostics)
+    failed = errors or any(d.severity == "error" for d in diagnostics)
+    return not failed
+
+
+def load_batch_config(path: Path) -> dict:
+    """Read a --batch config: {"roots": [dir, ...], "packages": [glob, ...],
+    "out": dir}. Paths are relative to the config file."""
+    try:
+        config = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError) as e:
+        raise SystemExit(f"ERROR: cannot read batch config {path}: {e}")
+    base = path.resolve().parent
+    roots = config.get("roots")
+    patterns = config.get("packages")
+    if not isinstance(roots, list) or not roots or not all(isinstance(r, str) for r in roots):
+        raise SystemExit(f"ERROR: {path}: \"roots\" must be a list of directories")
+    if not isinstance(patterns, list) or not patterns or not all(
+            isinstance(p, str) and p for p in patterns):
+        raise SystemExit(f"ERROR: {path}: \"packages\" must be a list of package globs")
+    roots = [base / root for root in roots]
+    for root in roots:
+        if not root.is_dir():
+            raise SystemExit(f"ERROR: {path}: source root {root} is not a directory")
+    return {"roots": roots, "packages": patterns, "out": base / config.get("out", "exports")}
+
+
+def batch_export(args, use_cache: bool) -> bool:
+    """Export every package a batch config selects, one file per package,
+    from one scan of the source roots and one render pass.
+
+    Returns True if every class was exported without errors.
+    """
+    start = time.perf_counter()
+    config = load_batch_config(args.batch)
+    out_dir = args.out or config["out"]
+    patterns = config["packages"]
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    suffix = COMPRESSION_SUFFIXES[args.compress] if args.compress else ""
+    newline = "\n" if args.canonical else None
+    fingerprint = generator_fingerprint() if use_cache else ""
+
+    print(f"IRIS Copilot — XML Export Generator (batch)")
+    print(f"===================================")
+    print(f"Config:  {args.batch}")
+    for root in config["roots"]:
+        print(f"Source:  {root}")
+    print(f"Output:  {out_dir}")
+    print()
 
+    entries, _, cycles, errors = plan_entries(collect_entries(config["roots"]))
+    for err in errors:
+        print(f"  WARNING: {err}, skipping")
+    rows = {}
+    selected = []
+    for entry in entries:
+        entry["package"] = export_package(entry["name"], patterns)
+        if entry["package"]:
+            selected.append(entry)
+            rows.setdefault(entry["package"], {"classes": 0, "phases": set(), "cached": 0,
+                                               "errors": 0, "warnings": 0, "seconds": 0.0})
+    # Packages in load order: one package depends on another when any of
+    # its classes does, so each export can be loaded after the ones above.
+    by_name = {entry["name"]: entry["package"] for entry in selected}
+    package_deps = {package: {"hard": set(), "soft": set()} for package in rows}
+    for entry in selected:
+        package_deps[entry["package"]]["hard"].update(
+            by_name[dep] for dep in entry["deps"] if dep in by_name)
+    package_phases, package_cycles = order_classes(package_deps)
+    load_order = [package for phase in package_phases for package in phase]
+    unmatched = [pattern for pattern in patterns
+                 if not any(export_package(entry["name"], [pattern]) for entry in entries)]
+    for pattern in unmatched:
+        print(f"  WARNING: no classes match package pattern {pattern}")
+    plan_time = time.perf_counter() - start
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    targets = {package: out_dir / f"{package}.xml{suffix}" for package in rows}
+    tmps = {package: target.with_name(f"{target.name}.{os.getpid()}.tmp")
+            for package, target in targets.items()}
+    diagnostics = []
+    try:
+        with ExitStack() as stack:
+            writers = {package: stack.enter_context(open_compressed(tmp, args.compress, newline))
+                       for package, tmp in tmps.items()}
+            for writer in writers.values():
+                writer.write(export_header(None if args.canonical else 1))
+            cache_dir = CACHE_DIR if use_cache else None
+            for entry in iter_rendered(selected, jobs, cache_dir, fingerprint,
+                                       canonical=args.canonical):
+                row = rows[entry["package"]]
+                print(f"  [{entry['package']}] {entry['name']} ...", end=" ")
+                if entry["error"] is not None:
+                    print(f"ERROR: {entry['error']}")
+                    errors.append(f"{entry['path']}: {entry['error']}")
+                    row["errors"] += 1
+                    continue
+                if entry["cached"]:
+                    row["cached"] += 1
+                elif use_cache and not entry["diagnostics"]:
+                    cache_store(CACHE_DIR, entry["key"], entry["xml"])
+                writers[entry["package"]].write(entry["xml"])
+                writers[entry["package"]].write("\n\n")
+                entry["xml"] = None
+                row["classes"] += 1
+                row["phases"].add(entry["phase"])
+                row["seconds"] += sum(entry["stats"].get(stage, 0.0) for stage in STAT_STAGES
+                                      if stage not in ("escape", "validate"))
+                row["errors"] += sum(d.severity == "error" for d in entry["diagnostics"])
+                row["warnings"] += sum(d.severity != "error" for d in entry["diagnostics"])
+                diagnostics.extend(entry["diagnostics"])
+                print(diagnostic_status(entry["diagnostics"]) if entry["diagnostics"]
+                      else "OK (cached)" if entry["cached"] else "OK")
+                for diagnostic in entry["diagnostics"]:
+                    print(f"    {diagnostic}")
+            if args.strict and any(d.severity == "error" for d in diagnostics):
+                if args.diagnostics_json is not None:
+                    write_diagnostics(args.diagnostics_json, diagnostics)
+                raise SystemExit(f"\nERROR: {diagnostic_status(diagnostics)} found; "
+                                 f"--strict, so nothing was published")
+            for writer in writers.values():
+                writer.write("</Export>")
+    except BaseException:
+        for tmp in tmps.values():
+            tmp.unlink(missing_ok=True)
+        raise
+    for package, tmp in tmps.items():
+        os.replace(tmp, targets[package])
 
-def get_next_version() -> int:
-    """Read and increment the version counter."""
-    version = 1
-    if VERSION_FILE.exists():
-        try:
-            version = int(VERSION_FILE.read_text().strip()) + 1
-        except ValueError:
-            version = 1
-    VERSION_FILE.write_text(str(version))
-    return version
+    print()
+    print(f"===================================")
+    width = max([len("Package")] + [len(package) for package in rows])
+    print(f"{'Package':<{width}} {'Classes':>7} {'Phases':>6} {'Cached':>6} {'Errors':>6} "
+          f"{'Warn':>5} {'KB':>8} {'ms':>7}")
+    for package in load_order:
+        row = rows[package]
+        size = targets[package].stat().st_size
+        print(f"{package:<{width}} {row['classes']:>7} {len(row['phases']):>6} {row['cached']:>6} "
+              f"{row['errors']:>6} {row['warnings']:>5} {size / 1024:>8.1f} "
+              f"{row['seconds'] * 1000:>7.1f}")
+    print(f"{'Total':<{width}} {sum(row['classes'] for row in rows.values()):>7}")
+    print()
+    print(f"Packages:  {len(rows)} export(s) in {out_dir}, listed in load order")
+    for cycle in package_cycles:
+        print(f"  packages that depend on each other: {', '.join(cycle)}")
+    print(f"Skipped:   {len(entries) - len(selected)} class(es) outside the package patterns")
+    for cycle in cycles:
+        print(f"  cycle (shared phase): {', '.join(cycle)}")
+    print(f"Jobs:      {jobs}")
+    print(f"Checks:    {diagnostic_status(diagnostics)}")
+    if args.diagnostics_json is not None:
+        write_diagnostics(args.diagnostics_json, diagnostics)
+        print(f"           {args.diagnostics_json}")
+    print(f"Errors:    {len(errors)}")
+    for err in errors:
+        print(f"  - {err}")
+    print(f"Time:      {(time.perf_counter() - start) * 1000:.0f} ms "
+          f"(plan {plan_time * 1000:.0f} ms)")
+    return not errors and not any(d.severity == "error" for d in diagnostics)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Generate a single IRIS XML export from the AIAgent UDL .cls files.",
+        epilog="Without a mode option the export is written to AIAgent-export.xml, with a "
+               "versioned copy and a manifest in the store. The modes (--watch, --push, "
+               "--batch, --ndjson, --lookup, --search, --verify, --reverse, --rebuild, --gc) "
+               "replace that run, cannot be combined and take only their own options; see "
+               "DEPLOY-README.md for each.")
+    modes = parser.add_mutually_exclusive_group()
+    parser.add_argument("--no-cache", action="store_true",
+                        help="ignore and do not update the fragment cache in .export-cache/")
+    parser.add_argument("--jobs", "-j", type=int, default=1, metavar="N",
+                        help="render classes on N worker processes (0 = one per CPU, default 1); "
+                             "the output is identical to a serial run")
+    parser.add_argument("--since", type=int, metavar="N",
+                        help="also write AIAgent-export-vM-since-vN.xml with the classes added or "
+                             "changed since version N")
+    modes.add_argument("--watch", action="store_true",
+                        help="keep running and rewrite the export whenever cls/ changes, re-rendering "
+                             "only the touched classes; no version is allocated")
+    parser.add_argument("--interval", type=float, default=0.25, metavar="SECONDS",
+                        help="polling interval for --watch (default 0.25)")
+    modes.add_argument("--rebuild", type=int, metavar="N",
+                        help="write AIAgent-export-vN.xml from the manifest and fragments in "
+                             ".export-store/ and exit")
+    parser.add_argument("--shard", choices=SHARD_MODES, metavar="MODE",
+                        help="also write one export per class or per phase (MODE: class, phase) "
+                             "plus an index to AIAgent-export-shards/")
+    parser.add_argument("--compress", choices=sorted(COMPRESSION_SUFFIXES), metavar="METHOD",
+                        help="write the versioned copy and delta compressed (METHOD: gzip, zstd; "
+                             "zstd needs Python 3.14+ or zstandard)")
+    modes.add_argument("--verify", type=Path, metavar="EXPORT",
+                        help="stream a plain, gzip or zstd export through the XML parser, check its "
+                             "classes against the stored manifest and exit")
+    parser.add_argument("--canonical", action="store_true",
+                        help="byte-reproducible export: LF line endings, no trailing blanks outside "
+                             "member bodies, no version in the "
+                             "file, content-named copy, version and ETag in AIAgent-export.meta.json")
+    parser.add_argument("--strict", action="store_true",
+                        help="publish nothing if validation (]]> in bodies, unterminated blocks, "
+                             "unescaped type parameters, ...) reports an error")
+    parser.add_argument("--diagnostics-json", type=Path, metavar="FILE",
+                        help="write the validation diagnostics as JSON")
+    parser.add_argument("--emit", action="append", default=[], metavar="FORMAT",
+                        choices=[name for name in EMITTERS if name != "xml"],
+                        help="also write the classes as FORMAT from the same parse: json "
+                             "(AIAgent-export.jsonl) or udl (AIAgent-export.udl); repeatable")
+    parser.add_argument("--symbols", action="store_true",
+                        help="also update the SQLite symbol index (AIAgent-export.symbols.db)")
+    modes.add_argument("--lookup", metavar="SYMBOL",
+                        help="print the definitions and call sites of Class, Member or Class.Member "
+                             "from the symbol index and exit")
+    parser.add_argument("--retrieval", action="store_true",
+                        help="also update the BM25 retrieval index of knowledge/ and the classes "
+                             "(AIAgent-export.retrieval.db)")
+    modes.add_argument("--search", metavar="QUERY",
+                        help="print the chunks of the retrieval index that best match QUERY and exit")
+    parser.add_argument("--top", type=int, default=5, metavar="K",
+                        help="number of --search results (default 5)")
+    parser.add_argument("--search-json", metavar="FILE",
+                        help="with --search, write the results as JSON to FILE (- for stdout)")
+    modes.add_argument("--gc", action="store_true",
+                        help="delete unreferenced fragments and rebuildable versioned copies, then exit")
+    parser.add_argument("--keep", type=int, metavar="K",
+                        help="with --gc, also drop all but the K newest version manifests (K >= 1)")
+    parser.add_argument("--stats", type=int, nargs="?", const=20, metavar="N",
+                        help="print per-stage totals and the N slowest classes (default 20)")
+    parser.add_argument("--stats-json", type=Path, metavar="FILE",
+                        help="write per-stage and per-class statistics as JSON")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="record each rendered class's tracemalloc peak (slower)")
+    modes.add_argument("--reverse", type=Path, metavar="EXPORT",
+                        help="convert an IRIS XML export back into UDL .cls files and exit")
+    parser.add_argument("--out", type=Path, metavar="PATH",
+                        help="--ndjson: the export file (default: stdout); --batch: the "
+                             "output directory (default: the config's out); --reverse: the "
+                             "output directory (default: cls/); not used by other modes")
+    modes.add_argument("--ndjson", metavar="FILE",
+                        help="build one export from GenerationClass NDJSON records in FILE "
+                             "(- for stdin), skipping records that are not classes, and exit")
+    modes.add_argument("--batch", type=Path, metavar="CONFIG",
+                        help="write one export per package for the source roots and package "
+                             "globs in the JSON file CONFIG and exit")
+    modes.add_argument("--push", metavar="URL",
+                        help="upload changed classes to IRIS at URL (http://host:port) over the "
+                             "Atelier REST API, compile them and exit; credentials come from "
+                             "IRIS_USER and IRIS_PASSWORD")
+    parser.add_argument("--namespace", default="USER", metavar="NS",
+                        help="target namespace for --push (default USER)")
+    parser.add_argument("--push-jobs", type=int, default=8, metavar="N",
+                        help="concurrent uploads for --push (default 8)")
+    parser.add_argument("--force", action="store_true",
+                        help="with --push, upload every class, not only changed ones")
+    args = parser.parse_args(argv)
+    if args.keep is not None and args.keep < 1:
+        parser.error(f"--keep must be at least 1, not {args.keep}: the newest version is "
+                     f"always kept")
+
+    mode = next((name for name in MODE_OPTIONS
+                 if name is not None and getattr(args, name) not in (None, False)
+                 or name == "rebuild" and args.rebuild is not None), None)
+    for name, value in vars(args).items():
+        if name in MODE_OPTIONS or name in MODE_OPTIONS[mode] or value == parser.get_default(name):
+            continue
+        option = "--" + name.replace("_", "-")
+        parser.error(f"{option} does not apply to --{mode}" if mode is not None
+                     else f"{option} needs " + " or ".join(
+                         f"--{m}" for m, options in MODE_OPTIONS.items() if name in options))
+    return args
 
 
-def main():
+def run_export(args, use_cache: bool) -> None:
+    """Write the next export version. Call with store_lock() held."""
+    fingerprint = generator_fingerprint() if use_cache else ""
+    base = load_version(args.since)["classes"] if args.since is not None else None
     version = get_next_version()
-    versioned_file = SCRIPT_DIR / f"AIAgent-export-v{version}.xml"
+    suffix = COMPRESSION_SUFFIXES[args.compress] if args.compress else ""
+    versioned_file = versioned_path(version, args.compress)   # renamed by content if canonical
+    delta_file = SCRIPT_DIR / f"AIAgent-export-v{version}-since-v{args.since}.xml{suffix}"
+    header_version = None if args.canonical else version
+    newline = "\n" if args.canonical else None
+    emitters = tuple(EMITTERS[name]() for name in dict.fromkeys(args.emit))
+    emit_files = {emitter.name: OUTPUT_FILE.with_suffix(emitter.suffix) for emitter in emitters}
 
     print(f"IRIS Copilot — XML Export Generator")
     print(f"===================================")
     print(f"Version: {version}")
     print(f"Source:  {CLS_DIR}")
     print(f"Output:  {OUTPUT_FILE}")
-    print(f"Copy:    {versioned_file}")
+    if args.canonical:
+        print(f"Copy:    {content_path('<sha256>', args.compress)} (canonical)")
+    else:
+        print(f"Copy:    {versioned_file}")
+    if base is not None:
+        print(f"Delta:   {delta_file}")
+    for path in emit_files.values():
+        print(f"Also:    {path}")
     print()
 
-    # Build the XML export document
-    xml_parts = []
-    xml_parts.append('<?xml version="1.0" encoding="UTF-8"?>')
-    xml_parts.append(f'<Export generator="IRIS" version="26" exportversion="{version}">')
-    xml_parts.append("")
-
     class_count = 0
     errors = []
-
-    for cls_path in CLASS_ORDER:
-        full_path = CLS_DIR / cls_path.replace("/", os.sep)
-        class_name = cls_path.replace("/", ".").replace(".cls", "")
-
-        if not full_path.exists():
-            print(f"  WARNING: {cls_path} not found, skipping")
-            errors.append(cls_path)
-            continue
-
-        print(f"  Processing {class_name} ...", end=" ")
-
-        try:
-            source = full_path.read_text(encoding="utf-8")
-            cls_data = parse_udl_class(source)
-
-            if not cls_data["name"]:
-                cls_data["name"] = class_name
-
-            xml_content = class_to_xml(cls_data)
-            xml_parts.append(xml_content)
-            xml_parts.append("")
-            class_count += 1
-            print("OK")
-        except Exception as e:
-            print(f"ERROR: {e}")
-            errors.append(f"{cls_path}: {e}")
-
-    xml_parts.append("</Export>")
-
-    # Write output — both latest and versioned copy
-    output_text = "\n".join(xml_parts)
-    OUTPUT_FILE.write_text(output_text, encoding="utf-8")
-    versioned_file.write_text(output_text, encoding="utf-8")
+    diagnostics = []
+    cache_hits = 0
+    cache_misses = 0
+    used_keys = set()
+    symbols = open_symbols(SYMBOLS_FILE) if args.symbols else None
+    indexed = indexed_classes(symbols) if symbols is not None else None
+    reindexed = 0
+    retrieval = open_retrieval(RETRIEVAL_FILE) if args.retrieval else None
+    retrieved = indexed_documents(retrieval, "class") if retrieval is not None else None
+    if retrieved is not None:
+        # Classes stale in either index get symbols from their parse
+        indexed = retrieved if indexed is None else {
+            name: digest for name, digest in indexed.items() if retrieved.get(name) == digest}
+    rechunked = 0
+
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    run_start = time.perf_counter()
+    class_stats = []
+
+    entries, phases, cycles, plan_errors = plan_entries(collect_entries([CLS_DIR]))
+    for err in plan_errors:
+        print(f"  WARNING: {err}, skipping")
+    errors.extend(plan_errors)
+    write_phases(PHASES_FILE, phases, cycles)
+    plan_time = time.perf_counter() - run_start
+
+    manifest = {"version": version, "classes": {}}
+    added = []
+    changed = []
+
+    # Stream the XML export document to a temp file, then rename into place.
+    # With --compress the versioned copy is compressed alongside it.
+    tmp_file = OUTPUT_FILE.with_name(f"{OUTPUT_FILE.name}.{os.getpid()}.tmp")
+    tmp_packed = versioned_file.with_name(f"{versioned_file.name}.{os.getpid()}.tmp")
+    tmp_delta = delta_file.with_name(f"{delta_file.name}.{os.getpid()}.tmp")
+    tmp_emitted = {name: path.with_name(f"{path.name}.{os.getpid()}.tmp")
+                   for name, path in emit_files.items()}
+    try:
+        with open(tmp_file, "w", encoding="utf-8", newline=newline) as out, \
+                (open_compressed(tmp_packed, args.compress, newline) if args.compress else nullcontext()) as packed, \
+                (open_compressed(tmp_delta, args.compress, newline) if base is not None else nullcontext()) as delta, \
+                ExitStack() as stack:
+            # --emit formats, each streamed to its own temp file
+            sinks = [(emitter, stack.enter_context(open(tmp_emitted[emitter.name], "w",
+                                                        encoding="utf-8")))
+                     for emitter in emitters]
+            out.write(export_header(header_version))
+            if packed is not None:
+                packed.write(export_header(header_version))
+            if delta is not None:
+                delta.write(export_header(header_version))
+            for emitter, sink in sinks:
+                sink.write(emitter.header(header_version))
+
+            cache_dir = CACHE_DIR if use_cache else None
+            for entry in iter_rendered(entries, jobs, cache_dir, fingerprint, args.trace_memory,
+                                       indexed, emitters, args.canonical):
+                print(f"  Processing {entry['name']} ...", end=" ")
+
+                if entry["error"] is not None:
+                    print(f"ERROR: {entry['error']}")
+                    errors.append(f"{entry['path']}: {entry['error']}")
+                    continue
+
+                stored = time.perf_counter()
+                if entry["key"] is not None:
+                    used_keys.add(entry["key"])
+                if entry["cached"]:
+                    cache_hits += 1
+                    status = "OK (cached)"
+                else:
+                    if use_cache:
+                        cache_misses += 1
+                        if not entry["diagnostics"]:
+                            cache_store(CACHE_DIR, entry["key"], entry["xml"])
+                    status = "OK"
+                if entry["diagnostics"]:
+                    diagnostics.extend(entry["diagnostics"])
+                    status = diagnostic_status(entry["diagnostics"])
+                digest = fragment_hash(entry["xml"])
+                store_object(STORE_DIR, digest, entry["xml"])
+                indexing = time.perf_counter()
+                if retrieval is not None and entry["symbols"] is not None \
+                        and retrieved.get(entry["name"]) != entry["sha256"]:
+                    # The parsed source is gone by now; the ranges index the file
+                    source = entry["file"].read_text(encoding="utf-8")
+                    if args.canonical:
+                        source = canonical_source(source)
+                    update_document(retrieval, entry["name"], "class",
+                                    f"{CLS_DIR.name}/{Path(entry['path']).as_posix()}",
+                                    entry["sha256"], class_chunks(entry["symbols"], source))
+                    rechunked += 1
+                chunked = time.perf_counter()
+                if symbols is not None:
+                    update_symbols(symbols, entry["name"], entry["path"], entry["sha256"],
+                                   entry["symbols"], digest)
+                    reindexed += entry["symbols"] is not None
+                    entry["symbols"] = None
+                written = time.perf_counter()
+                entry["stats"]["retrieval"] = chunked - indexing
+                entry["stats"]["index"] = written - chunked
+
+                out.write(entry["xml"])
+                out.write("\n\n")
+                if packed is not None:
+                    packed.write(entry["xml"])
+                    packed.write("\n\n")
+                for emitter, sink in sinks:
+                    sink.write(entry["outputs"][emitter.name])
+                    sink.write(emitter.separator)
+                entry["outputs"] = None
+                manifest["classes"][entry["name"]] = {"path": entry["path"], "sha256": digest,
+                                                      "phase": entry["phase"], "deps": entry["deps"]}
+                if delta is not None:
+                    previous = base.get(entry["name"])
+                    if previous is None or previous["sha256"] != digest:
+                        (added if previous is None else changed).append(entry["name"])
+                        delta.write(entry["xml"])
+                        delta.write("\n\n")
+                class_stats.append(class_stats_row(entry, indexing - stored,
+                                                   time.perf_counter() - written))
+                entry["xml"] = None
+                class_count += 1
+                print(status)
+                for diagnostic in entry["diagnostics"]:
+                    print(f"    {diagnostic}")
+
+            if args.strict and any(d.severity == "error" for d in diagnostics):
+                if args.diagnostics_json is not None:
+                    write_diagnostics(args.diagnostics_json, diagnostics)
+                raise SystemExit(f"\nERROR: {diagnostic_status(diagnostics)} found; "
+                                 f"--strict, so nothing was published")
+            out.write("</Export>")
+            if packed is not None:
+                packed.write("</Export>")
+            if delta is not None:
+                delta.write("</Export>")
+            for emitter, sink in sinks:
+                sink.write(emitter.footer())
+    except BaseException:
+        tmp_file.unlink(missing_ok=True)
+        tmp_packed.unlink(missing_ok=True)
+        tmp_delta.unlink(missing_ok=True)
+        for tmp in tmp_emitted.values():
+            tmp.unlink(missing_ok=True)
+        if symbols is not None:
+            symbols.close()     # uncommitted, so the index is left as it was
+        if retrieval is not None:
+            retrieval.close()
+        raise
+
+    # Publish — latest export by rename, versioned copy by hardlink. A
+    # canonical export that is byte-identical to the current one leaves
+    # the published files (and their mtimes) alone.
+    publish_start = time.perf_counter()
+    digest, size = file_digest(tmp_file)
+    manifest["sha256"] = digest
+    unchanged = False
+    if args.canonical:
+        manifest["canonical"] = True
+        versioned_file = content_path(digest, args.compress)
+        unchanged = OUTPUT_FILE.exists() and file_digest(OUTPUT_FILE)[0] == digest
+    if unchanged:
+        tmp_file.unlink()
+    else:
+        os.replace(tmp_file, OUTPUT_FILE)
+    for name, tmp in tmp_emitted.items():
+        os.replace(tmp, emit_files[name])
+    if args.canonical and versioned_file.exists():
+        tmp_packed.unlink(missing_ok=True)
+    elif args.compress:
+        os.replace(tmp_packed, versioned_file)
+    else:
+        publish_copy(OUTPUT_FILE, versioned_file)
+    meta = write_meta(version, digest, size, versioned_file, class_count, args.canonical)
+    if base is not None:
+        os.replace(tmp_delta, delta_file)
+        deleted = sorted(base.keys() - {entry["name"] for entry in entries})
+        manifest["delta"] = {"since": args.since, "file": delta_file.name,
+                             "added": added, "changed": changed, "deleted": deleted}
+    write_manifest(STORE_DIR, manifest)
+    index = write_shards(STORE_DIR, manifest, args.shard, SHARD_DIR) if args.shard else None
+    if symbols is not None:
+        unindexed = prune_symbols(symbols, [entry["name"] for entry in entries])
+        symbols.commit()
+        totals = [symbols.execute(f"SELECT count(*) FROM {table}").fetchone()[0]
+                  for table in ("classes", "members", "calls")]
+        symbols.close()
+    if retrieval is not None:
+        documents, rechunked_docs = index_knowledge(retrieval)
+        unretrieved = prune_documents(retrieval, documents + [entry["name"] for entry in entries])
+        retrieval.commit()
+        chunk_count, term_count = [retrieval.execute(f"SELECT count(*) FROM {table}").fetchone()[0]
+                                   for table in ("chunks", "terms")]
+        retrieval.close()
+
+    evicted = cache_evict(CACHE_DIR, used_keys) if use_cache else 0
+    stats = stats_report(class_stats, plan_time, time.perf_counter() - publish_start,
+                         time.perf_counter() - run_start, jobs)
 
     print()
     print(f"===================================")
     print(f"Generated: {OUTPUT_FILE}")
+    for path in emit_files.values():
+        print(f"           {path}")
     print(f"Versioned: {versioned_file}")
-    print(f"Version:   v{version}")
-    print(f"Classes:   {class_count} / {len(CLASS_ORDER)}")
+    if args.compress:
+        print(f"           {versioned_file.stat().st_size} bytes {args.compress}, "
+              f"{OUTPUT_FILE.stat().st_size} uncompressed")
+    print(f"Version:   v{version}" + (f" (in {META_FILE.name}, not the export)" if args.canonical else ""))
+    print(f"ETag:      {meta['etag']}"
+          + (f", unchanged since v{meta['first_version']}" if meta["first_version"] != version else ""))
+    print(f"Classes:   {class_count} / {len(entries)}")
+    print(f"Phases:    {len(phases)} (see {PHASES_FILE.name})")
+    for number, phase in enumerate(phases, 1):
+        print(f"  {number}. {', '.join(phase)}")
+    for cycle in cycles:
+        print(f"  cycle (shared phase): {', '.join(cycle)}")
+    print(f"Jobs:      {jobs}")
+    if base is not None:
+        print(f"Delta:     since v{args.since}: {len(added)} added, {len(changed)} changed, "
+              f"{len(deleted)} deleted")
+        print(f"           {delta_file}")
+        for name in deleted:
+            print(f'  deleted: {name} — remove with do $system.OBJ.Delete("{name}")')
+    if index is not None:
+        print_shards(index)
+    if symbols is not None:
+        print(f"Symbols:   {reindexed} reindexed, {len(entries) - reindexed} unchanged, "
+              f"{len(unindexed)} removed -> {SYMBOLS_FILE.name}")
+        print(f"           {totals[0]} classes, {totals[1]} members, {totals[2]} call sites")
+    if retrieval is not None:
+        print(f"Retrieval: {rechunked} class(es) and {rechunked_docs} document(s) re-chunked, "
+              f"{len(unretrieved)} removed -> {RETRIEVAL_FILE.name}")
+        print(f"           {chunk_count} chunks, {term_count} terms")
+    if use_cache:
+        print(f"Cache:     {cache_hits} hit(s), {cache_misses} miss(es), {evicted} evicted")
+    else:
+        print(f"Cache:     disabled")
+    if diagnostics:
+        print(f"Checks:    {diagnostic_status(diagnostics)} "
+              f"in {len({d.file for d in diagnostics})} class(es)")
+    else:
+        print(f"Checks:    0 problems")
+    if args.diagnostics_json is not None:
+        write_diagnostics(args.diagnostics_json, diagnostics)
+        print(f"           {args.diagnostics_json}")
     if errors:
         print(f"Errors:    {len(errors)}")
         for err in errors:
             print(f"  - {err}")
     else:
         print(f"Errors:    0")
+    if args.stats is not None:
+        print_stats(stats, args.stats)
+    if args.stats_json is not None:
+        args.stats_json.write_text(json.dumps(stats, indent=2) + "\n", encoding="utf-8")
+        print(f"Stats:     {args.stats_json}")
     print()
+    loadable = OUTPUT_FILE if args.compress else versioned_file
     print(f"To import in IRIS Studio:")
-    print(f"  Tools > Import Local > select AIAgent-export-v{version}.xml > Open")
+    print(f"  Tools > Import Local > select {loadable.name} > Open")
     print()
     print(f"To import via Terminal:")
-    print(f'  do $system.OBJ.Load("{versioned_file}", "ck")')
+    print(f'  do $system.OBJ.Load("{loadable}", "ck")')
+    if args.compress:
+        print(f"  ({versioned_file.name} must be decompressed before loading)")
+    if index is not None:
+        print(f'  do $system.OBJ.LoadDir("{SHARD_DIR}", "ck")   (all shards)')
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    use_cache = not args.no_cache
+    if args.compress == "zstd":
+        try:
+            zstd_module()
+        except ValueError as e:
+            raise SystemExit(f"ERROR: {e}")
+    if args.watch:
+        watch(args.interval, use_cache)
+        return
+    if args.push is not None:
+        if not push(args):
+            raise SystemExit(1)
+        return
+    if args.batch is not None:
+        if not batch_export(args, use_cache):
+            raise SystemExit(1)
+        return
+    if args.ndjson is not None:
+        if not ndjson_export(args):
+            raise SystemExit(1)
+        return
+    if args.lookup is not None:
+        if not lookup(args.lookup):
+            raise SystemExit(1)
+        return
+    if args.search is not None:
+        if not search_index(args.search, args.top, args.search_json):
+            raise SystemExit(1)
+        return
+    if args.verify is not None:
+        if not verify(args.verify):
+            raise SystemExit(1)
+        return
+    if args.reverse is not None:
+        written, skipped = reverse_export(args.reverse, args.out or CLS_DIR)
+        print(f"Classes:   {written} written, {skipped} other item(s) skipped")
+        return
+    with store_lock(STORE_DIR):
+        if args.rebuild is not None:
+            print(f"Rebuilt:   {rebuild_version(args.rebuild, args.compress)}")
+            if args.shard:
+                print_shards(write_shards(STORE_DIR, load_version(args.rebuild),
+                                          args.shard, SHARD_DIR))
+        elif args.gc:
+            removed = remove_garbage(args.keep)
+            print(f"Removed:   {removed['objects']} fragment(s), {removed['manifests']} manifest(s), "
+                  f"{removed['copies']} versioned copies")
+        else:
+            run_export(args, use_cache)
 
 
 if __name__ == "__main__":
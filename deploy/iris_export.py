@@ -0,0 +1,2889 @@
+"""
+UDL to IRIS XML export library.
+
+The engine behind generate-xml-export.py, importable on its own so deploy
+tooling can convert classes in-process instead of starting the script:
+
+    import iris_export
+
+    model = iris_export.parse(source)            # ClassDef
+    problems = iris_export.check(source)         # [Diagnostic]
+    for fragment in iris_export.export([Path("cls")]):
+        ...                                      # one <Class> per item
+    iris_export.export_to({"xml": xml_out, "udl": udl_out}, [Path("cls")])
+    with open(target, "w", encoding="utf-8") as out:
+        out.writelines(iris_export.export_document([Path("cls")], version=7))
+
+export() takes .cls files, directories of them and UDL source strings,
+orders the classes by dependency and yields their XML fragments one at a
+time. Caching (cache_dir=) and worker processes (jobs=) are opt-in.
+export_to() writes any number of formats (EMITTERS: IRIS XML, JSON lines
+of the parsed model, normalized UDL) from the same single parse.
+open_retrieval()/search() keep and query a BM25 index of class members
+and markdown sections for picking prompt context.
+Each class is validated while it renders; export(strict=True) raises on
+anything that would make the IRIS import fail.
+
+Importing the module only compiles its regular expressions: nothing is
+read, written or printed, and the heavier standard modules (process
+pools, ElementTree, json, tracemalloc, sqlite3) are imported by the
+functions that use them.
+"""
+
+import hashlib
+import os
+import re
+import time
+from collections import deque
+from collections.abc import Iterator, Sequence
+from contextlib import contextmanager
+from pathlib import Path
+
+
+def compile_tokens(plain: str, literals: tuple, structural: tuple = (), nesting: int = 3):
+    """Build and compile a lexer token pattern for scan_block().
+
+    plain is a character class of text that cannot hide a brace, literals
+    are the alternatives that can (strings, comments), and structural are
+    extra tokens the caller must handle (embedded code). A match skips text
+    and balanced {...} blocks up to `nesting` levels deep inside the regex
+    engine, then captures the next token: {, }, a structural token, or ""
+    at the end of the source. Most method bodies are consumed in a handful
+    of matches instead of one Python step per brace.
+
+    Atomic groups and possessive quantifiers need Python 3.11. Older
+    versions get the same tokens one brace at a time, since without them a
+    failed block attempt could backtrack exponentially.
+    """
+    skip = rf'{plain}*+(?>(?>{"|".join(literals)}){plain}*+)*+'
+    token = "|".join(("[{}]",) + tuple(structural) + (r"\Z",))
+    block = rf'\{{{skip}\}}'
+    for _ in range(nesting - 1):
+        block = rf'\{{{skip}(?>{block}{skip})*+\}}'
+    try:
+        return re.compile(rf'{skip}(?>{block}{skip})*+({token})', re.DOTALL)
+    except re.error:
+        skip = skip.replace("(?>", "(?:").replace("*+", "*")
+        return re.compile(rf'{skip}({token})', re.DOTALL)
+
+
+# Token patterns for the UDL lexer, one per body language.
+OBJECTSCRIPT_TOKENS = compile_tokens(
+    r'[^"/;&{}]',
+    (
+        r'"[^"\n]*+(?:""[^"\n]*+)*+"?',         # string literal, "" escapes a quote
+        r';[^\n]*+',                            # ; comment (also #; and ##;)
+        r'/(?:/[^\n]*+|\*.*?(?:\*/|\Z))?',      # // or /* */ comment, or a plain /
+        r'&(?!(?i:sql)\(|(?i:js|javascript|html)<)',
+    ),
+    (r'&(?i:sql)\(', r'&(?i:js|javascript|html)<'),
+)
+
+JS_TOKENS = compile_tokens(
+    r'[^"\'`/{}]',
+    (
+        r'"[^"\\\n]*+(?:\\.[^"\\\n]*+)*+"?',
+        r"'[^'\\\n]*+(?:\\.[^'\\\n]*+)*+'?",
+        r'`[^`\\]*+(?:\\.[^`\\]*+)*+`?',
+        # A / after one of these characters (and at most one space) starts a
+        # regex literal rather than a division
+        r'(?:(?<=[(,=:\[!&|?{};])|(?<=[(,=:\[!&|?{};] ))'
+        r'/(?![/*])(?:[^/\\\[\n]|\\.|\[(?:[^\]\\\n]|\\.)*\])+/',
+        r'/(?:/[^\n]*+|\*.*?(?:\*/|\Z))?',
+    ),
+)
+
+PYTHON_TOKENS = compile_tokens(
+    r'[^"\'#{}]',
+    (
+        r'""".*?(?:"""|\Z)',
+        r"'{3}.*?(?:'{3}|\Z)",
+        r'"[^"\\\n]*+(?:\\.[^"\\\n]*+)*+"?',
+        r"'[^'\\\n]*+(?:\\.[^'\\\n]*+)*+'?",
+        r'#[^\n]*+',
+    ),
+)
+
+RAW_TOKENS = re.compile(r'[^{}]*([{}]|\Z)')
+
+SQL_EMBED_TOKENS = re.compile(r'''
+      '(?:[^']|'')*'?
+    | "[^"\n]*"?
+    | --[^\n]*
+    | [()]
+''', re.VERBOSE)
+
+# Method Language keyword -> body token pattern (anything else is counted raw)
+METHOD_TOKENS = {
+    "objectscript": OBJECTSCRIPT_TOKENS,
+    "cache": OBJECTSCRIPT_TOKENS,
+    "javascript": JS_TOKENS,
+    "python": PYTHON_TOKENS,
+}
+
+LANGUAGE_KEYWORD = re.compile(r'\bLanguage\s*=\s*"?(\w+)', re.IGNORECASE)
+MIMETYPE_KEYWORD = re.compile(r'\bMimeType\s*=\s*"?([\w/+.-]+)', re.IGNORECASE)
+MEMBER_LINE = re.compile(r'''
+    ^[ \t]*(?:
+        (?P<desc>///)
+      | (?P<kind>Parameter|Property|Index|ClassMethod|Method|XData|Storage|Query|Trigger)[ ]
+      | (?P<end>\}[ \t\r]*$)
+    )''', re.VERBOSE | re.MULTILINE)
+DESCRIPTION_BLOCK = re.compile(r'((?:[ \t]*///[^\n]*\n?)+)(?:[ \t\r]*\n)*')
+STORAGE_END = re.compile(r'^[ \t]*\}[ \t\r]*$', re.MULTILINE)
+SPLIT_TOKENS = re.compile(r'[",(){}]')
+
+
+def skip_embed(source: str, pos: int, opener: str) -> int:
+    """Return the index just past an &sql( ... ) or &html< ... > embed.
+
+    pos is the index just after the opening ( or <. Nested pairs are
+    counted the way the ObjectScript compiler does.
+    """
+    n = len(source)
+    depth = 1
+    if opener == "(":
+        for m in SQL_EMBED_TOKENS.finditer(source, pos):
+            tok = m.group()
+            if tok == "(":
+                depth += 1
+            elif tok == ")":
+                depth -= 1
+                if depth == 0:
+                    return m.end()
+        return n
+
+    # &js< / &html<: count the < before each > with C-level find/count
+    while True:
+        close = source.find(">", pos)
+        if close < 0:
+            return n
+        depth += source.count("<", pos, close) - 1
+        if depth == 0:
+            return close + 1
+        pos = close + 1
+
+
+def scan_block(source: str, pos: int, tokens=OBJECTSCRIPT_TOKENS) -> int:
+    """Return the index of the } that closes a block whose body starts at pos.
+
+    Braces inside strings, comments and embedded SQL/JS/HTML are skipped.
+    An unterminated block runs to the end of the source.
+    """
+    n = len(source)
+    depth = 1
+    match = tokens.match
+    while pos < n:
+        m = match(source, pos)
+        tok = m.group(1)
+        pos = m.end()
+        if tok == "{":
+            depth += 1
+        elif tok == "}":
+            depth -= 1
+            if depth == 0:
+                return m.start(1)
+        elif tok:
+            pos = skip_embed(source, pos, tok[-1])
+        else:
+            break
+    return n
+
+
+def line_after(source: str, pos: int) -> int:
+    """Index of the start of the line following the one containing pos."""
+    end = source.find("\n", pos)
+    return len(source) if end < 0 else end + 1
+
+
+# Parsed class model. Records use __slots__ and keep block bodies as
+# (start, end) offsets into the class source; the text is only sliced out
+# when a body is emitted. Each record also reads like the dict
+# parse_udl_class used to return (cls["methods"], param.get("type")).
+class SourceLines(Sequence):
+    """The lines of source[start:end], without copying them until asked.
+
+    Behaves like the list of the body's lines: one trailing newline is
+    dropped, and an empty range has no lines. If the closing } shares its
+    line with other text, the text before the brace is the last line. The
+    lines are split out once, on first use, and kept.
+    """
+    __slots__ = ("source", "start", "end", "_lines")
+
+    def __init__(self, source: str, start: int, end: int):
+        self.source = source
+        self.start = start
+        self.end = end
+        self._lines = None
+
+    def text(self) -> str:
+        """The body as one string: the lines joined with newlines."""
+        end = self.end
+        if end > self.start and self.source[end - 1] == "\n":
+            end -= 1
+        return self.source[self.start:end]
+
+    def lines(self) -> list:
+        if self._lines is None:
+            self._lines = self.text().split("\n") if self.end > self.start else []
+        return self._lines
+
+    def __len__(self):
+        return len(self.lines())
+
+    def __getitem__(self, index):
+        return self.lines()[index]
+
+    def __iter__(self):
+        return iter(self.lines())
+
+    def __eq__(self, other):
+        if isinstance(other, Sequence) and not isinstance(other, str):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return f"SourceLines({self.start}:{self.end}, {len(self)} lines)"
+
+
+def body_text(lines) -> str:
+    """Join a body for output; SourceLines are sliced straight from the source."""
+    if isinstance(lines, SourceLines):
+        return lines.text()
+    return "\n".join(lines)
+
+
+class Record:
+    """Base for model records: fields are __slots__, defaults in _fields."""
+    __slots__ = ()
+    _fields = {}
+
+    def __init__(self, **values):
+        for key, default in self._fields.items():
+            if key in values:
+                value = values.pop(key)
+            else:
+                value = default.copy() if isinstance(default, (list, dict)) else default
+            setattr(self, key, value)
+        if values:
+            raise TypeError(f"{type(self).__name__} has no field(s) {', '.join(values)}")
+
+    # Dict-compatible view
+    def __getitem__(self, key):
+        if key not in self._fields:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in self._fields:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self._fields
+
+    def __iter__(self):
+        return iter(self._fields)
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self._fields else default
+
+    def keys(self):
+        return self._fields.keys()
+
+    def items(self):
+        return [(key, getattr(self, key)) for key in self._fields]
+
+    def to_dict(self) -> dict:
+        """A plain dict copy, with nested records and bodies materialized."""
+        def plain(value):
+            if isinstance(value, Record):
+                return value.to_dict()
+            if isinstance(value, SourceLines):
+                return list(value)
+            if isinstance(value, list):
+                return [plain(item) for item in value]
+            return value
+        return {key: plain(getattr(self, key)) for key in self._fields}
+
+    def __repr__(self):
+        return f"{type(self).__name__}(name={getattr(self, 'name', '')!r})"
+
+
+class ParameterDef(Record):
+    _fields = {"name": "", "type": "", "default": "", "description": []}
+    __slots__ = tuple(_fields)
+
+
+class PropertyDef(Record):
+    _fields = {"name": "", "type_full": "", "type": "", "type_params": "",
+               "keywords": {}, "description": []}
+    __slots__ = tuple(_fields)
+
+
+class IndexDef(Record):
+    _fields = {"name": "", "properties": "", "keywords": {}, "description": []}
+    __slots__ = tuple(_fields)
+
+
+class MethodDef(Record):
+    _fields = {"name": "", "is_class_method": False, "formal_spec": "", "return_type": "",
+               "keywords": {}, "description": [], "implementation": []}
+    __slots__ = tuple(_fields)
+
+
+class XDataDef(Record):
+    _fields = {"name": "", "keywords": {}, "description": [], "data": []}
+    __slots__ = tuple(_fields)
+
+
+class StorageDef(Record):
+    _fields = {"name": "Default", "data": []}
+    __slots__ = tuple(_fields)
+
+
+class ClassDef(Record):
+    _fields = {"name": "", "super": "", "description": [], "class_keywords": {},
+               "parameters": [], "properties": [], "methods": [], "xdata": [],
+               "storage": [], "projections": [], "indices": []}
+    __slots__ = tuple(_fields)
+
+
+def iter_udl_members(source: str):
+    """Tokenize a UDL class source in a single pass and yield its parts.
+
+    Yields (kind, description, declaration, body, offset) tuples. The
+    first is ("Class", leading /// lines, Class declaration line, None,
+    offset); then one per Parameter, Property, Index, Method, ClassMethod,
+    XData and Storage member, where body is a SourceLines range for block
+    members. offset is where the declaration line starts in source.
+    """
+    n = len(source)
+
+    def read_line(p):
+        end = source.find("\n", p)
+        if end < 0:
+            return source[p:], n
+        return source[p:end], end + 1
+
+    # Leading /// description lines
+    pos = 0
+    description = []
+    while pos < n:
+        line, nxt = read_line(pos)
+        if line.startswith("///"):
+            description.append(line[3:].strip() if len(line) > 3 else "")
+        elif line.strip() != "":
+            break
+        pos = nxt
+
+    # Class declaration
+    class_decl = ""
+    class_pos = pos
+    while pos < n:
+        class_pos = pos
+        line, pos = read_line(pos)
+        if line.strip().startswith("Class "):
+            class_decl = line.strip()
+            break
+    yield "Class", description, class_decl, None, class_pos
+
+    # Skip opening brace
+    while pos < n:
+        line, nxt = read_line(pos)
+        if line.strip() not in ("{", ""):
+            break
+        pos = nxt
+
+    # Class body: jump from one member, description or closing line to the
+    # next; anything else between members (comments, blank lines) is skipped
+    while pos < n:
+        m = MEMBER_LINE.search(source, pos)
+        if m is None or m.group("end"):
+            break
+        pos = m.start()
+
+        # Description comments, then any blank lines, directly before a member
+        member_desc = []
+        if m.group("desc"):
+            block = DESCRIPTION_BLOCK.match(source, pos)
+            for desc_line in block.group(1).rstrip("\n").split("\n"):
+                desc_line = desc_line.strip()
+                member_desc.append(desc_line[3:].strip() if len(desc_line) > 3 else "")
+            pos = block.end()
+            m = MEMBER_LINE.match(source, pos)
+            if m is None or not m.group("kind"):
+                continue
+
+        line, nxt = read_line(pos)
+        stripped = line.strip()
+
+        if (stripped.startswith("Parameter ") or stripped.startswith("Property ")
+                or stripped.startswith("Index ")):
+            yield stripped.split(" ", 1)[0], member_desc, stripped, None, pos
+            pos = nxt
+            continue
+
+        if stripped.startswith("ClassMethod ") or stripped.startswith("Method "):
+            # Declarations may span lines; they end at the line ending in {
+            decl = stripped
+            body_start = nxt
+            while not decl.rstrip().endswith("{") and body_start < n:
+                line, body_start = read_line(body_start)
+                decl += " " + line.strip()
+            decl = decl.rstrip().rstrip("{").strip()
+            open_brace = source.rfind("{", pos, body_start)
+            if open_brace < 0:
+                yield (stripped.split(" ", 1)[0], member_desc, decl,
+                       SourceLines(source, body_start, body_start), pos)
+                pos = body_start
+                continue
+            lang = LANGUAGE_KEYWORD.search(decl)
+            tokens = METHOD_TOKENS.get(lang.group(1).lower(), RAW_TOKENS) if lang else OBJECTSCRIPT_TOKENS
+            close = scan_block(source, open_brace + 1, tokens)
+            yield stripped.split(" ", 1)[0], member_desc, decl, SourceLines(source, body_start, close), pos
+            pos = line_after(source, close)
+            continue
+
+        if stripped.startswith("XData "):
+            open_brace = source.find("{", pos)
+            if open_brace < 0:
+                open_brace = n
+            body_start = line_after(source, open_brace)
+            mime = MIMETYPE_KEYWORD.search(stripped)
+            is_script = mime is not None and ("javascript" in mime.group(1) or "json" in mime.group(1))
+            close = scan_block(source, open_brace + 1, JS_TOKENS if is_script else RAW_TOKENS)
+            yield "XData", member_desc, stripped, SourceLines(source, body_start, close), pos
+            pos = line_after(source, close)
+            continue
+
+        if stripped.startswith("Storage "):
+            # Storage holds XML, so it ends at the first line that is just }
+            open_brace = source.find("{", pos)
+            body_start = line_after(source, open_brace) if open_brace >= 0 else n
+            end = STORAGE_END.search(source, body_start)
+            close = end.start() if end else n
+            yield "Storage", [], stripped, SourceLines(source, body_start, close), pos
+            pos = line_after(source, end.end()) if end else n
+            continue
+
+        if stripped.startswith("Query ") or stripped.startswith("Trigger "):
+            # Not exported, but skip the whole body so it cannot be misread
+            open_brace = source.find("{", pos)
+            if open_brace < 0:
+                break
+            pos = line_after(source, scan_block(source, open_brace + 1, RAW_TOKENS))
+            continue
+
+        # Skip anything else (Projection, ForeignKey, ...)
+        pos = nxt
+
+
+def parse_udl_class(source: str, check=None) -> ClassDef:
+    """Parse a UDL .cls file into structured components.
+
+    Pass a ClassCheck to have each member validated as it is parsed.
+    """
+    result = ClassDef()
+
+    for kind, desc, decl, body, pos in iter_udl_members(source):
+        member = None
+        if kind == "Class":
+            result["description"] = desc
+            if decl:
+                parse_class_declaration(decl, result)
+            member = result
+        elif kind == "Parameter":
+            member = parse_parameter(decl, desc)
+            if member:
+                result["parameters"].append(member)
+        elif kind == "Property":
+            member = parse_property(decl, desc)
+            if member:
+                result["properties"].append(member)
+        elif kind == "Index":
+            member = parse_index(decl, desc)
+            if member:
+                result["indices"].append(member)
+        elif kind in ("ClassMethod", "Method"):
+            member = parse_method(decl, body, desc)
+            if member:
+                result["methods"].append(member)
+        elif kind == "XData":
+            member = parse_xdata(decl, body, desc)
+            result["xdata"].append(member)
+        elif kind == "Storage":
+            member = parse_storage(decl, body)
+            result["storage"].append(member)
+        if check is not None:
+            check.member(kind, decl, body, pos, member)
+
+    return result
+
+
+def parse_class_declaration(line: str, result: dict) -> None:
+    """Parse: Class Name Extends Super [ keywords ] into result."""
+    class_match = re.match(
+        r'Class\s+([\w.]+)\s+Extends\s+([\w.%,\s()]+?)(?:\s*\[(.+?)\])?\s*$',
+        line
+    )
+    if class_match:
+        result["name"] = class_match.group(1)
+        result["super"] = class_match.group(2).strip()
+        if class_match.group(3):
+            result["class_keywords"] = parse_bracket_keywords(class_match.group(3))
+    else:
+        # Try without Extends
+        class_match2 = re.match(r'Class\s+([\w.]+)(?:\s+Extends\s+([\w.%,\s()]+?))?(?:\s*\[(.+?)\])?\s*$', line)
+        if class_match2:
+            result["name"] = class_match2.group(1)
+            result["super"] = (class_match2.group(2) or "").strip()
+            if class_match2.group(3):
+                result["class_keywords"] = parse_bracket_keywords(class_match2.group(3))
+
+
+def udl_formalspec_to_xml(udl_spec: str) -> str:
+    """Convert UDL formal spec to IRIS XML FormalSpec format.
+
+    UDL:  param As %String, param2 As %Integer = 0, Output pOut As %String
+    XML:  param:%String,param2:%Integer=0,*pOut:%String
+
+    UDL uses 'As' keyword; XML uses ':' separator.
+    Output params get '*' prefix, ByRef params get '&' prefix.
+    """
+    if not udl_spec.strip():
+        return ""
+
+    # Split on commas, but respect nested parens/quotes
+    params = split_params(udl_spec)
+    xml_params = []
+
+    for param in params:
+        param = param.strip()
+        if not param:
+            continue
+
+        prefix = ""
+        # Check for Output/ByRef modifiers
+        if param.startswith("Output "):
+            prefix = "*"
+            param = param[7:].strip()
+        elif param.startswith("ByRef "):
+            prefix = "&"
+            param = param[6:].strip()
+
+        # Parse: name As Type = default
+        m = re.match(r'(\w+)\s+As\s+([\w.%]+(?:\([^)]*\))?)\s*(?:=\s*(.+))?$', param)
+        if m:
+            name = m.group(1)
+            ptype = m.group(2)
+            default = m.group(3)
+            # Strip type parameters like (MAXLEN=256) for FormalSpec
+            ptype_base = re.sub(r'\([^)]*\)', '', ptype)
+            result = f"{prefix}{name}:{ptype_base}"
+            if default is not None:
+                result += f"={default.strip()}"
+            xml_params.append(result)
+        else:
+            # No type specified, or already in colon format
+            xml_params.append(f"{prefix}{param}")
+
+    return ",".join(xml_params)
+
+
+def split_params(spec: str) -> list:
+    """Split formal spec by commas, respecting nested parens and quotes."""
+    return split_top_level(spec, "(", ")")
+
+
+def split_top_level(text: str, opening: str, closing: str) -> list:
+    """Split text on commas that are outside quotes and bracket pairs.
+
+    Jumps between the interesting characters with a regex and slices the
+    parts out of text, instead of growing a string one character at a time.
+    """
+    parts = []
+    depth = 0
+    in_quote = False
+    start = 0
+    for m in SPLIT_TOKENS.finditer(text):
+        ch = m.group()
+        if ch == '"':
+            in_quote = not in_quote
+        elif in_quote:
+            continue
+        elif ch in opening:
+            depth += 1
+        elif ch in closing:
+            depth -= 1
+        elif ch == "," and depth == 0:
+            parts.append(text[start:m.start()])
+            start = m.end()
+    if text[start:].strip():
+        parts.append(text[start:])
+    return parts
+
+
+def parse_bracket_keywords(text: str) -> dict:
+    """Parse [ Key = Value, Key2 = Value2 ] content.
+
+    Respects nested braces {} and parentheses () so that expressions like
+    InitialExpression = {$zdatetime($ztimestamp, 3, 1)} are not split at
+    the commas inside the braces.
+    """
+    result = {}
+    # Split by commas, respecting nested {} and ()
+    parts = split_top_level(text, "({", ")}")
+
+    for part in parts:
+        if '=' in part:
+            k, v = part.split('=', 1)
+            result[k.strip()] = v.strip().strip('"')
+        else:
+            result[part.strip()] = "1"
+    return result
+
+
+def parse_parameter(line: str, desc: list) -> ParameterDef:
+    """Parse: Parameter NAME = "value"; or Parameter NAME As Type;"""
+    m = re.match(r'Parameter\s+(\w+)\s*=\s*"?(.*?)"?\s*;', line)
+    if m:
+        return ParameterDef(name=m.group(1), default=m.group(2), description=desc)
+    m = re.match(r'Parameter\s+(\w+)\s*;', line)
+    if m:
+        return ParameterDef(name=m.group(1), default="", description=desc)
+    m = re.match(r'Parameter\s+(\w+)\s+As\s+(\S+)\s*=\s*"?(.*?)"?\s*;', line)
+    if m:
+        return ParameterDef(name=m.group(1), type=m.group(2), default=m.group(3), description=desc)
+    return None
+
+
+def parse_property(line: str, desc: list) -> PropertyDef:
+    """Parse: Property Name As Type(PARAMS) [ keywords ];"""
+    # Match property with type, optional parameters, and optional keywords
+    m = re.match(
+        r'Property\s+(\w+)\s+As\s+([^\[;]+?)(?:\s*\[(.+?)\])?\s*;',
+        line
+    )
+    if m:
+        prop = PropertyDef(name=m.group(1), type_full=m.group(2).strip(), description=desc)
+        # Parse type and type parameters
+        type_m = re.match(r'([\w.%]+)(?:\((.+)\))?', prop.type_full)
+        if type_m:
+            prop.type = type_m.group(1)
+            prop.type_params = type_m.group(2) or ""
+        else:
+            prop.type = prop.type_full
+
+        if m.group(3):
+            prop.keywords = parse_bracket_keywords(m.group(3))
+        return prop
+    return None
+
+
+def parse_index(line: str, desc: list) -> IndexDef:
+    """Parse: Index IndexName On (Props) [ keywords ];"""
+    m = re.match(r'Index\s+(\w+)\s+On\s+(.+?)(?:\s*\[(.+?)\])?\s*;', line)
+    if m:
+        return IndexDef(
+            name=m.group(1),
+            properties=m.group(2).strip(),
+            keywords=parse_bracket_keywords(m.group(3)) if m.group(3) else {},
+            description=desc,
+        )
+    return None
+
+
+METHOD_DECL = re.compile(
+    r'(?:Class)?Method\s+(\w+)\((.*?)\)(?:\s+As\s+([\w.%]+))?(?:\s*\[(.+?)\])?\s*$',
+    re.DOTALL)
+
+
+def parse_method(decl: str, body: SourceLines, desc: list) -> MethodDef:
+    """Parse a Method or ClassMethod declaration; body is its source range."""
+    # Determine if ClassMethod
+    is_class_method = decl.startswith("ClassMethod ")
+    keyword = "ClassMethod" if is_class_method else "Method"
+
+    # Parse: (Class)Method Name(args) As ReturnType [ keywords ]
+    m = METHOD_DECL.match(decl)
+
+    method = MethodDef(is_class_method=is_class_method, description=desc, implementation=body)
+
+    if m:
+        method.name = m.group(1)
+        method.formal_spec = m.group(2).strip() if m.group(2) else ""
+        method.return_type = m.group(3) or ""
+        if m.group(4):
+            method.keywords = parse_bracket_keywords(m.group(4))
+    else:
+        # Fallback: extract method name at minimum
+        m2 = re.match(rf'{keyword}\s+(\w+)', decl)
+        if m2:
+            method.name = m2.group(1)
+            # Get everything between parens
+            paren_m = re.search(r'\(([^)]*)\)', decl)
+            if paren_m:
+                method.formal_spec = paren_m.group(1).strip()
+            ret_m = re.search(r'As\s+([\w.%]+)', decl)
+            if ret_m:
+                method.return_type = ret_m.group(1)
+            kw_m = re.search(r'\[(.+?)\]\s*$', decl)
+            if kw_m:
+                method.keywords = parse_bracket_keywords(kw_m.group(1))
+
+    if not method.name:
+        return None
+    return method
+
+
+def parse_xdata(decl: str, body: SourceLines, desc: list) -> XDataDef:
+    """Parse an XData declaration; body is its source range."""
+    # Parse: XData Name [ XMLNamespace = "..." ]
+    m = re.match(r'XData\s+(\w+)(?:\s*\[(.+?)\])?\s*$', decl)
+    return XDataDef(
+        name=m.group(1) if m else "Unknown",
+        keywords=parse_bracket_keywords(m.group(2)) if m and m.group(2) else {},
+        description=desc,
+        data=body,
+    )
+
+
+def parse_storage(decl: str, body: SourceLines) -> StorageDef:
+    """Parse a Storage block (pass through as raw text)."""
+    m = re.match(r'Storage\s+(\w+)\s*', decl)
+    return StorageDef(name=m.group(1) if m else "Default", data=body)
+
+
+def class_to_xml(cls_data: dict, escape=None) -> str:
+    """Convert parsed class data to IRIS XML export format."""
+    return "\n".join(iter_class_xml(cls_data, escape))
+
+
+def iter_class_xml(cls_data: dict, escape=None):
+    """Yield the lines of a class's IRIS XML export, without a trailing newline.
+
+    Method, XData and Storage bodies are yielded as one slice of the class
+    source each, so they are copied once on the way out.
+    escape defaults to escape_xml; the profiler passes a timed wrapper.
+    Keyword elements come out in alphabetical order, not the order the
+    source happens to list them in.
+    """
+    escape = escape or escape_xml
+    # Open Class element
+    yield f'<Class name="{cls_data["name"]}">'
+
+    # Description
+    if cls_data["description"]:
+        desc_text = "\n".join(cls_data["description"])
+        yield f"<Description>{escape(desc_text)}</Description>"
+
+    # Super
+    if cls_data["super"]:
+        yield f'<Super>{escape(cls_data["super"])}</Super>'
+
+    # Class keywords
+    for key, val in sorted(cls_data.get("class_keywords", {}).items()):
+        if key == "DependsOn":
+            yield f"<DependsOn>{escape(val)}</DependsOn>"
+        elif key == "Abstract":
+            yield "<Abstract>1</Abstract>"
+        elif key == "CompileAfter":
+            yield f"<CompileAfter>{escape(val)}</CompileAfter>"
+
+    # Parameters
+    for param in cls_data["parameters"]:
+        yield f'<Parameter name="{param["name"]}">'
+        if param.get("description"):
+            yield f"<Description>{escape(chr(10).join(param['description']))}</Description>"
+        if param.get("type"):
+            yield f"<Type>{param['type']}</Type>"
+        if param.get("default", "") != "":
+            yield f"<Default>{escape(param['default'])}</Default>"
+        yield "</Parameter>"
+        yield ""
+
+    # Properties
+    for prop in cls_data["properties"]:
+        yield f'<Property name="{prop["name"]}">'
+        if prop.get("description"):
+            yield f"<Description>{escape(chr(10).join(prop['description']))}</Description>"
+        if prop.get("type"):
+            yield f"<Type>{prop['type']}</Type>"
+        # Type parameters (MAXLEN, etc.)
+        if prop.get("type_params"):
+            for tp in re.findall(r'(\w+)\s*=\s*(\S+)', prop["type_params"]):
+                yield f'<Parameter name="{tp[0]}" value="{tp[1]}"/>'
+        # Keywords (InitialExpression, etc.)
+        for key, val in sorted(prop.get("keywords", {}).items()):
+            if key == "InitialExpression":
+                # Strip UDL expression braces: {$zdatetime($h,3,1)} -> $zdatetime($h,3,1)
+                # In UDL, {..} means "ObjectScript expression". XML stores the raw expression.
+                expr = val
+                if expr.startswith("{") and expr.endswith("}"):
+                    expr = expr[1:-1]
+                yield f"<InitialExpression>{escape(expr)}</InitialExpression>"
+            elif key == "Required":
+                yield "<Required>1</Required>"
+            elif key == "Private":
+                yield "<Private>1</Private>"
+            elif key == "Calculated":
+                yield "<Calculated>1</Calculated>"
+        yield "</Property>"
+        yield ""
+
+    # Indices
+    for idx in cls_data.get("indices", []):
+        yield f'<Index name="{idx["name"]}">'
+        if idx.get("description"):
+            yield f"<Description>{escape(chr(10).join(idx['description']))}</Description>"
+        yield f"<Properties>{escape(idx['properties'])}</Properties>"
+        for key, val in sorted(idx.get("keywords", {}).items()):
+            if key == "Unique":
+                yield "<Unique>1</Unique>"
+            elif key == "Type":
+                yield f"<Type>{escape(val)}</Type>"
+        yield "</Index>"
+        yield ""
+
+    # Methods
+    for method in cls_data["methods"]:
+        yield f'<Method name="{method["name"]}">'
+        if method.get("description"):
+            yield f"<Description>{escape(chr(10).join(method['description']))}</Description>"
+        if method["is_class_method"]:
+            yield "<ClassMethod>1</ClassMethod>"
+        if method.get("formal_spec"):
+            xml_spec = udl_formalspec_to_xml(method["formal_spec"])
+            yield f"<FormalSpec>{escape(xml_spec)}</FormalSpec>"
+        if method.get("return_type"):
+            yield f"<ReturnType>{method['return_type']}</ReturnType>"
+        for key, val in sorted(method.get("keywords", {}).items()):
+            if key == "Private":
+                yield "<Private>1</Private>"
+            elif key == "Abstract":
+                yield "<Abstract>1</Abstract>"
+
+        # Implementation
+        yield "<Implementation><![CDATA["
+        yield body_text(method["implementation"])
+        yield "]]></Implementation>"
+        yield "</Method>"
+        yield ""
+
+    # XData blocks
+    for xdata in cls_data["xdata"]:
+        yield f'<XData name="{xdata["name"]}">'
+        if xdata.get("description"):
+            yield f"<Description>{escape(chr(10).join(xdata['description']))}</Description>"
+        # XMLNamespace must be a child element, not an attribute
+        if "XMLNamespace" in xdata.get("keywords", {}):
+            yield f'<XMLNamespace>{escape(xdata["keywords"]["XMLNamespace"])}</XMLNamespace>'
+        # MimeType if present
+        if "MimeType" in xdata.get("keywords", {}):
+            yield f'<MimeType>{escape(xdata["keywords"]["MimeType"])}</MimeType>'
+        yield "<Data><![CDATA["
+        yield body_text(xdata["data"])
+        yield "]]></Data>"
+        yield "</XData>"
+        yield ""
+
+    # Storage blocks
+    for storage in cls_data.get("storage", []):
+        yield f'<Storage name="{storage["name"]}">'
+        # Storage usually contains XML elements directly
+        yield body_text(storage["data"])
+        yield "</Storage>"
+        yield ""
+
+    yield "</Class>"
+
+
+def escape_xml(text: str) -> str:
+    """Escape XML special characters (but not in CDATA sections)."""
+    return (text
+            .replace("&", "&amp;")
+            .replace("<", "&lt;")
+            .replace(">", "&gt;")
+            .replace('"', "&quot;"))
+
+
+# Output formats. An Emitter turns one parsed class into one fragment of
+# its document; the pipeline hands the same ClassDef to every emitter
+# asked for, so a class is parsed once however many formats are written.
+class Emitter:
+    """Base for output formats: a document is header(), then each class's
+    fragment() followed by separator, then footer().
+
+    Subclass it and add the subclass to EMITTERS to make a format
+    available by name. Emitters travel to worker processes, so keep them
+    picklable (module-level classes with plain attributes).
+    """
+    name = ""
+    suffix = ""
+    separator = "\n"
+
+    def header(self, version: int) -> str:
+        return ""
+
+    def fragment(self, cls_data: ClassDef) -> str:
+        raise NotImplementedError
+
+    def footer(self) -> str:
+        return ""
+
+
+class XMLEmitter(Emitter):
+    """The IRIS XML export (what class_to_xml writes)."""
+    name = "xml"
+    suffix = ".xml"
+    separator = "\n\n"
+
+    def header(self, version: int) -> str:
+        return export_header(version)
+
+    def fragment(self, cls_data: ClassDef) -> str:
+        return class_to_xml(cls_data)
+
+    def footer(self) -> str:
+        return "</Export>"
+
+
+class JSONEmitter(Emitter):
+    """One JSON object per class and line: the ClassDef as to_dict() gives
+    it, bodies as lists of lines."""
+    name = "json"
+    suffix = ".jsonl"
+
+    def fragment(self, cls_data: ClassDef) -> str:
+        import json
+        return json.dumps(cls_data.to_dict(), ensure_ascii=False)
+
+
+class UDLEmitter(Emitter):
+    """Canonically formatted UDL, one class after another (iter_class_udl)."""
+    name = "udl"
+    suffix = ".udl"
+
+    def fragment(self, cls_data: ClassDef) -> str:
+        return "\n".join(iter_class_udl(cls_data))
+
+
+EMITTERS = {emitter.name: emitter for emitter in (XMLEmitter, JSONEmitter, UDLEmitter)}
+
+
+def model_keywords(keywords: dict) -> list:
+    """A member's parsed keywords as the (key, value) pairs udl_keywords()
+    takes: InitialExpression without its braces, (A, B) lists unwrapped."""
+    pairs = []
+    for key, value in keywords.items():
+        if key == "InitialExpression" and value.startswith("{") and value.endswith("}"):
+            value = value[1:-1]
+        elif value.startswith("(") and value.endswith(")"):
+            value = value[1:-1]
+        pairs.append((key, value))
+    return pairs
+
+
+def iter_class_udl(cls_data: ClassDef):
+    """Yield the lines of a class as canonically formatted UDL.
+
+    The layout is the one --reverse writes: members grouped in export
+    order, one blank line after each, argument lists and keywords
+    spaced the same way everywhere. Bodies are passed through untouched,
+    so two sources that differ only in declaration formatting come out
+    identical.
+    """
+    def description(lines):
+        for line in lines:
+            yield f"/// {line}"
+
+    yield from description(cls_data["description"])
+    decl = f"Class {cls_data['name']}"
+    if cls_data["super"]:
+        decl += f" Extends {cls_data['super']}"
+    yield decl + udl_keywords(model_keywords(cls_data["class_keywords"]))
+    yield "{"
+    yield ""
+    for param in cls_data["parameters"]:
+        yield from description(param.description)
+        decl = f"Parameter {param.name}"
+        if param.type:
+            decl += f" As {param.type}"
+        if param.default != "":
+            decl += f" = {udl_literal(param.default)}"
+        yield decl + ";"
+        yield ""
+    for prop in cls_data["properties"]:
+        ptype = prop.type_full
+        if prop.type_params and ptype == f"{prop.type}({prop.type_params})":
+            params = (part.partition("=") for part in split_top_level(prop.type_params, "({", ")}"))
+            ptype = f"{prop.type}({', '.join(f'{k.strip()} = {v.strip()}' for k, _, v in params)})"
+        yield from description(prop.description)
+        yield f"Property {prop.name} As {ptype}{udl_keywords(model_keywords(prop.keywords))};"
+        yield ""
+    for index in cls_data["indices"]:
+        yield from description(index.description)
+        yield f"Index {index.name} On {index.properties}{udl_keywords(model_keywords(index.keywords))};"
+        yield ""
+    for method in cls_data["methods"]:
+        keyword = "ClassMethod" if method.is_class_method else "Method"
+        spec = xml_formalspec_to_udl(udl_formalspec_to_xml(method.formal_spec))
+        decl = f"{keyword} {method.name}({spec})"
+        if method.return_type:
+            decl += f" As {method.return_type}"
+        yield from description(method.description)
+        yield decl + udl_keywords(model_keywords(method.keywords))
+        yield "{"
+        if method.implementation:
+            yield body_text(method.implementation)
+        yield "}"
+        yield ""
+    for xdata in cls_data["xdata"]:
+        yield from description(xdata.description)
+        yield f"XData {xdata.name}{udl_keywords(model_keywords(xdata.keywords))}"
+        yield "{"
+        if xdata.data:
+            yield body_text(xdata.data)
+        yield "}"
+        yield ""
+    for storage in cls_data["storage"]:
+        yield f"Storage {storage.name}"
+        yield "{"
+        if storage.data:
+            yield body_text(storage.data)
+        yield "}"
+        yield ""
+    yield "}"
+
+
+# Validation. A ClassCheck rides along with parse_udl_class() and
+# render_checked(), so export breakers are reported with their source
+# line while the class is generated, without reading the output again.
+class Diagnostic(Record):
+    _fields = {"file": "", "line": 0, "severity": "error", "code": "", "message": "",
+               "member": ""}
+    __slots__ = tuple(_fields)
+
+    def __str__(self):
+        return f"{self.file}:{self.line}: {self.severity}: {self.message} [{self.code}]"
+
+
+# Member declarations at column 0 (method code is indented; a column-0 word
+# in ObjectScript is a label), found inside a body that swallowed them. The
+# leading newline lets the regex engine skip straight from line to line.
+SWALLOWED_MEMBER = re.compile(
+    r'\n(?:(?:(?:Class)?Method|Query|Trigger)\s+\w+\s*\(|'
+    r'(?:Property|Parameter|Index|Relationship|ForeignKey|XData|Storage)\s+\w+\b)')
+TYPE_PARAM = re.compile(r'(\w+)\s*=\s*(\S+)')
+XML_MEMBER_START = re.compile(r'<(Class|Parameter|Property|Index|Method|XData|Storage) name="([^"]*)">$')
+# Parsed kind -> the element class_to_xml emits for it
+MEMBER_TAGS = {"Class": "Class", "Parameter": "Parameter", "Property": "Property",
+               "Index": "Index", "ClassMethod": "Method", "Method": "Method",
+               "XData": "XData", "Storage": "Storage"}
+
+
+class ClassCheck:
+    """Diagnostics for one class, collected while it is parsed and rendered.
+
+    Line numbers are only worked out when something is reported, so a
+    clean class costs a few regex searches over its bodies.
+    """
+
+    def __init__(self, source: str, path: str = ""):
+        self.source = source
+        self.path = path
+        self.diagnostics = []
+        self.members = {}   # (element, name) -> offset of the declaration
+
+    def line_of(self, offset: int) -> int:
+        return self.source.count("\n", 0, offset) + 1
+
+    def report(self, severity: str, code: str, offset: int, message: str, member: str = ""):
+        self.diagnostics.append(Diagnostic(file=self.path, line=self.line_of(offset),
+                                           severity=severity, code=code, message=message,
+                                           member=member))
+
+    def member(self, kind: str, decl: str, body, pos: int, parsed) -> None:
+        """Check one member from iter_udl_members() and what it parsed to."""
+        if parsed is None:
+            self.report("error", "unparsed-member", pos,
+                        f"{kind} declaration not understood, member is not exported: {decl[:80]}")
+            return
+        if kind == "Class":
+            self.members[("Class", "")] = pos
+            return
+        name = parsed["name"]
+        label = f"{kind} {name}"
+        self.members[(MEMBER_TAGS[kind], name)] = pos
+
+        if kind == "Property":
+            for key, value in TYPE_PARAM.findall(parsed["type_params"]):
+                if any(c in value for c in '"<&'):
+                    self.report("error", "unescaped-type-param", pos,
+                                f"{label}: type parameter {key} = {value} is written unescaped "
+                                f"into an XML attribute", name)
+        elif kind in ("ClassMethod", "Method"):
+            args = balanced_args(decl)
+            if args is not None and args.strip() != parsed["formal_spec"]:
+                self.report("error", "formalspec-mismatch", pos,
+                            f"{label}: FormalSpec parsed as ({parsed['formal_spec']}) but the "
+                            f"argument list is ({args.strip()})", name)
+            elif METHOD_DECL.match(decl) is None:
+                self.report("warning", "declaration-fallback", pos,
+                            f"{label}: declaration only parsed by the fallback, return type "
+                            f"parameters or keywords may be dropped: {decl[:80]}", name)
+
+        if body is None:
+            return
+        if body.end >= len(self.source):
+            self.report("error", "unterminated-block", pos,
+                        f"{label}: no closing }} before the end of the file", name)
+        found = SWALLOWED_MEMBER.search(self.source, max(body.start - 1, 0), body.end)
+        if found and kind != "Storage":
+            self.report("error", "swallowed-member", found.start() + 1,
+                        f"{label}: body contains a member declaration "
+                        f"({found.group().strip()}...); a {{ or }} is probably unbalanced", name)
+        if kind != "Storage":
+            end = self.source.find("]]>", body.start, body.end)
+            if end >= 0:
+                self.report("error", "cdata-end", end,
+                            f"{label}: body contains ]]>, which ends the CDATA section early", name)
+
+    def xml_error(self, error: str, element: str, name: str, line: int, column: int) -> None:
+        """Report an XML parser error met while emitting element/name;
+        line and column are positions in the class's export fragment."""
+        if any(d.member == name and d.severity == "error" for d in self.diagnostics):
+            return
+        offset = self.members.get((element, name), self.members.get(("Class", ""), 0))
+        where = f"<{element} name=\"{name}\">" if element != "Class" else "<Class>"
+        self.report("error", "xml", offset,
+                    f"{where}: output is not well-formed XML ({error} at export line "
+                    f"{line}, column {column + 1})", name)
+
+
+def balanced_args(decl: str):
+    """The text inside a declaration's first balanced (...), or None."""
+    start = decl.find("(")
+    if start < 0:
+        return None
+    end = decl.find(")", start)
+    if end >= 0 and decl.find("(", start + 1, end) < 0:
+        return decl[start + 1:end]
+    depth = 0
+    for index in range(start, len(decl)):
+        if decl[index] == "(":
+            depth += 1
+        elif decl[index] == ")":
+            depth -= 1
+            if depth == 0:
+                return decl[start + 1:index]
+    return None
+
+
+def render_checked(cls_data: ClassDef, check: ClassCheck, escape=None, timer=None) -> str:
+    """class_to_xml() whose output is run through an XML parser before it
+    is handed on, reporting the first well-formedness error to check.
+
+    Each fragment is parsed once, straight from memory, as it is
+    produced; only when the parser fails are the lines walked to find
+    the member being emitted. timer, if given, is a one-item list the
+    parser's time is added to.
+    """
+    from xml.parsers import expat
+
+    lines = list(iter_class_xml(cls_data, escape))
+    xml_content = "\n".join(lines)
+    start = time.perf_counter()
+    try:
+        expat.ParserCreate().Parse(xml_content, True)
+    except expat.ExpatError as e:
+        element, name = "Class", ""
+        line = 1
+        for piece in lines:
+            if line > e.lineno:
+                break
+            started = XML_MEMBER_START.match(piece)
+            if started and started.group(1) != "Class":
+                element, name = started.groups()
+            line += piece.count("\n") + 1
+        check.xml_error(expat.ErrorString(e.code), element, name, e.lineno, e.offset)
+    if timer is not None:
+        timer[0] += time.perf_counter() - start
+    return xml_content
+
+
+# Dependency discovery. Hard edges must compile first (superclasses,
+# DependsOn/CompileAfter, property types); soft edges are references that
+# only order classes when they are not part of a cycle of references.
+CLASS_DECL_LINE = re.compile(r'^Class\s[^\n]*', re.MULTILINE)
+PROPERTY_TYPE = re.compile(
+    r'^[ \t]*(?:Property|Relationship)\s+\w+\s+As\s+(?:(?:list|array)\s+Of\s+)?([%\w.]+)',
+    re.MULTILINE | re.IGNORECASE)
+AS_TYPE = re.compile(r'\bAs\s+(?:(?:list|array)\s+Of\s+)?([%\w.]+)', re.IGNORECASE)
+CLASS_REFERENCE = re.compile(r'##class\(\s*([%\w.]+)\s*\)', re.IGNORECASE)
+
+
+def discover_classes(cls_dir: Path) -> list:
+    """All .cls files under cls_dir as sorted posix paths relative to it."""
+    return sorted(p.relative_to(cls_dir).as_posix() for p in cls_dir.rglob("*.cls"))
+
+
+def class_name_from_path(cls_path: str) -> str:
+    """AIAgent/Util/JSON.cls -> AIAgent.Util.JSON"""
+    return cls_path[:-len(".cls")].replace("/", ".")
+
+
+def qualify_class_name(name: str, package: str) -> str:
+    """Resolve an unqualified class name the way the class compiler does."""
+    if "." in name or name.startswith("%") or not package:
+        return name
+    return f"{package}.{name}"
+
+
+def scan_dependencies(source: str, fallback_name: str) -> dict:
+    """Find a class's name and the classes it depends on with a regex pass.
+
+    Returns {"name", "hard", "soft"}; names are qualified but not yet
+    filtered to the classes being exported.
+    """
+    header = {"name": "", "super": "", "class_keywords": {}}
+    decl = CLASS_DECL_LINE.search(source)
+    if decl:
+        parse_class_declaration(decl.group().strip(), header)
+    name = header["name"] or fallback_name
+    package = name.rpartition(".")[0]
+
+    hard = set()
+    for key in ("DependsOn", "CompileAfter"):
+        hard.update(header["class_keywords"].get(key, "").strip("()").split(","))
+    hard.update(header["super"].strip("()").split(","))
+    hard.update(PROPERTY_TYPE.findall(source))
+    soft = set(AS_TYPE.findall(source)) | set(CLASS_REFERENCE.findall(source))
+
+    def qualify(names):
+        return {qualify_class_name(n.strip(), package) for n in names if n.strip()}
+
+    hard = qualify(hard)
+    return {"name": name, "hard": hard, "soft": qualify(soft) - hard}
+
+
+def strongly_connected(edges: dict) -> Iterator[list]:
+    """The strongly connected components of edges (name -> list of the
+    names it depends on), dependencies first: Tarjan's algorithm, run
+    iteratively so deep chains do not hit the recursion limit."""
+    index = {}
+    lowlink = {}
+    stack = []
+    on_stack = set()
+    counter = 0
+    for root in sorted(edges):
+        if root in index:
+            continue
+        work = [(root, iter(edges[root]))]
+        index[root] = lowlink[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack.add(root)
+        while work:
+            node, children = work[-1]
+            for child in children:
+                if child not in index:
+                    index[child] = lowlink[child] = counter
+                    counter += 1
+                    stack.append(child)
+                    on_stack.add(child)
+                    work.append((child, iter(edges[child])))
+                    break
+                if child in on_stack:
+                    lowlink[node] = min(lowlink[node], index[child])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    yield component
+
+
+def order_classes(deps: dict) -> tuple:
+    """Group classes into compile phases.
+
+    deps maps class name -> {"hard": set, "soft": set}. Every class lands
+    one phase after the last class it depends on, so each phase can be
+    compiled in parallel once the earlier ones are done. Soft edges that
+    are part of a cycle of references are dropped; classes in a cycle of
+    hard edges share a phase.
+
+    Returns (phases, cycles): phases is a list of sorted name lists,
+    cycles lists the sorted members of each multi-class hard cycle.
+    """
+    edges = {name: sorted((d["hard"] | d["soft"]) & deps.keys() - {name})
+             for name, d in deps.items()}
+    reference_cycle = {}
+    for number, component in enumerate(strongly_connected(edges)):
+        for member in component:
+            reference_cycle[member] = number
+    edges = {name: sorted(d["hard"] & deps.keys() - {name}
+                          | {dep for dep in d["soft"] & deps.keys()
+                             if reference_cycle[dep] != reference_cycle[name]})
+             for name, d in deps.items()}
+
+    # Components come dependencies-first, so levels can be assigned as they pop
+    component_of = {}
+    levels = []
+    members = []
+    for component in strongly_connected(edges):
+        comp_id = len(members)
+        level = 0
+        for member in component:
+            component_of[member] = comp_id
+        for member in component:
+            for dep in edges[member]:
+                if component_of[dep] != comp_id:
+                    level = max(level, levels[component_of[dep]] + 1)
+        levels.append(level)
+        members.append(sorted(component))
+
+    phases = [[] for _ in range(max(levels) + 1)] if levels else []
+    for comp_id, component in enumerate(members):
+        phases[levels[comp_id]].extend(component)
+    cycles = [component for component in members if len(component) > 1]
+    return [sorted(phase) for phase in phases], cycles
+
+
+def fragment_hash(xml_content: str) -> str:
+    return hashlib.sha256(xml_content.encode("utf-8")).hexdigest()
+
+
+def export_header(version=None) -> str:
+    """The <Export> opening; version None (canonical exports) leaves the
+    exportversion attribute out, so the bytes only depend on the classes."""
+    stamp = f' exportversion="{version}"' if version is not None else ""
+    return ('<?xml version="1.0" encoding="UTF-8"?>\n'
+            f'<Export generator="IRIS" version="26"{stamp}>\n'
+            "\n")
+
+
+TRAILING_SPACE = re.compile(r'[ \t]+(?=\n)')
+
+
+def canonical_source(source: str) -> str:
+    """A class source with normalized whitespace: LF line endings, no
+    trailing blanks outside member bodies and exactly one newline at the
+    end. Method, XData, Storage and other block bodies are kept as they
+    are apart from line endings, since a trailing blank there can be
+    content (an XData payload, a string continued on the next line)."""
+    if "\r" in source:
+        source = source.replace("\r\n", "\n").replace("\r", "\n")
+    parts = []
+    pos = 0
+    for _, _, _, body, _ in iter_udl_members(source):
+        if isinstance(body, SourceLines) and body.end > body.start:
+            parts.append(TRAILING_SPACE.sub("", source[pos:body.start]))
+            parts.append(source[body.start:body.end])
+            pos = body.end
+    parts.append(TRAILING_SPACE.sub("", source[pos:]).rstrip(" \t\n"))
+    return "".join(parts).rstrip("\n") + "\n"
+
+
+# Content-addressed version store: objects/<aa>/<sha256>.xml holds each
+# distinct fragment once, versions/vN.json lists a version's fragments.
+@contextmanager
+def store_lock(store_dir: Path):
+    """Hold an exclusive lock on the version store (blocks until free)."""
+    store_dir.mkdir(parents=True, exist_ok=True)
+    with open(store_dir / "lock", "a+b") as handle:
+        if os.name == "nt":
+            import msvcrt
+            handle.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass  # LK_LOCK gives up after ~10 s; keep waiting
+            try:
+                yield
+            finally:
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def stored_versions(store_dir: Path) -> list:
+    """Version numbers with a manifest in the store, ascending."""
+    versions_dir = store_dir / "versions"
+    if not versions_dir.is_dir():
+        return []
+    return sorted(int(p.stem[1:]) for p in versions_dir.glob("v*.json") if p.stem[1:].isdigit())
+
+
+def manifest_path(store_dir: Path, version: int) -> Path:
+    return store_dir / "versions" / f"v{version}.json"
+
+
+def load_manifest(store_dir: Path, version: int) -> dict:
+    """Load a version's manifest; FileNotFoundError if it was never stored."""
+    import json
+    return json.loads(manifest_path(store_dir, version).read_text(encoding="utf-8"))
+
+
+def write_manifest(store_dir: Path, manifest: dict) -> None:
+    import json
+    path = manifest_path(store_dir, manifest["version"])
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(manifest, indent=2) + "\n", encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def object_path(store_dir: Path, digest: str) -> Path:
+    return store_dir / "objects" / digest[:2] / f"{digest}.xml"
+
+
+def store_object(store_dir: Path, digest: str, xml_content: str) -> None:
+    """Save a fragment under its hash unless the store already has it."""
+    path = object_path(store_dir, digest)
+    if path.exists():
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(xml_content, encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def load_object(store_dir: Path, digest: str) -> str:
+    return object_path(store_dir, digest).read_text(encoding="utf-8")
+
+
+def iter_version(store_dir: Path, version: int) -> Iterator[str]:
+    """The fragments of a stored version, in export order."""
+    for entry in load_manifest(store_dir, version)["classes"].values():
+        yield load_object(store_dir, entry["sha256"])
+
+
+def collect_garbage(store_dir: Path, keep=None) -> dict:
+    """Delete what no kept version needs. Call with store_lock() held.
+
+    With keep (at least 1), manifests older than the keep newest versions
+    are dropped first; then fragments no remaining manifest references
+    are deleted. Returns {"dropped": versions, "kept": versions,
+    "objects": count}.
+    """
+    if keep is not None and keep < 1:
+        raise ValueError(f"keep must be at least 1, not {keep}")
+    versions = stored_versions(store_dir)
+    dropped = versions[:-keep] if keep is not None and keep < len(versions) else []
+    for version in dropped:
+        manifest_path(store_dir, version).unlink()
+    versions = versions[len(dropped):]
+
+    referenced = set()
+    for version in versions:
+        referenced.update(entry["sha256"]
+                          for entry in load_manifest(store_dir, version)["classes"].values())
+
+    objects = 0
+    objects_dir = store_dir / "objects"
+    if objects_dir.is_dir():
+        for path in objects_dir.glob("*/*"):
+            if path.name.split(".")[0] not in referenced:
+                path.unlink()
+                objects += 1
+    return {"dropped": dropped, "kept": versions, "objects": objects}
+
+
+# Sharded exports: a stored version split into standalone export files,
+# one per class or per compile phase, described by index.json.
+SHARD_MODES = ("class", "phase")
+SHARD_INDEX = "index.json"
+
+
+def shard_file(mode: str, phase: int, name: str, width: int) -> str:
+    """File name of a shard; the phase prefix makes name order compile order."""
+    if mode == "phase":
+        return f"phase-{phase:0{width}d}.xml"
+    return f"{phase:0{width}d}-{name}.xml"
+
+
+def file_digest(path: Path) -> tuple:
+    """(sha256, size in bytes) of a file as it is on disk."""
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            digest.update(block)
+            size += len(block)
+    return digest.hexdigest(), size
+
+
+def iter_shards(manifest: dict, mode: str) -> Iterator[tuple]:
+    """(file, phase, class names) per shard of a manifest, in compile order.
+
+    Manifests written before phases were recorded load as one phase.
+    """
+    classes = manifest["classes"]
+    phases = {}
+    for name, entry in classes.items():
+        phases.setdefault(entry.get("phase", 1), []).append(name)
+    width = len(str(max(phases, default=1)))
+    for phase in sorted(phases):
+        if mode == "phase":
+            yield shard_file(mode, phase, "", width), phase, phases[phase]
+        else:
+            for name in phases[phase]:
+                yield shard_file(mode, phase, name, width), phase, [name]
+
+
+def write_shards(store_dir: Path, manifest: dict, mode: str, shard_dir: Path) -> dict:
+    """Write a stored version as shards plus index.json into shard_dir.
+
+    Each shard is a complete export document, so it can be loaded on its
+    own, and index.json lists its phase, classes, sha256, size and the
+    shards it depends on. The new set is built next to shard_dir and
+    swapped in, so a reader never sees a mix of two versions. Returns the
+    index.
+    """
+    import json
+    import shutil
+
+    if mode not in SHARD_MODES:
+        raise ValueError(f"unknown shard mode {mode!r} (expected one of {', '.join(SHARD_MODES)})")
+    tmp_dir = shard_dir.with_name(f"{shard_dir.name}.{os.getpid()}.tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+    try:
+        classes = manifest["classes"]
+        shards = list(iter_shards(manifest, mode))
+        file_of = {name: file for file, _, names in shards for name in names}
+        index = {"version": manifest["version"], "mode": mode, "shards": []}
+        for file, phase, names in shards:
+            path = tmp_dir / file
+            with open(path, "w", encoding="utf-8", newline="\n") as out:
+                out.write(export_header(None if manifest.get("canonical") else manifest["version"]))
+                for name in names:
+                    out.write(load_object(store_dir, classes[name]["sha256"]))
+                    out.write("\n\n")
+                out.write("</Export>")
+            digest, size = file_digest(path)
+            depends = {file_of[dep] for name in names
+                       for dep in classes[name].get("deps", []) if dep in file_of}
+            index["shards"].append({"file": file, "phase": phase, "classes": names,
+                                    "sha256": digest, "size": size,
+                                    "depends": sorted(depends - {file})})
+        (tmp_dir / SHARD_INDEX).write_text(json.dumps(index, indent=2) + "\n", encoding="utf-8")
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    old_dir = shard_dir.with_name(f"{shard_dir.name}.{os.getpid()}.old")
+    if shard_dir.exists():
+        os.replace(shard_dir, old_dir)
+    os.replace(tmp_dir, shard_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return index
+
+
+# Package exports: classes from several source roots split into one
+# export per package, for batch runs.
+def export_package(class_name: str, patterns) -> str:
+    """The package export class_name belongs to under patterns, or "".
+
+    Patterns are fnmatch globs over dotted package names. A class matches
+    when its package or a parent package does, and the export is named by
+    the matched prefix, so "TIE.*" makes one export per TIE subpackage.
+    The deepest match wins: with "AIAgent" and "AIAgent.Generated.*" each
+    generated package gets its own export and the rest of AIAgent one.
+    """
+    from fnmatch import fnmatchcase
+
+    parts = class_name.split(".")[:-1]
+    best, best_depth = "", 0
+    for pattern in patterns:
+        depth = pattern.count(".") + 1
+        if best_depth < depth <= len(parts):
+            prefix = ".".join(parts[:depth])
+            if fnmatchcase(prefix, pattern):
+                best, best_depth = prefix, depth
+    return best
+
+
+# Compressed exports. gzip is always available; zstd needs Python 3.14's
+# compression.zstd or the zstandard package.
+COMPRESSION_SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+GZIP_LEVEL = 6      # within 2% of level 9's size at a third of the time
+ZSTD_LEVEL = 10
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+def zstd_module():
+    """(module, kind) for the available zstd binding, or raise ValueError."""
+    try:
+        from compression import zstd
+        return zstd, "stdlib"
+    except ImportError:
+        pass
+    try:
+        import zstandard
+        return zstandard, "zstandard"
+    except ImportError:
+        raise ValueError("zstd compression needs Python 3.14+ or the zstandard package "
+                         "(pip install zstandard)") from None
+
+
+def open_compressed(path: Path, method=None, newline=None):
+    """Open path for writing text, compressed with method (None, "gzip", "zstd").
+
+    Fragments are compressed as they are written, so nothing is buffered
+    beyond the compressor's window. gzip output carries no timestamp or
+    file name, so the same export always compresses to the same bytes.
+    newline is open()'s; pass "\n" for the same bytes on every platform.
+    """
+    if method is None:
+        return open(path, "w", encoding="utf-8", newline=newline)
+    if method == "gzip":
+        import gzip
+        import io
+        raw = open(path, "wb")
+        stream = gzip.GzipFile(filename="", mode="wb", fileobj=raw,
+                               compresslevel=GZIP_LEVEL, mtime=0)
+        return io.TextIOWrapper(ClosingWriter(stream, raw), encoding="utf-8", newline=newline)
+    if method == "zstd":
+        module, kind = zstd_module()
+        if kind == "stdlib":
+            return module.open(path, "wt", level=ZSTD_LEVEL, encoding="utf-8", newline=newline)
+        return module.open(path, "wt", cctx=module.ZstdCompressor(level=ZSTD_LEVEL),
+                           encoding="utf-8", newline=newline)
+    raise ValueError(f"unknown compression {method!r} "
+                     f"(expected one of {', '.join(COMPRESSION_SUFFIXES)})")
+
+
+class ClosingWriter:
+    """A GzipFile on a caller's file object that closes that file too."""
+
+    def __init__(self, stream, raw):
+        self.stream = stream
+        self.raw = raw
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+    def close(self):
+        try:
+            self.stream.close()
+        finally:
+            self.raw.close()
+
+
+def open_export(path: Path):
+    """Open an export for reading as bytes, decompressing gzip or zstd as
+    it is read (detected from the file's magic number)."""
+    with open(path, "rb") as f:
+        magic = f.read(4)
+    if magic.startswith(GZIP_MAGIC):
+        import gzip
+        return gzip.open(path, "rb")
+    if magic == ZSTD_MAGIC:
+        module, _ = zstd_module()
+        return module.open(path, "rb")
+    return open(path, "rb")
+
+
+class HashingReader:
+    """A binary stream that hashes and counts what is read from it."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.hash = hashlib.sha256()
+        self.size = 0
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.hash.update(data)
+        self.size += len(data)
+        return data
+
+
+def verify_export(path: Path) -> dict:
+    """Stream an export (plain, gzip or zstd) through the XML parser.
+
+    Checks that it is well-formed without decompressing it to disk or
+    keeping more than one class in memory. Returns {"version" (None for
+    a canonical export), "classes" (names in file order), "other" (count
+    of non-class items), "bytes" and "sha256" (of the uncompressed
+    XML)}; raises ElementTree.ParseError if malformed.
+    """
+    from xml.etree import ElementTree as ET
+
+    result = {"version": None, "classes": [], "other": 0, "bytes": 0, "sha256": ""}
+    with open_export(path) as raw:
+        stream = HashingReader(raw)
+        depth = 0
+        root = None
+        for event, elem in ET.iterparse(stream, events=("start", "end")):
+            if event == "start":
+                if root is None:
+                    root = elem
+                    result["version"] = elem.get("exportversion")
+                depth += 1
+                continue
+            depth -= 1
+            if depth != 1:
+                continue
+            if elem.tag == "Class":
+                result["classes"].append(elem.get("name", ""))
+            else:
+                result["other"] += 1
+            root.clear()
+        result["bytes"] = stream.size
+        result["sha256"] = stream.hash.hexdigest()
+    if root is None or root.tag != "Export":
+        raise ET.ParseError(f"{path}: root element is not <Export>")
+    return result
+
+
+# Symbol index: classes, members, signatures, source line ranges and call
+# edges in SQLite, filled from the model each class is parsed into for
+# rendering and refreshed only for classes whose source hash changed.
+# No lookbehind before the .., which would make the regex engine stop at
+# every position instead of scanning for the literal.
+CALL_SITE = re.compile(
+    r'##class\(\s*([%\w.]+)\s*\)(?:\s*\.\s*(%?\w+))?|\.\.(%?\w+)\s*\(', re.IGNORECASE)
+SYMBOL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS classes (
+    name TEXT PRIMARY KEY,
+    short TEXT NOT NULL,
+    path TEXT,
+    sha256 TEXT NOT NULL,
+    fragment_sha256 TEXT,
+    super TEXT,
+    lines INTEGER,
+    description TEXT
+);
+CREATE INDEX IF NOT EXISTS classes_short ON classes(short);
+CREATE TABLE IF NOT EXISTS members (
+    class TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    name TEXT NOT NULL,
+    signature TEXT,
+    type TEXT,
+    keywords TEXT,
+    start_line INTEGER,
+    end_line INTEGER,
+    description TEXT,
+    PRIMARY KEY (class, kind, name)
+);
+CREATE INDEX IF NOT EXISTS members_name ON members(name);
+CREATE TABLE IF NOT EXISTS calls (
+    class TEXT NOT NULL,
+    member TEXT NOT NULL,
+    line INTEGER,
+    target_class TEXT NOT NULL,
+    target_short TEXT NOT NULL,
+    target_member TEXT
+);
+CREATE INDEX IF NOT EXISTS calls_caller ON calls(class, member);
+CREATE INDEX IF NOT EXISTS calls_target ON calls(target_short, target_member);
+"""
+
+
+def class_symbols(class_name: str, source: str, cls_data=None, check=None) -> dict:
+    """Symbol rows for one class, picklable so workers can return them.
+
+    Pass the ClassDef and ClassCheck of a parse that already happened (as
+    render_class_profiled does) to reuse it; otherwise the source is
+    parsed here. Returns {"class": {...}, "members": [...], "calls": [...]}
+    with 1-based line numbers. Call edges are ##class(X).Member and
+    ..Member( references in method bodies, comments and strings included.
+    """
+    if cls_data is None:
+        check = ClassCheck(source)
+        cls_data = parse_udl_class(source, check)
+    name = cls_data["name"] or class_name
+    package = name.rpartition(".")[0]
+    offsets = check.members if check is not None else {}
+
+    def keywords(member):
+        return ", ".join(k if v == "1" else f"{k} = {v}" for k, v in member["keywords"].items())
+
+    # (kind, name, signature, type, keywords, decl offset, body, description)
+    found = []
+    for param in cls_data["parameters"]:
+        found.append(("Parameter", param.name, param.default, param.type, "",
+                      offsets.get(("Parameter", param.name)), None, param.description))
+    for prop in cls_data["properties"]:
+        found.append(("Property", prop.name, prop.type_full, prop.type, keywords(prop),
+                      offsets.get(("Property", prop.name)), None, prop.description))
+    for index in cls_data["indices"]:
+        found.append(("Index", index.name, index.properties, "", keywords(index),
+                      offsets.get(("Index", index.name)), None, index.description))
+    for method in cls_data["methods"]:
+        signature = f"{method.name}({method.formal_spec})"
+        if method.return_type:
+            signature += f" As {method.return_type}"
+        found.append(("ClassMethod" if method.is_class_method else "Method", method.name,
+                      signature, method.return_type, keywords(method),
+                      offsets.get(("Method", method.name)), method.implementation,
+                      method.description))
+    for xdata in cls_data["xdata"]:
+        found.append(("XData", xdata.name, xdata.keywords.get("MimeType", ""), "",
+                      keywords(xdata), offsets.get(("XData", xdata.name)), xdata.data,
+                      xdata.description))
+    for storage in cls_data["storage"]:
+        found.append(("Storage", storage.name, "", "", "",
+                      offsets.get(("Storage", storage.name)), storage.data, []))
+
+    # Call sites, then every offset turned into a line number in one
+    # forward walk over the source.
+    sites = []
+    for kind, member, *_, body, _ in found:
+        if kind in ("ClassMethod", "Method") and isinstance(body, SourceLines):
+            for match in CALL_SITE.finditer(source, body.start, body.end):
+                if match.group(3):
+                    target, target_member = name, match.group(3)
+                else:
+                    target = qualify_class_name(match.group(1), package)
+                    target_member = match.group(2)
+                sites.append((match.start(), member, target, target_member))
+    wanted = {offset for *_, offset, _, _ in found if offset is not None}
+    wanted.update(body.end for *_, body, _ in found if isinstance(body, SourceLines))
+    wanted.update(site[0] for site in sites)
+    lines = {}
+    line, previous = 1, 0
+    for offset in sorted(wanted):
+        line += source.count("\n", previous, offset)
+        lines[offset] = line
+        previous = offset
+
+    members = []
+    for kind, member, signature, type_, keys, offset, body, desc in found:
+        start = lines.get(offset)
+        end = lines[body.end] if isinstance(body, SourceLines) else start
+        members.append((kind, member, signature, type_, keys, start, end, "\n".join(desc)))
+    calls = [(member, lines[offset], target, target_member or "")
+             for offset, member, target, target_member in sites]
+    return {"class": {"name": name, "super": cls_data["super"],
+                      "lines": source.count("\n") + 1,
+                      "description": "\n".join(cls_data["description"])},
+            "members": members, "calls": calls}
+
+
+def open_symbols(path):
+    """Open (creating if needed) a symbol index database."""
+    import sqlite3
+
+    conn = sqlite3.connect(str(path))
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SYMBOL_SCHEMA)
+    return conn
+
+
+def indexed_classes(conn) -> dict:
+    """{class name: source sha256} of everything in the index."""
+    return dict(conn.execute("SELECT name, sha256 FROM classes"))
+
+
+def update_symbols(conn, name: str, path: str, sha256: str, symbols,
+                   fragment_sha256=None) -> None:
+    """Replace one class's rows with freshly extracted symbols; with
+    symbols None only its path and fragment hash are brought up to date."""
+    if symbols is None:
+        conn.execute("UPDATE classes SET path = ?, fragment_sha256 = ? WHERE name = ?",
+                     (path, fragment_sha256, name))
+        return
+    info = symbols["class"]
+    name = info["name"]
+    conn.execute("DELETE FROM members WHERE class = ?", (name,))
+    conn.execute("DELETE FROM calls WHERE class = ?", (name,))
+    conn.execute("INSERT OR REPLACE INTO classes VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                 (name, name.rpartition(".")[2], path, sha256, fragment_sha256,
+                  info["super"], info["lines"], info["description"]))
+    conn.executemany("INSERT OR REPLACE INTO members VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                     [(name, *member) for member in symbols["members"]])
+    conn.executemany("INSERT INTO calls VALUES (?, ?, ?, ?, ?, ?)",
+                     [(name, member, line, target, target.rpartition(".")[2], target_member)
+                      for member, line, target, target_member in symbols["calls"]])
+
+
+def prune_symbols(conn, keep) -> list:
+    """Drop the classes not in keep; returns their names."""
+    gone = sorted(set(indexed_classes(conn)) - set(keep))
+    for name in gone:
+        for table, column in (("members", "class"), ("calls", "class"), ("classes", "name")):
+            conn.execute(f"DELETE FROM {table} WHERE {column} = ?", (name,))
+    return gone
+
+
+def lookup_symbol(conn, symbol: str) -> dict:
+    """Definitions of symbol and the call sites that reference it.
+
+    symbol is Member, Class or Class.Member, where Class may be the full
+    name or just its last part. Returns {"classes": [...], "members":
+    [...], "callers": [...]} as lists of row dicts.
+    """
+    import sqlite3
+
+    cursor = conn.cursor()
+    cursor.row_factory = sqlite3.Row
+    owner, _, member = symbol.rpartition(".")
+    classes = cursor.execute(
+        "SELECT * FROM classes WHERE name = ?1 OR short = ?1 ORDER BY name", (symbol,)).fetchall()
+    if owner:
+        members = cursor.execute(
+            "SELECT m.*, c.path FROM members m JOIN classes c ON c.name = m.class "
+            "WHERE m.name = ?2 AND (c.name = ?1 OR c.short = ?1) ORDER BY m.class",
+            (owner, member)).fetchall()
+        callers = cursor.execute(
+            "SELECT k.*, c.path FROM calls k JOIN classes c ON c.name = k.class "
+            "WHERE k.target_member = ?2 AND (k.target_class = ?1 OR k.target_short = ?1) "
+            "ORDER BY k.class, k.line", (owner, member)).fetchall()
+    else:
+        members = cursor.execute(
+            "SELECT m.*, c.path FROM members m JOIN classes c ON c.name = m.class "
+            "WHERE m.name = ? ORDER BY m.class", (symbol,)).fetchall()
+        callers = cursor.execute(
+            "SELECT k.*, c.path FROM calls k JOIN classes c ON c.name = k.class "
+            "WHERE k.target_member = ? ORDER BY k.class, k.line", (symbol,)).fetchall()
+    if classes and not members:
+        # A class: list its members and every reference to it
+        names = [row["name"] for row in classes]
+        marks = ", ".join("?" * len(names))
+        members = cursor.execute(
+            f"SELECT m.*, c.path FROM members m JOIN classes c ON c.name = m.class "
+            f"WHERE m.class IN ({marks}) ORDER BY m.class, m.start_line", names).fetchall()
+        callers = cursor.execute(
+            f"SELECT k.*, c.path FROM calls k JOIN classes c ON c.name = k.class "
+            f"WHERE k.target_class IN ({marks}) AND k.class NOT IN ({marks}) "
+            f"ORDER BY k.class, k.line", names + names).fetchall()
+    return {"classes": [dict(row) for row in classes],
+            "members": [dict(row) for row in members],
+            "callers": [dict(row) for row in callers]}
+
+
+# Retrieval index: the knowledge documents chunked by heading and the
+# classes by member, with BM25 term postings in SQLite, so prompt context
+# can be the top few relevant chunks instead of whole documents. Class
+# chunks take their line ranges from class_symbols().
+HEADING = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+SEARCH_WORD = re.compile(r"[A-Za-z0-9]+")
+# Parts of a camelCase or PascalCase word: WriteClass, HL7Message, XMLExport
+WORD_PART = re.compile(r"[A-Z]+[0-9]*(?![a-z])|[A-Z]?[a-z]+[0-9]*|[0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have if in is it its of on or so that "
+    "the this to was were will with".split())
+BM25_K1 = 1.2
+BM25_B = 0.75
+RETRIEVAL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    name TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    path TEXT,
+    sha256 TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    id INTEGER PRIMARY KEY,
+    document TEXT NOT NULL,
+    title TEXT NOT NULL,
+    start_line INTEGER,
+    end_line INTEGER,
+    length INTEGER NOT NULL,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS chunks_document ON chunks(document);
+CREATE TABLE IF NOT EXISTS terms (
+    id INTEGER PRIMARY KEY,
+    term TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS postings (
+    term INTEGER NOT NULL,
+    chunk INTEGER NOT NULL,
+    tf INTEGER NOT NULL,
+    PRIMARY KEY (term, chunk)
+) WITHOUT ROWID;
+"""
+
+
+def search_terms(text: str) -> list:
+    """Lower-cased index terms of text, stopwords dropped. A camelCase
+    word gives itself and its parts, so WriteClass is found by "write
+    class" and by "writeclass"."""
+    terms = []
+    for word in SEARCH_WORD.findall(text):
+        lower = word.lower()
+        if len(lower) > 1 and lower not in STOPWORDS:
+            terms.append(lower)
+        parts = WORD_PART.findall(word)
+        if len(parts) > 1:
+            terms.extend(part for part in map(str.lower, parts)
+                         if len(part) > 1 and part not in STOPWORDS)
+    return terms
+
+
+def markdown_chunks(text: str, title: str) -> list:
+    """A markdown document split at its headings (not those inside ```
+    fences): [(title, start line, end line, text)], where a chunk's title
+    is title and its heading path, "doc > Section > Subsection". Sections
+    with nothing but a heading are left out."""
+    chunks = []
+    path = []
+    lines = text.split("\n")
+    start, fenced = 0, False
+
+    def flush(end):
+        body = lines[start:end]
+        while body and not body[-1].strip():
+            body.pop()
+        if any(line.strip() and not HEADING.match(line) for line in body):
+            heading = " > ".join([title] + [name for _, name in path])
+            chunks.append((heading, start + 1, start + len(body), "\n".join(body)))
+
+    for number, line in enumerate(lines):
+        if line.lstrip().startswith("```"):
+            fenced = not fenced
+            continue
+        match = None if fenced else HEADING.match(line)
+        if match:
+            flush(number)
+            level = len(match.group(1))
+            path = [(depth, name) for depth, name in path if depth < level]
+            path.append((level, match.group(2)))
+            start = number
+    flush(len(lines))
+    return chunks
+
+
+def class_chunks(symbols: dict, source: str) -> list:
+    """A class split by member, from its class_symbols() and the source
+    they were taken from: one chunk for the class declaration and
+    description, then one per member holding its description and
+    source lines. Same shape as markdown_chunks()."""
+    info = symbols["class"]
+    lines = source.split("\n")
+    extends = f" Extends {info['super']}" if info["super"] else ""
+    first = min((member[5] for member in symbols["members"] if member[5]), default=info["lines"] + 1)
+    header = [f"/// {line}" for line in info["description"].split("\n") if info["description"]]
+    chunks = [(info["name"], 1, first - 1, "\n".join(header + [f"Class {info['name']}{extends}"]))]
+    for kind, name, signature, _, _, start, end, description in symbols["members"]:
+        if kind == "Storage":
+            continue
+        text = [f"/// {line}" for line in description.split("\n") if description]
+        if start:
+            text.extend(lines[start - 1:end])
+        else:
+            text.append(f"{kind} {signature or name}")
+        chunks.append((f"{info['name']}:{kind} {name}", start, end, "\n".join(text)))
+    return chunks
+
+
+def open_retrieval(path):
+    """Open (creating if needed) a retrieval index database."""
+    import sqlite3
+
+    conn = sqlite3.connect(str(path))
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(RETRIEVAL_SCHEMA)
+    return conn
+
+
+def indexed_documents(conn, kind=None) -> dict:
+    """{document name: sha256} of everything in the index, or of one kind
+    ("class", "markdown")."""
+    if kind is None:
+        return dict(conn.execute("SELECT name, sha256 FROM documents"))
+    return dict(conn.execute("SELECT name, sha256 FROM documents WHERE kind = ?", (kind,)))
+
+
+def delete_document(conn, name: str) -> None:
+    # postings has no index on chunk; at this size a scan is cheaper than
+    # the space a second index would take
+    conn.execute("DELETE FROM postings WHERE chunk IN "
+                 "(SELECT id FROM chunks WHERE document = ?)", (name,))
+    conn.execute("DELETE FROM chunks WHERE document = ?", (name,))
+    conn.execute("DELETE FROM documents WHERE name = ?", (name,))
+
+
+def update_document(conn, name: str, kind: str, path: str, sha256: str, chunks: list) -> None:
+    """Replace one document's chunks and postings."""
+    from collections import Counter
+
+    delete_document(conn, name)
+    conn.execute("INSERT INTO documents VALUES (?, ?, ?, ?)", (name, kind, path, sha256))
+    for title, start, end, text in chunks:
+        counts = Counter(search_terms(f"{title}\n{text}"))
+        chunk = conn.execute("INSERT INTO chunks (document, title, start_line, end_line, "
+                             "length, text) VALUES (?, ?, ?, ?, ?, ?)",
+                             (name, title, start, end, sum(counts.values()), text)).lastrowid
+        conn.executemany("INSERT OR IGNORE INTO terms (term) VALUES (?)",
+                         [(term,) for term in counts])
+        conn.executemany("INSERT INTO postings SELECT id, ?, ? FROM terms WHERE term = ?",
+                         [(chunk, tf, term) for term, tf in counts.items()])
+
+
+def prune_documents(conn, keep) -> list:
+    """Drop the documents not in keep, and terms no chunk uses any more;
+    returns the dropped names."""
+    gone = sorted(set(indexed_documents(conn)) - set(keep))
+    for name in gone:
+        delete_document(conn, name)
+    conn.execute("DELETE FROM terms WHERE id NOT IN (SELECT term FROM postings)")
+    return gone
+
+
+def search(conn, query: str, k: int = 5, kind=None) -> list:
+    """The k chunks that best match query by BM25, best first, as dicts
+    with document, kind, path, title, start_line, end_line, score and
+    text. kind restricts the results to "class" or "markdown" chunks."""
+    import math
+
+    count, total = conn.execute("SELECT count(*), total(length) FROM chunks").fetchone()
+    if not count:
+        return []
+    average = total / count
+    scores = {}
+    for term in dict.fromkeys(search_terms(query)):
+        postings = conn.execute(
+            "SELECT p.chunk, p.tf, c.length FROM postings p JOIN chunks c ON c.id = p.chunk "
+            "WHERE p.term = (SELECT id FROM terms WHERE term = ?)", (term,)).fetchall()
+        if not postings:
+            continue
+        idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+        for chunk, tf, length in postings:
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * length / average)
+            scores[chunk] = scores.get(chunk, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+    results = []
+    for chunk, score in sorted(scores.items(), key=lambda item: (-item[1], item[0])):
+        row = conn.execute(
+            "SELECT c.document, d.kind, d.path, c.title, c.start_line, c.end_line, c.text "
+            "FROM chunks c JOIN documents d ON d.name = c.document WHERE c.id = ?",
+            (chunk,)).fetchone()
+        if kind is not None and row[1] != kind:
+            continue
+        results.append(dict(zip(("document", "kind", "path", "title", "start_line",
+                                 "end_line", "text"), row), score=round(score, 4)))
+        if len(results) == k:
+            break
+    return results
+
+
+# Rendering and the incremental build cache
+def render_class_profiled(class_name: str, source: str, trace_memory: bool = False,
+                          symbols: bool = False, emitters=()) -> tuple:
+    """Parse one UDL source and render its XML fragment, validating and
+    measuring as it goes.
+
+    Pure function of its arguments so it can run in a worker process.
+    class_name is the path-derived fallback used when the source has no
+    Class declaration.
+
+    Returns (xml, stats, diagnostics, symbols, outputs): stats has parse,
+    render, escape and validate (both part of render), symbols and emit
+    seconds, and with trace_memory the tracemalloc peak of the class in
+    bytes; diagnostics is the list of Diagnostic records, with file left
+    for the caller to fill in; symbols is the class_symbols() of the parse
+    when asked for, else None; outputs maps the name of each of emitters
+    to its fragment of the class, rendered from the same parse.
+    """
+    if trace_memory:
+        import tracemalloc
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+
+    escape_time = 0.0
+
+    def timed_escape(text):
+        nonlocal escape_time
+        start = time.perf_counter()
+        result = escape_xml(text)
+        escape_time += time.perf_counter() - start
+        return result
+
+    start = time.perf_counter()
+    check = ClassCheck(source)
+    cls_data = parse_udl_class(source, check)
+    if not cls_data["name"]:
+        cls_data["name"] = class_name
+    parsed = time.perf_counter()
+    validate_time = [0.0]
+    xml_content = render_checked(cls_data, check, timed_escape, validate_time)
+    rendered = time.perf_counter()
+
+    stats = {"parse": parsed - start, "render": rendered - parsed, "escape": escape_time,
+             "validate": validate_time[0]}
+    if trace_memory:
+        stats["peak_bytes"] = tracemalloc.get_traced_memory()[1] - baseline
+    if symbols:
+        symbols = class_symbols(class_name, source, cls_data, check)
+    indexed = time.perf_counter()
+    stats["symbols"] = indexed - rendered
+    outputs = {emitter.name: emitter.fragment(cls_data) for emitter in emitters}
+    stats["emit"] = time.perf_counter() - indexed
+    return xml_content, stats, check.diagnostics, symbols or None, outputs
+
+
+def render_extras(class_name: str, source: str, symbols: bool = False, emitters=()) -> tuple:
+    """(symbols, outputs, stats) as render_class_profiled() returns them,
+    for a class whose XML came from the cache: one parse, no XML
+    rendering. stats has the parse, symbols and emit seconds."""
+    start = time.perf_counter()
+    check = ClassCheck(source)
+    cls_data = parse_udl_class(source, check)
+    if not cls_data["name"]:
+        cls_data["name"] = class_name
+    parsed = time.perf_counter()
+    symbols = class_symbols(class_name, source, cls_data, check) if symbols else None
+    indexed = time.perf_counter()
+    outputs = {emitter.name: emitter.fragment(cls_data) for emitter in emitters}
+    stats = {"parse": parsed - start, "symbols": indexed - parsed,
+             "emit": time.perf_counter() - indexed}
+    return symbols, outputs, stats
+
+
+def generator_fingerprint() -> str:
+    """Hash of this module's own source.
+
+    Part of every cache key, so editing the generator invalidates all
+    cached fragments without a manually bumped version number.
+    """
+    return hashlib.sha256(Path(__file__).read_bytes()).hexdigest()[:16]
+
+
+def cache_key(fingerprint: str, class_name: str, source: str) -> str:
+    """Cache key for one class: generator version + fallback name + source."""
+    h = hashlib.sha256()
+    h.update(fingerprint.encode("utf-8"))
+    h.update(b"\0")
+    h.update(class_name.encode("utf-8"))
+    h.update(b"\0")
+    h.update(source.encode("utf-8"))
+    return h.hexdigest()
+
+
+def cache_load(cache_dir: Path, key: str):
+    """Return the cached XML fragment for key, or None on a miss."""
+    try:
+        return (cache_dir / f"{key}.xml").read_text(encoding="utf-8")
+    except (OSError, UnicodeDecodeError):
+        return None
+
+
+def cache_store(cache_dir: Path, key: str, xml_content: str) -> None:
+    """Store a rendered fragment. Written to a temp file and renamed so a
+    concurrent or interrupted run never sees a partial entry."""
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    target = cache_dir / f"{key}.xml"
+    tmp = cache_dir / f"{key}.{os.getpid()}.tmp"
+    tmp.write_text(xml_content, encoding="utf-8")
+    os.replace(tmp, target)
+
+
+# Age after which a cache temp file is taken to be left over from a run
+# that died between writing and renaming it
+CACHE_TMP_STALE_SECONDS = 3600
+
+
+def cache_evict(cache_dir: Path, keep: set) -> int:
+    """Delete cached fragments whose key was not used by this run.
+
+    Temp files are only removed once stale: a younger one may be a
+    fragment another run (--watch, --batch) is about to rename into
+    place, and those runs write the cache without the store lock.
+    """
+    if not cache_dir.is_dir():
+        return 0
+    stale = time.time() - CACHE_TMP_STALE_SECONDS
+    removed = 0
+    for entry in cache_dir.iterdir():
+        try:
+            unused = (entry.stem not in keep if entry.suffix == ".xml"
+                      else entry.suffix == ".tmp" and entry.stat().st_mtime < stale)
+        except OSError:
+            continue    # renamed away meanwhile
+        if unused:
+            try:
+                entry.unlink()
+                removed += 1
+            except OSError:
+                pass
+    return removed
+
+
+# Export pipeline. An entry is a dict describing one input class as it
+# moves from discovery through rendering.
+def new_entry(path: str, name: str, file=None, source=None) -> dict:
+    return {"path": path, "name": name, "file": file, "source": source,
+            "key": None, "xml": None, "cached": False, "error": None, "diagnostics": [],
+            "sha256": None, "symbols": None, "outputs": {}}
+
+
+def iter_entries(items) -> Iterator[dict]:
+    """Entries for a mix of .cls files, directories of them, UDL sources
+    and entries made elsewhere (iter_ndjson), produced as items are read.
+
+    Path objects are files or directories (searched recursively); plain
+    strings are UDL source text; dicts are passed through.
+    """
+    for number, item in enumerate(items):
+        if isinstance(item, os.PathLike):
+            item = Path(item)
+            if item.is_dir():
+                for cls_path in discover_classes(item):
+                    yield new_entry(cls_path, class_name_from_path(cls_path), file=item / cls_path)
+            else:
+                yield new_entry(str(item), item.stem, file=item)
+        elif isinstance(item, dict):
+            yield item
+        else:
+            yield new_entry(f"<source {number}>", "", source=item)
+
+
+def collect_entries(items) -> list:
+    return list(iter_entries(items))
+
+
+class NotAClass(ValueError):
+    """A generation record that is valid but is not a class (a
+    LookupTable, say): skipped, not failed."""
+
+
+def iter_ndjson(lines, label: str = "<stdin>") -> Iterator[dict]:
+    """Entries for AIAgent.Model.GenerationClass records, one JSON object
+    per line as GetByGeneration/ToJSON() shapes them (className,
+    classType, source, ...), produced as each line arrives.
+
+    A line that is not such a record becomes an entry with "error" set so
+    the caller can report it and carry on. A record whose source has no
+    Class declaration (classType LookupTable, say) gets a NotAClass
+    error, which callers report as skipped rather than failed.
+    """
+    import json
+
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        entry = new_entry(f"{label}:{number}", "")
+        try:
+            record = json.loads(line)
+            source = record["source"]
+            if not isinstance(source, str):
+                raise TypeError("source is not a string")
+        except (ValueError, KeyError, TypeError) as e:
+            entry["error"] = ValueError(f"not a GenerationClass record ({type(e).__name__}: {e})")
+            yield entry
+            continue
+        name = record.get("className") or ""
+        entry["name"] = name
+        if CLASS_DECL_LINE.search(source) is None:
+            kind = record.get("classType") or "record"
+            entry["error"] = NotAClass(f"{kind} {name} has no Class declaration, skipped")
+            yield entry
+            continue
+        if name:
+            entry["path"] = name.replace(".", "/") + ".cls"
+        entry["source"] = source
+        yield entry
+
+
+def plan_entries(entries: list) -> tuple:
+    """Scan entries for dependencies and put them in compile order.
+
+    Returns (entries, phases, cycles, errors); each entry gains "phase"
+    (1-based) and "deps", the exported classes it depends on. Entries that
+    cannot be read or redefine an earlier class are dropped and reported
+    in errors. File
+    sources are only scanned here, not kept: they are read again when
+    each class is rendered.
+    """
+    errors = []
+    deps = {}
+    by_name = {}
+    for entry in entries:
+        if entry["error"] is not None:
+            errors.append(f"{entry['path']}: {entry['error']}")
+            continue
+        source = entry["source"]
+        if source is None:
+            try:
+                source = entry["file"].read_text(encoding="utf-8")
+            except Exception as e:
+                errors.append(f"{entry['path']}: {e}")
+                continue
+        info = scan_dependencies(source, entry["name"])
+        name = info["name"]
+        if name in by_name:
+            errors.append(f"{entry['path']}: duplicate class {name} (see {by_name[name]['path']})")
+            continue
+        entry["name"] = name
+        by_name[name] = entry
+        deps[name] = info
+
+    phases, cycles = order_classes(deps)
+    for number, phase in enumerate(phases, 1):
+        for name in phase:
+            info = deps[name]
+            by_name[name]["phase"] = number
+            by_name[name]["deps"] = sorted((info["hard"] | info["soft"]) & deps.keys() - {name})
+    ordered = [by_name[name] for phase in phases for name in phase]
+    return ordered, phases, cycles, errors
+
+
+def load_entry(entry: dict, cache_dir, fingerprint: str, canonical: bool = False) -> None:
+    """Read an entry's source and fill in its cached fragment, if any.
+    canonical normalizes the source's line endings and the trailing blanks
+    outside its bodies first (canonical_source)."""
+    if entry["error"] is not None:
+        return
+    start = time.perf_counter()
+    if entry["source"] is None:
+        try:
+            entry["source"] = entry["file"].read_text(encoding="utf-8")
+        except Exception as e:
+            entry["error"] = e
+            return
+    if canonical:
+        try:
+            entry["source"] = canonical_source(entry["source"])
+        except Exception as e:
+            entry["error"] = e
+            return
+    loaded = time.perf_counter()
+    entry["stats"] = {"read": loaded - start,
+                      "bytes_in": len(entry["source"].encode("utf-8"))}
+    if cache_dir is not None:
+        entry["key"] = cache_key(fingerprint, entry["name"], entry["source"])
+        entry["xml"] = cache_load(cache_dir, entry["key"])
+        entry["cached"] = entry["xml"] is not None
+        entry["stats"]["cache"] = time.perf_counter() - loaded
+
+
+def iter_rendered(entries: list, jobs: int, cache_dir, fingerprint: str,
+                  trace_memory: bool = False, indexed=None, emitters=(),
+                  canonical: bool = False):
+    """Yield entries in order with "xml" (or "error"), "stats" and
+    "diagnostics" filled in. Cached fragments have no diagnostics: only
+    fragments that passed validation are meant to be cached.
+
+    indexed, if given, is indexed_classes() of a symbol index: each entry
+    then gets "sha256" (of its source) and, when that differs from the
+    index, "symbols" taken from the same parse that renders it. emitters
+    (Emitter instances other than the XML one) fill in "outputs",
+    {name: fragment}, from that parse as well. A cached class that needs
+    symbols or outputs is parsed for them alone. canonical is passed on to
+    load_entry().
+
+    With jobs > 1, cache misses are rendered on a process pool but only a
+    small window of classes is in flight at once, so memory stays bounded
+    while output order still follows the entries list.
+    """
+    def wants_symbols(entry):
+        if indexed is None or entry["error"] is not None:
+            return False
+        entry["sha256"] = hashlib.sha256(entry["source"].encode("utf-8")).hexdigest()
+        return indexed.get(entry["name"]) != entry["sha256"]
+
+    def store_result(entry, result):
+        if entry["xml"] is None:
+            entry["xml"], stats, entry["diagnostics"], entry["symbols"], entry["outputs"] = result
+        else:
+            entry["symbols"], entry["outputs"], stats = result
+        entry["stats"].update(stats)
+
+    if jobs <= 1:
+        for entry in entries:
+            load_entry(entry, cache_dir, fingerprint, canonical)
+            symbols = wants_symbols(entry)
+            try:
+                if entry["xml"] is None and entry["error"] is None:
+                    store_result(entry, render_class_profiled(
+                        entry["name"], entry["source"], trace_memory, symbols, emitters))
+                elif entry["error"] is None and (symbols or emitters):
+                    store_result(entry, render_extras(entry["name"], entry["source"],
+                                                      symbols, emitters))
+            except Exception as e:
+                entry["error"] = e
+            for diagnostic in entry["diagnostics"]:
+                diagnostic.file = entry["path"]
+            entry["source"] = None
+            yield entry
+        return
+
+    def finish(entry):
+        future = entry.pop("future", None)
+        if future is not None:
+            try:
+                store_result(entry, future.result())
+            except Exception as e:
+                entry["error"] = e
+        for diagnostic in entry["diagnostics"]:
+            diagnostic.file = entry["path"]
+        entry["source"] = None
+        return entry
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    window = deque()
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        for entry in entries:
+            load_entry(entry, cache_dir, fingerprint, canonical)
+            symbols = wants_symbols(entry)
+            if entry["xml"] is None and entry["error"] is None:
+                entry["future"] = pool.submit(render_class_profiled, entry["name"],
+                                              entry["source"], trace_memory, symbols, emitters)
+            elif entry["error"] is None and (symbols or emitters):
+                entry["future"] = pool.submit(render_extras, entry["name"], entry["source"],
+                                              symbols, emitters)
+            window.append(entry)
+            while len(window) > jobs * 2:
+                yield finish(window.popleft())
+        while window:
+            yield finish(window.popleft())
+
+
+# Reverse conversion: IRIS XML export -> UDL .cls files.
+FORMALSPEC_PARAM = re.compile(r'(\w+)(?::([%\w.]+(?:\([^)]*\))?))?(?:=(.*))?$', re.DOTALL)
+BARE_KEYWORD_VALUE = re.compile(r'[%\w.]+')
+NUMBER = re.compile(r'-?\d+(?:\.\d+)?')
+# Elements IRIS adds to exports that have no UDL spelling
+EXPORT_ONLY = {"TimeChanged", "TimeCreated", "SequenceNumber"}
+
+
+def xml_formalspec_to_udl(xml_spec: str) -> str:
+    """Convert an IRIS XML FormalSpec back to UDL (inverse of udl_formalspec_to_xml).
+
+    XML:  param:%String,param2:%Integer=0,*pOut:%String
+    UDL:  param As %String, param2 As %Integer = 0, Output pOut As %String
+    """
+    udl_params = []
+    for param in split_params(xml_spec):
+        param = param.strip()
+        if not param:
+            continue
+        prefix = ""
+        if param.startswith("*"):
+            prefix = "Output "
+            param = param[1:]
+        elif param.startswith("&"):
+            prefix = "ByRef "
+            param = param[1:]
+        m = FORMALSPEC_PARAM.match(param)
+        if not m:
+            udl_params.append(prefix + param)
+            continue
+        name, ptype, default = m.groups()
+        text = prefix + name
+        if ptype:
+            text += f" As {ptype}"
+        if default is not None:
+            text += f" = {default}"
+        udl_params.append(text)
+    return ", ".join(udl_params)
+
+
+def udl_literal(value: str) -> str:
+    """A parameter value as UDL: numbers and quoted strings as is, else quoted."""
+    if NUMBER.fullmatch(value) or (len(value) > 1 and value[0] == value[-1] == '"'):
+        return value
+    return '"' + value.replace('"', '""') + '"'
+
+
+def udl_keywords(pairs) -> str:
+    """Render (keyword, value) pairs as " [ Key = Value, Flag ]" ("" if none)."""
+    parts = []
+    for key, value in pairs:
+        if key == "InitialExpression":
+            parts.append(f"{key} = {{{value}}}")
+        elif value == "1":
+            parts.append(key)
+        elif value == "0":
+            parts.append(f"Not {key}")
+        elif BARE_KEYWORD_VALUE.fullmatch(value):
+            parts.append(f"{key} = {value}")
+        elif all(BARE_KEYWORD_VALUE.fullmatch(v.strip()) for v in value.split(",")):
+            parts.append(f"{key} = ({', '.join(v.strip() for v in value.split(','))})")
+        else:
+            parts.append(f"{key} = {udl_literal(value)}")
+    return f" [ {', '.join(parts)} ]" if parts else ""
+
+
+def member_keywords(elem, handled: set) -> list:
+    """(tag, text) for the simple child elements not already handled."""
+    return [(child.tag, child.text or "") for child in elem
+            if child.tag not in handled and child.tag not in EXPORT_ONLY]
+
+
+def type_params(elem) -> str:
+    """<Parameter name= value=/> children as "(NAME = value, ...)"."""
+    params = [f'{p.get("name")} = {udl_literal(p.get("value", ""))}'
+              for p in elem.findall("Parameter")]
+    return f"({', '.join(params)})" if params else ""
+
+
+def cdata_lines(elem) -> list:
+    """Lines of a CDATA body, without the newlines that wrap it in the export."""
+    if elem is None or not elem.text:
+        return []
+    text = elem.text
+    if text.startswith("\n"):
+        text = text[1:]
+    if text.endswith("\n"):
+        text = text[:-1]
+    return text.split("\n") if text else []
+
+
+def storage_lines(elem) -> list:
+    """Serialize a <Storage> element's children back to the UDL block text."""
+    from xml.etree import ElementTree as ET
+    text = (elem.text or "") + "".join(ET.tostring(child, encoding="unicode") for child in elem)
+    return text.strip("\n").split("\n") if text.strip() else []
+
+
+def iter_description(elem):
+    desc = elem.find("Description")
+    if desc is not None and desc.text is not None:
+        for line in desc.text.split("\n"):
+            yield f"/// {line}"
+
+
+def iter_member_udl(elem):
+    """Yield the UDL lines of one class member element (none if unknown)."""
+    name = elem.get("name")
+    tag = elem.tag
+    if tag == "Parameter":
+        decl = f"Parameter {name}"
+        if elem.findtext("Type"):
+            decl += f" As {elem.findtext('Type')}"
+        decl += udl_keywords(member_keywords(elem, {"Description", "Type", "Default"}))
+        if elem.find("Default") is not None:
+            decl += f" = {udl_literal(elem.findtext('Default'))}"
+        yield from iter_description(elem)
+        yield decl + ";"
+    elif tag == "Property":
+        kind = "Relationship" if elem.findtext("Relationship") == "1" else "Property"
+        ptype = (elem.findtext("Type") or "") + type_params(elem)
+        if elem.findtext("Collection"):
+            ptype = f"{elem.findtext('Collection')} Of {ptype}"
+        handled = {"Description", "Type", "Parameter", "Collection", "Relationship"}
+        yield from iter_description(elem)
+        yield f"{kind} {name} As {ptype}{udl_keywords(member_keywords(elem, handled))};"
+    elif tag == "Index":
+        props = elem.findtext("Properties") or ""
+        if "," in props and not props.startswith("("):
+            props = f"({', '.join(p.strip() for p in props.split(','))})"
+        yield from iter_description(elem)
+        yield f"Index {name} On {props}{udl_keywords(member_keywords(elem, {'Description', 'Properties'}))};"
+    elif tag == "ForeignKey":
+        refs = elem.findtext("ReferencedClass") or ""
+        if elem.findtext("ReferencedKey"):
+            refs += f"({elem.findtext('ReferencedKey')})"
+        handled = {"Description", "Properties", "ReferencedClass", "ReferencedKey"}
+        yield from iter_description(elem)
+        yield (f"ForeignKey {name}({elem.findtext('Properties') or ''}) References {refs}"
+               f"{udl_keywords(member_keywords(elem, handled))};")
+    elif tag == "Projection":
+        yield from iter_description(elem)
+        yield (f"Projection {name} As {elem.findtext('Type') or ''}{type_params(elem)}"
+               f"{udl_keywords(member_keywords(elem, {'Description', 'Type', 'Parameter'}))};")
+    elif tag == "Method":
+        keyword = "ClassMethod" if elem.findtext("ClassMethod") == "1" else "Method"
+        decl = f"{keyword} {name}({xml_formalspec_to_udl(elem.findtext('FormalSpec') or '')})"
+        if elem.findtext("ReturnType"):
+            decl += f" As {elem.findtext('ReturnType')}"
+            if elem.findtext("ReturnTypeParams"):
+                decl += f"({elem.findtext('ReturnTypeParams')})"
+        handled = {"Description", "ClassMethod", "FormalSpec", "ReturnType",
+                   "ReturnTypeParams", "Implementation"}
+        yield from iter_description(elem)
+        yield decl + udl_keywords(member_keywords(elem, handled))
+        yield "{"
+        yield from cdata_lines(elem.find("Implementation"))
+        yield "}"
+    elif tag == "Query":
+        decl = f"Query {name}({xml_formalspec_to_udl(elem.findtext('FormalSpec') or '')})"
+        decl += f" As {elem.findtext('Type') or '%Query'}{type_params(elem)}"
+        handled = {"Description", "FormalSpec", "Type", "Parameter", "SqlQuery"}
+        yield from iter_description(elem)
+        yield decl + udl_keywords(member_keywords(elem, handled))
+        yield "{"
+        yield from cdata_lines(elem.find("SqlQuery"))
+        yield "}"
+    elif tag == "Trigger":
+        yield from iter_description(elem)
+        yield f"Trigger {name}{udl_keywords(member_keywords(elem, {'Description', 'Code'}))}"
+        yield "{"
+        yield from cdata_lines(elem.find("Code"))
+        yield "}"
+    elif tag == "XData":
+        yield from iter_description(elem)
+        yield f"XData {name}{udl_keywords(member_keywords(elem, {'Description', 'Data'}))}"
+        yield "{"
+        yield from cdata_lines(elem.find("Data"))
+        yield "}"
+    elif tag == "Storage":
+        yield f"Storage {name}"
+        yield "{"
+        yield from storage_lines(elem)
+        yield "}"
+
+
+def class_to_udl(elem) -> str:
+    """Convert one <Class> element of an IRIS export to UDL source."""
+    members = [child for child in elem if child.get("name") is not None]
+    keywords = [(child.tag, child.text or "") for child in elem
+                if child.get("name") is None and len(child) == 0
+                and child.tag not in ("Description", "Super") and child.tag not in EXPORT_ONLY]
+
+    lines = list(iter_description(elem))
+    decl = f"Class {elem.get('name')}"
+    if elem.findtext("Super"):
+        decl += f" Extends {elem.findtext('Super')}"
+    lines.append(decl + udl_keywords(keywords))
+    lines.append("{")
+    lines.append("")
+    for member in members:
+        member_lines = list(iter_member_udl(member))
+        if member_lines:
+            lines.extend(member_lines)
+            lines.append("")
+    lines.append("}")
+    return "\n".join(lines) + "\n"
+
+
+def iter_reverse(export_file) -> Iterator[tuple]:
+    """Stream an IRIS XML export, yielding (tag, name, udl) per top-level item.
+
+    udl is the UDL source for <Class> items and None for anything else.
+    Each item is converted as soon as its end tag is parsed and then
+    cleared from the tree, so memory stays at roughly one class no matter
+    how large the export is.
+    """
+    from xml.etree import ElementTree as ET
+
+    depth = 0
+    root = None
+    for event, elem in ET.iterparse(export_file, events=("start", "end")):
+        if event == "start":
+            if root is None:
+                root = elem
+            depth += 1
+            continue
+        depth -= 1
+        if depth != 1:
+            continue
+        udl = class_to_udl(elem) if elem.tag == "Class" else None
+        yield elem.tag, elem.get("name", ""), udl
+        root.clear()
+
+
+# Public API
+def parse(source: str) -> ClassDef:
+    """Parse UDL class source into a ClassDef."""
+    return parse_udl_class(source)
+
+
+def check(source: str, path: str = "<source>") -> list:
+    """Parse, render and validate one UDL class; returns its Diagnostics."""
+    _, _, diagnostics, _, _ = render_class_profiled("", source)
+    for diagnostic in diagnostics:
+        diagnostic.file = path
+    return diagnostics
+
+
+def iter_exported(items, order: bool = True, cache_dir=None, jobs: int = 1,
+                  strict: bool = False, emitters=(), canonical: bool = False) -> Iterator[dict]:
+    """The entries behind export(), with "xml" and "outputs" filled in."""
+    entries = (entry for entry in iter_entries(items)
+               if not isinstance(entry["error"], NotAClass))
+    if order:
+        entries, _, _, errors = plan_entries(list(entries))
+        if errors:
+            raise ValueError("; ".join(errors))
+    fingerprint = generator_fingerprint() if cache_dir is not None else ""
+    for entry in iter_rendered(entries, jobs, cache_dir, fingerprint, emitters=emitters,
+                               canonical=canonical):
+        if entry["error"] is not None:
+            raise ValueError(f"{entry['path']}: {entry['error']}") from entry["error"]
+        errors = [str(d) for d in entry["diagnostics"] if d.severity == "error"]
+        if strict and errors:
+            raise ValueError("; ".join(errors))
+        if cache_dir is not None and not entry["cached"] and not entry["diagnostics"]:
+            cache_store(cache_dir, entry["key"], entry["xml"])
+        yield entry
+
+
+def export(items, *, order: bool = True, cache_dir=None, jobs: int = 1,
+           strict: bool = False, canonical: bool = False) -> Iterator[str]:
+    """Yield the XML fragment of each class in items.
+
+    items mixes Path objects (.cls files or directories searched
+    recursively), UDL source strings and iter_ndjson() records (those
+    that are not classes are skipped). Classes come out in dependency order unless order is False, in which case
+    they keep input order and are rendered as items arrive.
+    Pass cache_dir to reuse and store rendered fragments, and jobs > 1 to
+    render on worker processes. Unreadable or unparsable classes raise,
+    and with strict so do classes the validator reports errors for.
+    Fragments with diagnostics are not cached. canonical normalizes
+    each source's line endings and trailing whitespace before parsing.
+    """
+    for entry in iter_exported(items, order, cache_dir, jobs, strict, canonical=canonical):
+        yield entry["xml"]
+
+
+def export_to(sinks: dict, items, version: int = 1, **options) -> int:
+    """Write items to several outputs at once, parsing each class once.
+
+    sinks maps an emitter (an Emitter instance or a name in EMITTERS) to
+    a writable text stream; each stream gets a complete document, class
+    by class. options are export()'s. Returns the number of classes.
+
+        with open("out.xml", "w") as xml, open("out.jsonl", "w") as ast:
+            export_to({"xml": xml, "json": ast}, [Path("cls")])
+    """
+    sinks = [(EMITTERS[emitter]() if isinstance(emitter, str) else emitter, out)
+             for emitter, out in sinks.items()]
+    if options.get("canonical"):
+        version = None
+    extra = tuple(emitter for emitter, _ in sinks if emitter.name != "xml")
+    for emitter, out in sinks:
+        out.write(emitter.header(version))
+    count = 0
+    for entry in iter_exported(items, emitters=extra, **options):
+        for emitter, out in sinks:
+            out.write(entry["xml"] if emitter.name == "xml" else entry["outputs"][emitter.name])
+            out.write(emitter.separator)
+        count += 1
+    for emitter, out in sinks:
+        out.write(emitter.footer())
+    return count
+
+
+def export_document(items, version: int = 1, **options) -> Iterator[str]:
+    """Yield a complete export file in pieces: header, fragments, footer.
+
+    "".join() of the result is the same document the command line writes;
+    options are passed to export(). With canonical=True the header has no
+    version, so the same sources always give the same bytes.
+    """
+    yield export_header(None if options.get("canonical") else version)
+    for fragment in export(items, **options):
+        yield fragment
+        yield "\n\n"
+    yield "</Export>"
@@ -0,0 +1,247 @@
+"""
+Convert, index, look up and diff IRIS lookup-table exports offline.
+
+Usage:
+    python lookup-tables.py FILE --to xml|csv|ndjson [--out FILE|-] [--table NAME]
+    python lookup-tables.py FILE --index [--out INDEX] [--table NAME]
+    python lookup-tables.py FILE|INDEX --tables
+    python lookup-tables.py FILE|INDEX --get KEY [--table NAME]
+    python lookup-tables.py OLD NEW --diff [--out CHANGES.xml]
+
+FILE is an Ens.Util.LookupTable XML export (CodeManager.ExportLookupTables
+writes AllLookups.xml and one T.lut.xml per table), a CSV file with
+table,key,value columns or NDJSON with {"table", "key", "value"} per
+line, optionally .gz or .zst compressed. --table names the table of
+entries that carry none (a CSV without a table column, ReadLookupTable's
+{key, value} objects).
+
+--to converts FILE one entry at a time, so memory stays flat whatever
+the table size; XML output is a <lookupTable> file for
+CodeManager.ImportLookupTable. The output defaults to FILE with the new
+extension.
+
+--index writes a sorted, memory-mapped key index (FILE.lutidx by
+default). --get and --tables read one, building or refreshing the
+FILE.lutidx next to a source file first when it is missing or older; a
+lookup is a binary search in the mapped file.
+
+--diff compares two versions of the tables (files or indexes) in one
+sorted walk and writes only the added and changed entries as a compact
+import file (NEW-changes.xml by default). %Import cannot delete, so
+removed entries are listed in CHANGES.deleted.ndjson for deleting with
+SQL. The exit status is 1 when the two differ, as with diff.
+
+The work is done by lookup_tables.py next to this script.
+"""
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+from lookup_tables import (
+    FORMATS, INDEX_MAGIC, LookupIndex, build_index, diff_indexes, entry_format, iter_entries,
+    open_output, write_entries,
+)
+
+INDEX_SUFFIX = ".lutidx"
+
+
+def base_name(path: Path) -> str:
+    """path's name without its format and compression extensions."""
+    name = path.name
+    for suffix in reversed(path.suffixes):
+        if suffix.lower() in (".gz", ".zst", ".xml", ".csv", ".ndjson", ".jsonl", ".json",
+                              ".lut", INDEX_SUFFIX):
+            name = name[:-len(suffix)]
+        else:
+            break
+    return name or path.name
+
+
+def temp_path(path: Path) -> Path:
+    """Where to write path before renaming it into place; the name keeps
+    its extensions, which open_output() picks the compression from."""
+    return path.with_name(f"tmp-{os.getpid()}-{path.name}")
+
+
+def is_index(path: Path) -> bool:
+    with open(path, "rb") as f:
+        return f.read(len(INDEX_MAGIC)) == INDEX_MAGIC
+
+
+def index_for(path: Path, table=None) -> Path:
+    """path if it is an index, else its FILE.lutidx, (re)built if stale."""
+    if is_index(path):
+        return path
+    index = path.with_name(path.name + INDEX_SUFFIX)
+    if not index.exists() or index.stat().st_mtime < path.stat().st_mtime:
+        start = time.perf_counter()
+        count = build_index(iter_entries(path, table), index)
+        print(f"Indexed:   {path.name} -> {index.name}, {count} entries "
+              f"in {time.perf_counter() - start:.2f} s", file=sys.stderr)
+    return index
+
+
+def convert(args) -> None:
+    source = args.files[0]
+    if args.out is None:
+        args.out = source.with_name(f"{base_name(source)}.{args.to}")
+    if str(args.out) != "-" and entry_format(args.out) != args.to:
+        raise SystemExit(f"ERROR: {args.out.name} does not end in .{args.to}")
+    if str(args.out) != "-" and args.out.resolve() == source.resolve():
+        raise SystemExit(f"ERROR: {source.name} is already {args.to}")
+    start = time.perf_counter()
+    if str(args.out) == "-":
+        count = write_entries(sys.stdout, args.to, iter_entries(source, args.table))
+    else:
+        tmp = temp_path(args.out)
+        try:
+            with open_output(tmp) as out:
+                count = write_entries(out, args.to, iter_entries(source, args.table))
+            tmp.replace(args.out)
+        finally:
+            tmp.unlink(missing_ok=True)
+    elapsed = time.perf_counter() - start
+    print(f"Converted: {count} entries, {source.name} -> {args.out} in {elapsed:.2f} s"
+          + (f" ({count / elapsed:,.0f}/s)" if elapsed and count else ""), file=sys.stderr)
+
+
+def index(args) -> None:
+    source = args.files[0]
+    target = args.out or source.with_name(source.name + INDEX_SUFFIX)
+    start = time.perf_counter()
+    count = build_index(iter_entries(source, args.table), target)
+    elapsed = time.perf_counter() - start
+    print(f"Indexed:   {count} entries, {source.name} -> {target} in {elapsed:.2f} s")
+    with LookupIndex(target) as built:
+        print(f"Tables:    {sum(1 for _ in built.tables())}, {target.stat().st_size} bytes")
+
+
+def tables(args) -> None:
+    with LookupIndex(index_for(args.files[0], args.table)) as found:
+        for name, count in found.tables():
+            print(f"  {name}: {count} entries")
+        print(f"Total:     {len(found)} entries")
+
+
+def get(args) -> bool:
+    with LookupIndex(index_for(args.files[0], args.table)) as found:
+        table = args.table
+        if table is None:
+            names = [name for name, _ in found.tables()]
+            if len(names) != 1:
+                raise SystemExit(f"ERROR: {len(names)} tables in {args.files[0].name}; "
+                                 f"pass --table (see --tables)")
+            table = names[0]
+        start = time.perf_counter()
+        value = found.get(table, args.get)
+        elapsed = time.perf_counter() - start
+    if value is None:
+        print(f"{table}: {args.get}: not found ({elapsed * 1e6:.0f} µs)")
+        return False
+    print(value)
+    print(f"({table}, {elapsed * 1e6:.0f} µs)", file=sys.stderr)
+    return True
+
+
+def diff(args) -> bool:
+    if len(args.files) != 2:
+        raise SystemExit("ERROR: --diff needs two files: OLD NEW")
+    old_file, new_file = args.files
+    out = args.out or new_file.with_name(f"{base_name(new_file)}-changes.xml")
+    deleted_file = out.with_name(f"{base_name(out)}.deleted.ndjson")
+    counts = {"added": 0, "changed": 0, "deleted": 0}
+    per_table = {}
+    start = time.perf_counter()
+    with LookupIndex(index_for(old_file, args.table)) as old, \
+            LookupIndex(index_for(new_file, args.table)) as new:
+        tmp = temp_path(out)
+        tmp_deleted = temp_path(deleted_file)
+        try:
+            with open_output(tmp) as changes, open_output(tmp_deleted) as removed:
+                def upserts():
+                    for change, table, key, before, after in diff_indexes(old, new):
+                        counts[change] += 1
+                        per_table.setdefault(table, {"added": 0, "changed": 0, "deleted": 0})
+                        per_table[table][change] += 1
+                        if change == "deleted":
+                            write_entries(removed, "ndjson", [(table, key, before)])
+                        else:
+                            yield table, key, after
+
+                write_entries(changes, "xml", upserts())
+            tmp.replace(out)
+            if counts["deleted"]:
+                tmp_deleted.replace(deleted_file)
+        finally:
+            tmp.unlink(missing_ok=True)
+            tmp_deleted.unlink(missing_ok=True)
+        sizes = (len(old), len(new))
+    elapsed = time.perf_counter() - start
+
+    print(f"Compared:  {old_file.name} ({sizes[0]} entries) -> {new_file.name} "
+          f"({sizes[1]} entries) in {elapsed:.2f} s")
+    for table, table_counts in sorted(per_table.items())[:20]:
+        print(f"  {table}: " + ", ".join(f"{n} {change}" for change, n in table_counts.items() if n))
+    if len(per_table) > 20:
+        print(f"  ... and {len(per_table) - 20} more table(s)")
+    print(f"Changes:   {counts['added']} added, {counts['changed']} changed, "
+          f"{counts['deleted']} deleted")
+    print(f"Import:    {out} ({counts['added'] + counts['changed']} entries)")
+    print(f'           do ##class(AIAgent.Engine.CodeManager).ImportLookupTable("{out}")')
+    if counts["deleted"]:
+        print(f"Deleted:   {deleted_file} — %Import cannot remove entries; delete them with")
+        print(f"           DELETE FROM Ens_Util.LookupTable WHERE TableName = ? AND KeyName = ?")
+    return not any(counts.values())
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Convert, index, look up and diff IRIS lookup-table exports.")
+    parser.add_argument("files", nargs="+", type=Path, metavar="FILE",
+                        help="lookup-table XML, CSV or NDJSON file (or index)")
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--to", choices=FORMATS, metavar="FORMAT",
+                      help="convert FILE to FORMAT (xml, csv, ndjson)")
+    mode.add_argument("--index", action="store_true",
+                      help="write a sorted memory-mapped key index of FILE")
+    mode.add_argument("--tables", action="store_true",
+                      help="list the tables and their entry counts")
+    mode.add_argument("--get", metavar="KEY",
+                      help="print the value of KEY (in --table)")
+    mode.add_argument("--diff", action="store_true",
+                      help="write the entries NEW adds or changes over OLD as an import file")
+    parser.add_argument("--table", metavar="NAME",
+                        help="table of entries that name none; the table --get searches")
+    parser.add_argument("--out", type=Path, metavar="PATH",
+                        help="output file (- for stdout with --to)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.diff and len(args.files) != 1:
+        raise SystemExit("ERROR: expected one FILE")
+    for path in args.files:
+        if not path.is_file():
+            raise SystemExit(f"ERROR: {path} does not exist")
+    try:
+        if args.to is not None:
+            convert(args)
+        elif args.index:
+            index(args)
+        elif args.tables:
+            tables(args)
+        elif args.get is not None:
+            if not get(args):
+                raise SystemExit(1)
+        elif not diff(args):
+            raise SystemExit(1)
+    except ValueError as e:
+        raise SystemExit(f"ERROR: {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,404 @@
+"""
+Streaming conversion of IRIS lookup tables and a memory-mapped key index.
+
+Ens.Util.LookupTable.%Export (what CodeManager.ExportLookupTables and the
+installer call) writes
+
+    <?xml version="1.0" encoding="UTF-8"?>
+    <lookupTable>
+    <entry table="HL7.SendingFacility" key="ADT01">St Elsewhere</entry>
+    ...
+    </lookupTable>
+
+and %Import (CodeManager.ImportLookupTable) inserts or updates every entry
+of such a file, leaving the table's other entries alone. Code-mapping
+tables with hundreds of thousands of entries are too big for the
+%DynamicArray round trip of ReadLookupTable/WriteLookupTable, so this
+module works on the files instead, one entry at a time:
+
+    for table, key, value in iter_entries(Path("AllLookups.xml")):
+        ...
+    with open_output(Path("AllLookups.csv")) as out:
+        write_entries(out, "csv", iter_entries(Path("AllLookups.xml")))
+    build_index(iter_entries(Path("AllLookups.xml")), Path("AllLookups.lutidx"))
+    with LookupIndex(Path("AllLookups.lutidx")) as index:
+        index.get("HL7.SendingFacility", "ADT01")
+        for change, table, key, old, new in diff_indexes(old_index, index): ...
+
+Entries are (table, key, value) strings. XML, CSV (table,key,value
+columns; TableName/KeyName/DataValue also work) and NDJSON ({"table",
+"key", "value"}, the {key, value} objects ReadLookupTable returns with a
+default table) are read and written as streams, gzip or zstd compressed
+when the file name ends in .gz or .zst. Exports wrapped in
+<Export><Document name="T.LUT"> are read too.
+
+The index is one file: a header, the entries sorted by table and key as
+length-prefixed UTF-8 records, and an array of record offsets. It is
+built with an external merge sort (sorted runs of a bounded number of
+entries in temporary files, then one heap merge), so memory stays flat
+for any table size; a later duplicate of a table and key replaces the
+earlier one, as %Import would. Lookups binary-search the offsets in the
+mapped file without loading it, and two indexes are diffed in one
+sorted walk.
+"""
+
+import heapq
+import io
+import json
+import mmap
+import os
+import struct
+from bisect import bisect_left
+from collections.abc import Iterator, Sequence
+from pathlib import Path
+
+from iris_export import COMPRESSION_SUFFIXES, escape_xml, open_compressed, open_export
+
+FORMATS = ("xml", "csv", "ndjson")
+FORMAT_SUFFIXES = {".xml": "xml", ".csv": "csv", ".ndjson": "ndjson", ".jsonl": "ndjson",
+                   ".json": "ndjson"}
+
+# Column or field names accepted for each part of an entry
+TABLE_FIELDS = ("table", "TableName", "tableName")
+KEY_FIELDS = ("key", "KeyName", "keyName")
+VALUE_FIELDS = ("value", "DataValue", "dataValue")
+
+INDEX_MAGIC = b"IRISLUT1"
+INDEX_HEADER = struct.Struct("<8sQQ")       # magic, entry count, offset array position
+RECORD_HEADER = struct.Struct("<HHI")       # table, key and value lengths in bytes
+OFFSET = struct.Struct("<Q")
+RUN_ENTRIES = 200_000                       # entries per sorted run while building
+
+
+def entry_format(path: Path) -> str:
+    """xml, csv or ndjson, from a file name (compression suffix ignored)."""
+    suffixes = [suffix.lower() for suffix in path.suffixes]
+    if suffixes and suffixes[-1] in COMPRESSION_SUFFIXES.values():
+        suffixes.pop()
+    if suffixes and suffixes[-1] in FORMAT_SUFFIXES:
+        return FORMAT_SUFFIXES[suffixes[-1]]
+    raise ValueError(f"{path.name}: cannot tell the format from the name "
+                     f"(expected .xml, .csv, .ndjson or .jsonl)")
+
+
+def open_output(path: Path):
+    """Open path for writing text, compressed if it ends in .gz or .zst."""
+    for method, suffix in COMPRESSION_SUFFIXES.items():
+        if path.name.lower().endswith(suffix):
+            return open_compressed(path, method, newline="")
+    return open(path, "w", encoding="utf-8", newline="")
+
+
+def first_field(record: dict, names: tuple, default=None):
+    for name in names:
+        if name in record:
+            return record[name]
+    return default
+
+
+def iter_xml_entries(path: Path, table=None) -> Iterator[tuple]:
+    """Entries of a lookup-table XML export, each cleared from the tree as
+    soon as it is read. An entry without a table attribute belongs to its
+    <Document name="T.LUT">, else to table."""
+    from xml.etree import ElementTree as ET
+
+    document = None
+    stack = []
+    with open_export(path) as f:
+        for event, elem in ET.iterparse(f, events=("start", "end")):
+            if event == "start":
+                stack.append(elem)
+                if elem.tag == "Document":
+                    name = elem.get("name", "")
+                    document = name[:-4] if name.upper().endswith(".LUT") else name
+                continue
+            stack.pop()
+            if elem.tag == "entry":
+                owner = elem.get("table") or document or table
+                if not owner:
+                    raise ValueError(f"{path.name}: entry {elem.get('key')!r} has no table; "
+                                     f"pass a table name")
+                yield owner, elem.get("key", ""), elem.text or ""
+                if stack:
+                    stack[-1].clear()
+            elif elem.tag == "Document":
+                document = None
+
+
+def iter_csv_entries(path: Path, table=None) -> Iterator[tuple]:
+    """Entries of a CSV file with a header row; without a table column
+    every row belongs to table."""
+    import csv
+
+    with io.TextIOWrapper(open_export(path), encoding="utf-8-sig", newline="") as f:
+        for line, row in enumerate(csv.DictReader(f), 2):
+            owner = first_field(row, TABLE_FIELDS, table)
+            key = first_field(row, KEY_FIELDS)
+            if not owner or key is None:
+                raise ValueError(f"{path.name}:{line}: expected table, key and value columns")
+            yield owner, key, first_field(row, VALUE_FIELDS) or ""
+
+
+def iter_ndjson_entries(path: Path, table=None) -> Iterator[tuple]:
+    """Entries of a file with one JSON object per line."""
+    with io.TextIOWrapper(open_export(path), encoding="utf-8-sig") as f:
+        for line, text in enumerate(f, 1):
+            if not text.strip():
+                continue
+            try:
+                record = json.loads(text)
+            except ValueError as e:
+                raise ValueError(f"{path.name}:{line}: {e}") from None
+            owner = first_field(record, TABLE_FIELDS, table) if isinstance(record, dict) else None
+            key = first_field(record, KEY_FIELDS) if isinstance(record, dict) else None
+            if not owner or key is None:
+                raise ValueError(f"{path.name}:{line}: expected an object with table, key and value")
+            value = first_field(record, VALUE_FIELDS)
+            yield str(owner), str(key), "" if value is None else str(value)
+
+
+def iter_entries(path: Path, table=None) -> Iterator[tuple]:
+    """(table, key, value) for every entry of an XML, CSV or NDJSON file."""
+    readers = {"xml": iter_xml_entries, "csv": iter_csv_entries, "ndjson": iter_ndjson_entries}
+    return readers[entry_format(path)](path, table)
+
+
+def escape_attribute(text: str) -> str:
+    """escape_xml() plus the whitespace an attribute value would lose."""
+    return escape_xml(text).replace("\n", "&#10;").replace("\r", "&#13;").replace("\t", "&#9;")
+
+
+def write_entries(out, fmt: str, entries) -> int:
+    """Stream entries to a text file in fmt; returns how many were written.
+    XML output is a lookupTable document %Import accepts."""
+    count = 0
+    if fmt == "xml":
+        out.write('<?xml version="1.0" encoding="UTF-8"?>\n<lookupTable>\n')
+        for table, key, value in entries:
+            out.write(f'<entry table="{escape_attribute(table)}" key="{escape_attribute(key)}">'
+                      f'{escape_xml(value)}</entry>\n')
+            count += 1
+        out.write("</lookupTable>\n")
+    elif fmt == "csv":
+        import csv
+
+        writer = csv.writer(out, lineterminator="\n")
+        writer.writerow(("table", "key", "value"))
+        for entry in entries:
+            writer.writerow(entry)
+            count += 1
+    elif fmt == "ndjson":
+        for table, key, value in entries:
+            out.write(json.dumps({"table": table, "key": key, "value": value},
+                                 ensure_ascii=False) + "\n")
+            count += 1
+    else:
+        raise ValueError(f"unknown format {fmt!r} (expected one of {', '.join(FORMATS)})")
+    return count
+
+
+# Sorted index
+
+def pack_entry(table: bytes, key: bytes, value: bytes) -> bytes:
+    if len(table) > 0xFFFF or len(key) > 0xFFFF:
+        raise ValueError(f"table or key longer than 65535 bytes: {key[:40]!r}...")
+    return RECORD_HEADER.pack(len(table), len(key), len(value)) + table + key + value
+
+
+def iter_run(path: Path) -> Iterator[tuple]:
+    """(table, key, value) bytes of a run file written by build_index()."""
+    with open(path, "rb") as f:
+        while True:
+            header = f.read(RECORD_HEADER.size)
+            if not header:
+                return
+            table_size, key_size, value_size = RECORD_HEADER.unpack(header)
+            data = f.read(table_size + key_size + value_size)
+            yield data[:table_size], data[table_size:table_size + key_size], data[table_size + key_size:]
+
+
+def write_run(directory: Path, number: int, pending: dict) -> Path:
+    path = directory / f"run{number:05}"
+    with open(path, "wb") as f:
+        for (table, key), value in sorted(pending.items()):
+            f.write(pack_entry(table, key, value))
+    return path
+
+
+def build_index(entries, path: Path, run_entries: int = RUN_ENTRIES) -> int:
+    """Write the sorted key index of entries to path; returns its entry
+    count. At most run_entries entries are held in memory at once."""
+    import tempfile
+    from array import array
+
+    path = Path(path)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with tempfile.TemporaryDirectory(prefix="lutidx-", dir=path.parent) as work:
+        work = Path(work)
+        runs = []
+        pending = {}
+        for table, key, value in entries:
+            # A later duplicate wins within a run; across runs, merge()
+            # yields equal keys in run order and the last one is kept
+            pending[table.encode("utf-8"), key.encode("utf-8")] = value.encode("utf-8")
+            if len(pending) >= run_entries:
+                runs.append(write_run(work, len(runs), pending))
+                pending = {}
+        if pending or not runs:
+            runs.append(write_run(work, len(runs), pending))
+        del pending
+
+        count = 0
+        offsets = array("Q")
+        with open(tmp, "wb") as out, open(work / "offsets", "w+b") as spill:
+            out.write(INDEX_HEADER.pack(INDEX_MAGIC, 0, 0))
+            merged = heapq.merge(*(iter_run(run) for run in runs), key=lambda entry: entry[:2])
+            for table, key, value in last_of_each(merged):
+                offsets.append(out.tell())
+                out.write(pack_entry(table, key, value))
+                count += 1
+                if len(offsets) >= 65536:
+                    spill.write(pack_offsets(offsets))
+                    offsets = array("Q")
+            spill.write(pack_offsets(offsets))
+            position = out.tell()
+            spill.seek(0)
+            while True:
+                block = spill.read(1 << 20)
+                if not block:
+                    break
+                out.write(block)
+            out.seek(0)
+            out.write(INDEX_HEADER.pack(INDEX_MAGIC, count, position))
+    os.replace(tmp, path)
+    return count
+
+
+def last_of_each(entries) -> Iterator[tuple]:
+    """Sorted entries with only the last of each run of equal keys."""
+    held = None
+    for entry in entries:
+        if held is not None and held[:2] != entry[:2]:
+            yield held
+        held = entry
+    if held is not None:
+        yield held
+
+
+def pack_offsets(offsets) -> bytes:
+    import sys
+
+    if sys.byteorder == "big":
+        offsets.byteswap()
+    return offsets.tobytes()
+
+
+class LookupIndex(Sequence):
+    """A built index, memory-mapped: index[i] is the i-th (table, key,
+    value) in table and key order, get() finds one key in O(log n)."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.file = open(self.path, "rb")
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, self.count, self.offsets_at = INDEX_HEADER.unpack_from(self.map, 0)
+        except (ValueError, OSError, struct.error):
+            self.file.close()
+            raise ValueError(f"{self.path.name}: not a lookup-table index") from None
+        if magic != INDEX_MAGIC:
+            self.close()
+            raise ValueError(f"{self.path.name}: not a lookup-table index")
+
+    def close(self) -> None:
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def raw(self, i: int) -> tuple:
+        """Entry i as (table, key, value) UTF-8 bytes."""
+        offset = OFFSET.unpack_from(self.map, self.offsets_at + i * OFFSET.size)[0]
+        table_size, key_size, value_size = RECORD_HEADER.unpack_from(self.map, offset)
+        start = offset + RECORD_HEADER.size
+        middle = start + table_size
+        end = middle + key_size
+        return self.map[start:middle], self.map[middle:end], self.map[end:end + value_size]
+
+    def sort_key(self, i: int) -> tuple:
+        return self.raw(i)[:2]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self.count))]
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        return tuple(part.decode("utf-8") for part in self.raw(i))
+
+    def __iter__(self) -> Iterator[tuple]:
+        for i in range(self.count):
+            yield tuple(part.decode("utf-8") for part in self.raw(i))
+
+    def position(self, table: str, key: str = "") -> int:
+        """Where (table, key) is or would be inserted."""
+        return bisect_left(range(self.count), (table.encode("utf-8"), key.encode("utf-8")),
+                           key=self.sort_key)
+
+    def get(self, table: str, key: str, default=None):
+        """The value of key in table, or default."""
+        i = self.position(table, key)
+        if i < self.count and self.sort_key(i) == (table.encode("utf-8"), key.encode("utf-8")):
+            return self.raw(i)[2].decode("utf-8")
+        return default
+
+    def table(self, table: str) -> Iterator[tuple]:
+        """(key, value) of every entry of one table, in key order."""
+        name = table.encode("utf-8")
+        for i in range(self.position(table), self.count):
+            owner, key, value = self.raw(i)
+            if owner != name:
+                return
+            yield key.decode("utf-8"), value.decode("utf-8")
+
+    def tables(self) -> Iterator[tuple]:
+        """(table, entry count) of every table, skipping from one table to
+        the next by binary search."""
+        i = 0
+        while i < self.count:
+            name = self.raw(i)[0]
+            following = bisect_left(range(i, self.count), (name + b"\x00",), key=self.sort_key) + i
+            yield name.decode("utf-8"), following - i
+            i = following
+
+
+def diff_indexes(old: LookupIndex, new: LookupIndex) -> Iterator[tuple]:
+    """(change, table, key, old value, new value) for every entry that
+    differs between two indexes, in key order; change is "added",
+    "changed" or "deleted" (old or new value None where absent)."""
+    i = j = 0
+    while i < len(old) or j < len(new):
+        a = old.raw(i) if i < len(old) else None
+        b = new.raw(j) if j < len(new) else None
+        if b is None or (a is not None and a[:2] < b[:2]):
+            yield ("deleted", a[0].decode("utf-8"), a[1].decode("utf-8"),
+                   a[2].decode("utf-8"), None)
+            i += 1
+        elif a is None or b[:2] < a[:2]:
+            yield ("added", b[0].decode("utf-8"), b[1].decode("utf-8"),
+                   None, b[2].decode("utf-8"))
+            j += 1
+        else:
+            if a[2] != b[2]:
+                yield ("changed", b[0].decode("utf-8"), b[1].decode("utf-8"),
+                       a[2].decode("utf-8"), b[2].decode("utf-8"))
+            i += 1
+            j += 1
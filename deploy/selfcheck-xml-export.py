@@ -0,0 +1,206 @@
+"""
+Self-check for generate-xml-export.py and iris_export.py against the
+classes under cls/, for running after a change to either.
+
+The lexer checks (braces hidden in strings, comments and &sql/&js
+embeds, the ]]> and type-parameter validators, and a reverse round-trip
+of every class) run twice: with the atomic-group token patterns, and
+with the fallback compile_tokens() builds on Python before 3.11, which
+is forced here by loading a second copy of iris_export.py whose
+re.compile rejects (?> and *+.
+
+Each check prints OK or FAIL with the reason; the exit status is 1 if
+any failed.
+
+Usage:
+    python selfcheck-xml-export.py [--keep]
+"""
+
+import argparse
+import importlib.util
+import io
+import json
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+CLS_DIR = SCRIPT_DIR.parent / "cls"
+GENERATOR = SCRIPT_DIR / "generate-xml-export.py"
+LIBRARY = SCRIPT_DIR / "iris_export.py"
+
+LOOKUP_RECORD = {
+    "className": "AIAgent.Lookup.Codes", "classType": "LookupTable",
+    "source": '<lookupTable><entry table="Codes" key="A">1</entry></lookupTable>',
+}
+
+# Block bodies whose closing brace is the last } in the text; every other
+# brace is hidden from the lexer. (token pattern, body)
+BRACE_CASES = [
+    ("OBJECTSCRIPT_TOKENS", ' set x = "{" quit x\n}'),
+    ("OBJECTSCRIPT_TOKENS", ' set x = "a""{""b"\n}'),
+    ("OBJECTSCRIPT_TOKENS", ' ; comment {\n #; comment {\n quit\n}'),
+    ("OBJECTSCRIPT_TOKENS", ' // comment {\n set x = 4/2 /* { */\n}'),
+    ("OBJECTSCRIPT_TOKENS", ' if x { set y = "}" } else { set y = "{" }\n}'),
+    ("OBJECTSCRIPT_TOKENS", " &sql(SELECT '{', \"}\" -- {\n INTO :x FROM t WHERE (a = '('))\n}"),
+    ("OBJECTSCRIPT_TOKENS", ' &js<function f() { return "}"; }>\n &html<<b>{</b>>\n}'),
+    ("OBJECTSCRIPT_TOKENS", ' set x = a&b  if x { }\n}'),
+    ("JS_TOKENS", " var s = \"}\", t = '{', u = `${a}}`; // {\n var r = /[{]}/; /* } */\n}"),
+    ("PYTHON_TOKENS", ' s = "{"  # {\n t = """\n}\n"""\n u = \'}\'\n}'),
+]
+
+VALIDATOR_CLASS = """Class Selfcheck.Validators
+{
+
+Property Code As %String(DISPLAYLIST = ",<a>,b");
+
+ClassMethod Cdata()
+{
+    write "]]>"
+}
+
+}
+"""
+VALIDATOR_CODES = {"unescaped-type-param", "cdata-end"}
+
+
+def load_fallback_library():
+    """A second copy of iris_export whose token patterns were compiled
+    the way Python before 3.11 compiles them."""
+    compile_regex = re.compile
+
+    def compile_without_atomic(pattern, flags=0):
+        if isinstance(pattern, str) and ("(?>" in pattern or "*+" in pattern):
+            raise re.error("atomic groups and possessive quantifiers need Python 3.11")
+        return compile_regex(pattern, flags)
+
+    spec = importlib.util.spec_from_file_location("iris_export_fallback", LIBRARY)
+    library = importlib.util.module_from_spec(spec)
+    re.compile = compile_without_atomic
+    try:
+        spec.loader.exec_module(library)
+    finally:
+        re.compile = compile_regex
+    return library
+
+
+def check_braces(library) -> list:
+    """scan_block() finds the real closing brace of every BRACE_CASES body."""
+    problems = []
+    for tokens, body in BRACE_CASES:
+        source = body + "\nquit\n"
+        found = library.scan_block(source, 0, getattr(library, tokens))
+        if found != body.rindex("}"):
+            problems.append(f"{tokens}: {body!r}: closed at {found}, not {body.rindex('}')}")
+    return problems
+
+
+def check_validators(library) -> list:
+    """A ]]> in a body and a quote in a type parameter are reported."""
+    codes = {d.code for d in library.render_class_profiled("Selfcheck.Validators",
+                                                           VALIDATOR_CLASS)[2]}
+    return [f"{code} not reported" for code in sorted(VALIDATOR_CODES - codes)]
+
+
+def check_round_trip(library) -> list:
+    """Every class renders to the same XML after a trip through
+    iter_reverse() and back, without diagnostics."""
+    problems = []
+    for path in sorted(CLS_DIR.rglob("*.cls")):
+        name = ".".join(path.relative_to(CLS_DIR).with_suffix("").parts)
+        xml, _, diagnostics, _, _ = library.render_class_profiled(
+            name, path.read_text(encoding="utf-8"))
+        if diagnostics:
+            problems.append(f"{name}: {diagnostics[0]}")
+        document = library.export_header(None) + xml + "\n\n</Export>"
+        reversed_udl = [udl for _, _, udl in
+                        library.iter_reverse(io.BytesIO(document.encode("utf-8")))]
+        if len(reversed_udl) != 1 or reversed_udl[0] is None:
+            problems.append(f"{name}: reversed to {len(reversed_udl)} item(s)")
+        elif library.render_class_profiled(name, reversed_udl[0])[0] != xml:
+            problems.append(f"{name}: XML differs after the round-trip")
+    return problems
+
+
+def generation_records(cls_dir: Path) -> list:
+    """GenerationClass records, as GetByGeneration().ToJSON() shapes them,
+    for every class under cls_dir."""
+    records = []
+    for path in sorted(cls_dir.rglob("*.cls")):
+        name = ".".join(path.relative_to(cls_dir).with_suffix("").parts)
+        records.append({"className": name, "classType": "Class",
+                        "source": path.read_text(encoding="utf-8")})
+    return records
+
+
+def check_ndjson(work: Path) -> list:
+    """--ndjson exports every class record and skips a LookupTable record
+    with a warning, exiting 0."""
+    records = generation_records(CLS_DIR)
+    source = work / "generation.ndjson"
+    with open(source, "w", encoding="utf-8") as f:
+        for record in records[:1] + [LOOKUP_RECORD] + records[1:]:
+            f.write(json.dumps(record) + "\n")
+    result = subprocess.run(
+        [sys.executable, str(GENERATOR), "--ndjson", str(source), "--out", str(work / "ndjson.xml")],
+        capture_output=True, text=True, encoding="utf-8")
+    log = result.stderr
+    problems = []
+    if result.returncode != 0:
+        problems.append(f"exit status {result.returncode}")
+    if f"Classes:   {len(records)} exported, 1 non-class record(s) skipped, 0 record(s) failed" \
+            not in log:
+        problems.append("summary: " + next((line for line in log.splitlines()
+                                            if line.startswith("Classes:")), "missing"))
+    if "WARNING: LookupTable AIAgent.Lookup.Codes" not in log:
+        problems.append("no skipped warning for the LookupTable record")
+    return problems
+
+
+LEXER_CHECKS = [
+    ("braces in strings, comments and embeds", check_braces),
+    ("]]> and type-parameter validators", check_validators),
+    ("reverse round-trip of cls/", check_round_trip),
+]
+
+RUN_CHECKS = [
+    ("ndjson skips non-class records", check_ndjson),
+]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Self-check the XML export generator.")
+    parser.add_argument("--keep", action="store_true",
+                        help="keep the scratch directory and print where it is")
+    args = parser.parse_args(argv)
+
+    import iris_export
+
+    libraries = [("regex", iris_export), ("fallback", load_fallback_library())]
+    checks = [(f"{title} ({path})", check, library)
+              for path, library in libraries for title, check in LEXER_CHECKS]
+    work = Path(tempfile.mkdtemp(prefix="selfcheck-xml-export-"))
+    checks += [(title, check, work) for title, check in RUN_CHECKS]
+    failed = 0
+    try:
+        for title, check, context in checks:
+            problems = check(context)
+            print(f"  {title} ... {'FAIL' if problems else 'OK'}")
+            for problem in problems:
+                print(f"      {problem}")
+            failed += bool(problems)
+    finally:
+        if args.keep:
+            print(f"Scratch:   {work}")
+        else:
+            shutil.rmtree(work, ignore_errors=True)
+    print(f"Checks:    {len(checks) - failed} passed, {failed} failed")
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()